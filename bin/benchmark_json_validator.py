@@ -0,0 +1,100 @@
+"""benchmark_json_validator
+--------------------------
+
+Compares the throughput of GDCJSONValidator when a jsonschema
+validator is built for every document (the previous behavior) against
+reusing one validator per type.
+
+The submission is a mix of biospecimen and file documents, filled in
+with a value for each required property so that they mostly validate.
+
+"""
+
+import argparse
+import time
+
+from gdcdictionary import gdcdictionary
+
+from gdcdatamodel.validators import GDCJSONValidator
+from gdcdatamodel.validators.json_validators import Draft4Validator
+
+DEFAULT_TYPES = (
+    "case,sample,portion,analyte,aliquot,read_group,submitted_unaligned_reads"
+)
+
+
+class MockSubmissionEntity:
+    def __init__(self, doc):
+        self.doc = doc
+        self.errors = []
+
+    def record_error(self, message, **kwargs):
+        self.errors.append(dict(message=message, **kwargs))
+
+
+class UncachedJSONValidator(GDCJSONValidator):
+    def iter_errors(self, doc):
+        return Draft4Validator(self.schemas.schema[doc["type"]]).iter_errors(doc)
+
+
+def example_value(schema):
+    if "enum" in schema:
+        return schema["enum"][0]
+    _type = schema.get("type")
+    if isinstance(_type, list):
+        _type = _type[0]
+    return {
+        "integer": 1,
+        "number": 1.0,
+        "boolean": True,
+        "array": [],
+        "object": {},
+    }.get(_type, "value")
+
+
+def example_doc(_type, i):
+    schema = gdcdictionary.schema[_type]
+    links = {link.get("name") for link in schema.get("links", [])}
+    doc = {"type": _type}
+    for key in schema.get("required", []):
+        if key in links:
+            doc[key] = {"submitter_id": f"parent-{i}"}
+        else:
+            doc[key] = example_value(schema["properties"].get(key, {}))
+    doc["submitter_id"] = f"{_type}-{i}"
+    return doc
+
+
+def benchmark(validator, docs):
+    entities = [MockSubmissionEntity(doc) for doc in docs]
+    start = time.perf_counter()
+    validator.record_errors(entities)
+    return len(docs) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-n", "--count", type=int, default=20000, help="number of documents"
+    )
+    parser.add_argument(
+        "--types",
+        type=str,
+        default=DEFAULT_TYPES,
+        help="entity types in the submission (comma separated)",
+    )
+    args = parser.parse_args()
+
+    types = [t for t in args.types.split(",") if t in gdcdictionary.schema]
+    docs = [example_doc(types[i % len(types)], i) for i in range(args.count)]
+
+    before = benchmark(UncachedJSONValidator(), docs)
+    after = benchmark(GDCJSONValidator(prewarm=True), docs)
+
+    print(f"{len(docs)} documents of {', '.join(types)}")
+    print(f"validator per document : {before:10.0f} docs/s")
+    print(f"validator per type     : {after:10.0f} docs/s ({after / before:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""benchmark_union_subq_path
+--------------------------
+
+Compares union_subq_path when one subq_path is UNIONed per path (the
+previous behavior) against the planned query, which prunes paths
+covered by the related case cache and merges common prefixes.
+
+The sample graph of the test suite is loaded into the ``basic``
+namespace of the given database, each pair of labels is queried both
+ways and the results are checked to be identical.
+
+"""
+
+import argparse
+import getpass
+import os
+import time
+
+import yaml
+from psqlgraph import PsqlGraphDriver, create_all, ext, mocks
+
+from gdcdatamodel import models, query
+
+TEST_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test")
+
+DEFAULT_PAIRS = "portion:case,portion:project,portion:program,sample:program"
+
+
+class Dictionary:
+    def __init__(self, path):
+        with open(path) as f:
+            self.schema = yaml.safe_load(f)
+
+
+def load_sample_graph(g, dictionary, path):
+    with open(path) as f:
+        graph = yaml.safe_load(f)
+
+    factory = mocks.GraphFactory(models.get_package("basic"), dictionary)
+    nodes = factory.create_from_nodes_and_edges(
+        nodes=graph["nodes"],
+        edges=graph["edges"],
+        unique_key="node_id",
+        all_props=True,
+    )
+    with g.session_scope() as s:
+        for node in nodes:
+            s.merge(node)
+    return nodes
+
+
+def benchmark(g, src_cls, dst_label, repeat, plan):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        with g.session_scope():
+            ids = {
+                node.node_id
+                for node in query.union_subq_path(
+                    g.nodes(src_cls), dst_label, package_namespace="basic", plan=plan
+                )
+            }
+    return ids, (time.perf_counter() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-H", "--host", type=str, action="store", required=True, help="psql-server host"
+    )
+    parser.add_argument(
+        "-U", "--user", type=str, action="store", required=True, help="psql test user"
+    )
+    parser.add_argument(
+        "-D",
+        "--database",
+        type=str,
+        action="store",
+        required=True,
+        help="psql test database",
+    )
+    parser.add_argument(
+        "-P", "--password", type=str, action="store", help="psql test password"
+    )
+    parser.add_argument(
+        "--pairs",
+        type=str,
+        default=DEFAULT_PAIRS,
+        help="src:dst label pairs to query (comma separated)",
+    )
+    parser.add_argument(
+        "-n", "--repeat", type=int, default=100, help="queries per pair and mode"
+    )
+    args = parser.parse_args()
+
+    dictionary = Dictionary(os.path.join(TEST_DIR, "schema", "basic.yaml"))
+    models.load_dictionary(dictionary, "basic")
+    node_cls = ext.get_abstract_node("basic")
+
+    password = args.password or getpass.getpass(f"Password for {args.user}:")
+    g = PsqlGraphDriver(
+        args.host, args.user, password, args.database, package_namespace="basic"
+    )
+    create_all(g.engine, ext.get_orm_base("basic"))
+    nodes = load_sample_graph(
+        g, dictionary, os.path.join(TEST_DIR, "schema", "data", "sample.yaml")
+    )
+
+    try:
+        for pair in args.pairs.split(","):
+            src_label, dst_label = pair.split(":")
+            src_cls = node_cls.get_subclass(src_label)
+            plan = query.plan_union_subq_path(src_cls, dst_label, 0, "basic")
+
+            before_ids, before = benchmark(g, src_cls, dst_label, args.repeat, False)
+            after_ids, after = benchmark(g, src_cls, dst_label, args.repeat, True)
+            assert before_ids == after_ids, f"{pair}: results differ"
+
+            print(
+                "{:24} paths: {:3} -> {:3}  cost: {:3} -> {:3}  "
+                "{:8.2f}ms -> {:8.2f}ms ({:.1f}x)".format(
+                    pair,
+                    len(query.get_traversals("basic")[src_label].get(dst_label, ())),
+                    len(plan.paths),
+                    plan.naive_cost,
+                    plan.cost,
+                    before * 1000,
+                    after * 1000,
+                    before / after,
+                )
+            )
+    finally:
+        with g.session_scope():
+            for node in nodes:
+                g.node_delete(node.node_id)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""process_related_case_queue
+--------------------------
+
+Refreshes the related case caches of the trees the edge hooks deferred
+to the ``related_cases_queue`` table, see
+:func:`gdcdatamodel.models.caching.process_related_cases_queue`.
+
+Each batch of queued nodes is refreshed in its own transaction.  Several
+workers can run at once, they skip the nodes locked by each other.
+Unless ``--follow`` is given, the worker exits once the queue is empty.
+
+"""
+
+import argparse
+import getpass
+import logging
+import time
+
+from psqlgraph import PsqlGraphDriver
+
+from gdcdatamodel import models  # noqa
+from gdcdatamodel.models import caching
+
+logging.basicConfig()
+logger = logging.getLogger("process_related_case_queue")
+logger.setLevel(logging.INFO)
+
+
+def process_queue(graph, batch_size, follow=False, interval=10):
+    """Refreshes queued trees until the queue is empty, or forever if
+    :param:`follow`
+
+    """
+
+    while True:
+        start = time.time()
+        with graph.session_scope() as session:
+            counts = caching.process_related_cases_queue(session, batch_size)
+
+        if counts["dequeued"]:
+            logger.info(
+                "%d queued: %d nodes, %d inserted, %d deleted (%.1fs)",
+                counts["dequeued"],
+                counts["nodes"],
+                counts["inserted"],
+                counts["deleted"],
+                time.time() - start,
+            )
+        elif follow:
+            time.sleep(interval)
+        else:
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-H", "--host", type=str, action="store", required=True, help="psql-server host"
+    )
+    parser.add_argument(
+        "-U", "--user", type=str, action="store", required=True, help="psql test user"
+    )
+    parser.add_argument(
+        "-D",
+        "--database",
+        type=str,
+        action="store",
+        required=True,
+        help="psql test database",
+    )
+    parser.add_argument(
+        "-P", "--password", type=str, action="store", help="psql test password"
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        action="store",
+        default=100,
+        help="Number of queued nodes refreshed per transaction.",
+    )
+    parser.add_argument(
+        "--follow",
+        action="store_true",
+        help="Keep polling the queue once it is empty.",
+    )
+    parser.add_argument(
+        "--interval",
+        type=float,
+        action="store",
+        default=10,
+        help="Seconds to wait between polls of an empty queue.",
+    )
+
+    args = parser.parse_args()
+    password = args.password or getpass.getpass(f"Password for {args.user}:")
+    graph = PsqlGraphDriver(
+        host=args.host, user=args.user, password=password, database=args.database
+    )
+
+    process_queue(graph, args.batch_size, args.follow, args.interval)
+
+
+if __name__ == "__main__":
+    main()
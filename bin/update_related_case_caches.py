@@ -4,62 +4,69 @@
 Will update the case tree for all non-legacy projects by caching the
 related cases on all nodes.
 
+Each project is reconciled on its own, in its own process and
+transaction, by :func:`gdcdatamodel.models.caching.reconcile_related_cases`:
+the related cases every node of the project should have, as the cache
+hooks would compute them, are derived inside Postgres from the lineage
+edge tables, missing shortcut edges are inserted and stale ones
+deleted.
+
+Unlike earlier versions of this script, which only added missing
+shortcut edges, stale edges (to cases a node is no longer derived
+from) are removed.  Run with `--dry-run` first to count them.
+
 """
 
 import argparse
 import getpass
 import logging
+import time
+from multiprocessing import Pool, cpu_count
 
 from psqlgraph import PsqlGraphDriver
 
 from gdcdatamodel import models as md
+from gdcdatamodel.models import caching
 
 logging.basicConfig()
 logger = logging.getLogger("update_related_cases_caches")
 logger.setLevel(logging.INFO)
 
 
-def recursive_update_related_case_caches(node, case, visited_ids=set()):
-    """Upserts the case shortcut edge on the source of all incoming edges
-    and recurses.
+def get_project_ids(graph):
+    """Returns the ids of all non-legacy projects"""
 
-    """
-
-    logger.info(
-        "{}: | case: {} | project: {}".format(
-            node, case, node._props.get("project_id", "?")
+    with graph.session_scope():
+        projects = graph.nodes(md.Project).not_props(state="legacy").all()
+        return sorted(
+            "{}-{}".format(project.programs[0].name, project.code)
+            for project in projects
         )
-    )
 
-    visited_ids.add(node.node_id)
 
-    for edge in node.edges_in:
-        if edge.src is None:
-            continue
+def update_project_related_case_cache(graph, project_id, dry_run=False):
+    """Updates the case cache of every node in the project, committed at
+    once
 
-        if edge.__class__.__name__.endswith("RelatesToCase"):
-            continue
+    :returns: {label: {"missing": count, "stale": count}}
 
-        if not hasattr(edge.src, "_related_cases"):
-            continue
+    """
 
-        original = set(edge.src._related_cases)
-        updated = original.union({case})
-        edge.src._related_cases = list(updated)
+    with graph.session_scope() as session:
+        return caching.reconcile_related_cases(
+            session, project_id=project_id, dry_run=dry_run
+        )
 
-        if edge.src_id not in visited_ids:
-            recursive_update_related_case_caches(edge.src, case)
 
+def update_project_job(job):
+    """Pool entry point, each process connects with its own driver"""
 
-def update_project_related_case_cache(project):
-    """Updates the case cache on the full tree under each case in the
-    project
+    graph_kwargs, project_id, dry_run = job
+    graph = PsqlGraphDriver(**graph_kwargs)
 
-    """
-
-    logger.info(f"Project: {project.code}")
-    for case in project.cases:
-        recursive_update_related_case_caches(case, case)
+    start = time.time()
+    diff = update_project_related_case_cache(graph, project_id, dry_run)
+    return project_id, diff, time.time() - start
 
 
 def main():
@@ -81,18 +88,47 @@ def main():
     parser.add_argument(
         "-P", "--password", type=str, action="store", help="psql test password"
     )
+    parser.add_argument(
+        "--projects",
+        type=str,
+        action="store",
+        help="Only update these project ids (comma separated).",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        action="store",
+        help="Number of projects to update in parallel, defaults to the cpu count.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only count the shortcut edges that are missing or stale.",
+    )
 
     args = parser.parse_args()
     prompt = f"Password for {args.user}:"
     password = args.password or getpass.getpass(prompt)
-    g = PsqlGraphDriver(args.host, args.user, password, args.database)
-
-    with g.session_scope():
-        projects = g.nodes(md.Project).not_props(state="legacy").all()
-        for p in projects:
-            update_project_related_case_cache(p)
+    graph_kwargs = dict(
+        host=args.host, user=args.user, password=password, database=args.database
+    )
 
-    print("Done.")
+    project_ids = [p for p in (args.projects or "").split(",") if p]
+    project_ids = project_ids or get_project_ids(PsqlGraphDriver(**graph_kwargs))
+
+    start = time.time()
+    jobs = [(graph_kwargs, project_id, args.dry_run) for project_id in project_ids]
+    with Pool(args.processes or cpu_count()) as pool:
+        for project_id, diff, elapsed in pool.imap_unordered(update_project_job, jobs):
+            missing = sum(counts["missing"] for counts in diff.values())
+            stale = sum(counts["stale"] for counts in diff.values())
+            print(
+                "{:20} {:8} missing {:8} stale {:8.1f}s".format(
+                    project_id, missing, stale, elapsed
+                )
+            )
+
+    print(f"Done: {len(project_ids)} projects in {time.time() - start:.1f}s")
 
 
 if __name__ == "__main__":
@@ -1,10 +1,8 @@
 import argparse
 import getpass
-
-from models import *  # noqa
-from models.versioned_nodes import VersionedNode  # noqa
-from psqlgraph import *  # noqa
-from sqlalchemy import *  # noqa
+import json
+import os
+import sys
 
 try:
     import IPython
@@ -16,7 +14,9 @@ except Exception as e:
             "{}, using standard interactive console. "
             "If you install IPython, then it will automatically "
             "be used for this repl."
-        ).format(e)
+        ).format(e),
+        # keeps stdout to the --profile-startup --json report
+        file=sys.stderr,
     )
     import code
 
@@ -36,7 +36,7 @@ NOTE:
 """
 
 
-if __name__ == "__main__":
+def get_parser():
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "-d",
@@ -62,8 +62,47 @@ if __name__ == "__main__":
         type=str,
         help="password for given user. If no " "password given, one will be prompted.",
     )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help="print where time is spent loading the dictionary and exit",
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="print the --profile-startup report as json",
+    )
+    parser.add_argument(
+        "--top",
+        default=20,
+        type=int,
+        help="how many of the slowest classes --profile-startup prints",
+    )
+    return parser
 
-    args = parser.parse_args()
+
+if __name__ == "__main__":
+    args = get_parser().parse_args()
+
+    # Must be set before the models are imported, which loads the dictionary
+    if args.profile_startup:
+        os.environ["PROFILE_GDC_DICTIONARY"] = "True"
+
+    import psqlgraph
+    from psqlgraph import *  # noqa
+    from sqlalchemy import *  # noqa
+
+    from gdcdatamodel.models import *  # noqa
+    from gdcdatamodel.models import profiling
+    from gdcdatamodel.models.versioned_nodes import VersionedNode  # noqa
+
+    if args.profile_startup:
+        report = profiling.profile.report()
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print(profiling.format_report(report, limit=args.top))
+        raise SystemExit(0)
 
     print(message.format(args.database, args.host, args.user))
     if args.password is None:
@@ -8,16 +8,21 @@ Module for stateful management of a GDC PostgreSQL installation.
 import argparse
 import logging
 import random
+import threading
 import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 
 import sqlalchemy as sa
 from psqlgraph import create_all, ext
-from psqlgraph.base import ORMBase
+from psqlgraph.base import ORMBase, VoidedBase
 from sqlalchemy import create_engine
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateIndex, CreateTable
 
 #: Required but 'unused' import to register GDC models
 from . import models  # noqa
+from .models.indexes import get_index_names
 
 logging.basicConfig()
 logger = logging.getLogger("gdc_postgres_admin")
@@ -51,6 +56,55 @@ REVOKE INSERT, UPDATE, DELETE ON TABLE {table} FROM {user};
 COMMIT;
 """
 
+#: Privileges granted or revoked on a batch of tables ({tables}) for
+#: a list of users ({users}), both comma separated
+GRANT_READ_PRIVS_BATCH_SQL = "GRANT SELECT ON TABLE {tables} TO {users};"
+
+GRANT_WRITE_PRIVS_BATCH_SQL = (
+    "GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE {tables} TO {users};"
+)
+
+REVOKE_READ_PRIVS_BATCH_SQL = (
+    "REVOKE SELECT, INSERT, UPDATE, DELETE ON TABLE {tables} FROM {users};"
+)
+
+REVOKE_WRITE_PRIVS_BATCH_SQL = (
+    "REVOKE INSERT, UPDATE, DELETE ON TABLE {tables} FROM {users};"
+)
+
+#: Number of tables named in a single GRANT or REVOKE
+PRIVS_BATCH_SIZE = 100
+
+SELECT_TABLES_SQL = """
+SELECT c.relname FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = current_schema() AND c.relkind IN ('r', 'p')
+"""
+
+SELECT_INDEXES_SQL = """
+SELECT c.relname, i.indisvalid FROM pg_index i
+JOIN pg_class c ON c.oid = i.indexrelid
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = current_schema()
+"""
+
+DROP_INDEX_SQL = "DROP INDEX CONCURRENTLY IF EXISTS {index}"
+
+SELECT_INDEX_PROGRESS_SQL = """
+SELECT p.index_relid::regclass::text AS relname, p.phase,
+       p.blocks_done, p.blocks_total, p.tuples_done, p.tuples_total
+FROM pg_stat_progress_create_index p
+JOIN pg_stat_activity a ON a.pid = p.pid
+WHERE a.application_name = :app_name
+"""
+
+#: A unit of graph-create on ``table``, its statements run in one
+#: transaction unless ``concurrently``, ``cleanup`` is run before it is
+#: retried
+DDLStep = namedtuple(
+    "DDLStep", ["name", "table", "statements", "concurrently", "cleanup"]
+)
+
 
 def execute(engine, sql, *args, **kwargs):
     statement = sa.sql.text(sql)
@@ -66,34 +120,121 @@ def get_engine(host, user, password, database):
     return create_engine(con_str, connect_args=connect_args)
 
 
+def get_graph_tables(namespace=None):
+    """Returns the names of all Node and Edge tables"""
+    node_cls = ext.get_abstract_node(namespace)
+    edge_cls = ext.get_abstract_edge(namespace)
+    return [
+        cls.__tablename__
+        for cls in node_cls.get_subclasses() + edge_cls.get_subclasses()
+    ]
+
+
 def execute_for_all_graph_tables(engine, sql, namespace=None, **kwargs):
     """Execute a SQL statment that has a python format variable {table}
     to be replaced with the tablename for all Node and Edge tables
 
+    Privileges are better applied in batches of tables with
+    :func:`apply_privileges_to_graph`.
+
     """
-    node_cls = ext.get_abstract_node(namespace)
-    edge_cls = ext.get_abstract_edge(namespace)
 
-    for cls in node_cls.get_subclasses() + edge_cls.get_subclasses():
-        _kwargs = dict(kwargs, **{"table": cls.__tablename__})
-        statement = sql.format(**_kwargs)
-        execute(engine, statement)
+    for table in get_graph_tables(namespace):
+        execute(engine, sql.format(**dict(kwargs, table=table)))
+
+
+def plan_privileges(privileges, tables, workers=1, batch_size=PRIVS_BATCH_SIZE):
+    """Returns the transactions, as lists of statements, that apply
+    :param:`privileges` to :param:`tables`.
+
+    Tables are split between at most :param:`workers` transactions so
+    that they can run concurrently without two of them updating the
+    ACL of the same table.  Each transaction grants or revokes, for
+    every batch of its tables, each privilege to all of its users.
+
+    :param privileges: list of (SQL template, list of users)
+
+    """
+
+    tables = sorted(tables)
+    size = max(1, -(-len(tables) // max(1, workers)))
+
+    plan = []
+    for i in range(0, len(tables), size):
+        partition = tables[i : i + size]
+        statements = [
+            sql.format(
+                tables=", ".join(partition[j : j + batch_size]),
+                users=", ".join(users),
+            )
+            for j in range(0, len(partition), batch_size)
+            for sql, users in privileges
+            if users
+        ]
+        if statements:
+            plan.append(statements)
+    return plan
+
+
+def execute_transaction(engine, statements):
+    with engine.begin() as connection:
+        for statement in statements:
+            execute(connection, statement)
+
+
+def execute_privilege_plan(engine, plan, workers=1, dry_run=False):
+    """Runs each transaction of :param:`plan` on its own connection, at
+    most :param:`workers` at a time.  With :param:`dry_run` the plan is
+    printed instead.
+
+    """
+
+    if dry_run:
+        for statements in plan:
+            print("\n".join(["BEGIN;"] + statements + ["COMMIT;"]))
+        return
+
+    logger.info(
+        "Running %d statements in %d transactions",
+        sum(len(statements) for statements in plan),
+        len(plan),
+    )
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(execute_transaction, engine, statements)
+            for statements in plan
+        ]
+        for future in futures:
+            future.result()
+
+
+def apply_privileges_to_graph(
+    engine, privileges, namespace=None, workers=1, dry_run=False
+):
+    plan = plan_privileges(privileges, get_graph_tables(namespace), workers)
+    execute_privilege_plan(engine, plan, workers, dry_run)
 
 
 def grant_read_permissions_to_graph(engine, user, namespace=None):
-    execute_for_all_graph_tables(engine, GRANT_READ_PRIVS_SQL, namespace, user=user)
+    apply_privileges_to_graph(engine, [(GRANT_READ_PRIVS_BATCH_SQL, [user])], namespace)
 
 
 def grant_write_permissions_to_graph(engine, user, namespace=None):
-    execute_for_all_graph_tables(engine, GRANT_WRITE_PRIVS_SQL, namespace, user=user)
+    apply_privileges_to_graph(
+        engine, [(GRANT_WRITE_PRIVS_BATCH_SQL, [user])], namespace
+    )
 
 
 def revoke_read_permissions_to_graph(engine, user, namespace=None):
-    execute_for_all_graph_tables(engine, REVOKE_READ_PRIVS_SQL, namespace, user=user)
+    apply_privileges_to_graph(
+        engine, [(REVOKE_READ_PRIVS_BATCH_SQL, [user])], namespace
+    )
 
 
 def revoke_write_permissions_to_graph(engine, user, namespace=None):
-    execute_for_all_graph_tables(engine, REVOKE_WRITE_PRIVS_SQL, namespace, user=user)
+    apply_privileges_to_graph(
+        engine, [(REVOKE_WRITE_PRIVS_BATCH_SQL, [user])], namespace
+    )
 
 
 def create_graph_tables(engine, timeout, namespace=None):
@@ -124,24 +265,322 @@ def create_tables(engine, delay, retries, namespace=None):
     """
 
     logger.info("Running table creator named %s", app_name)
+    return retry_on_lock_timeout(
+        lambda: create_graph_tables(engine, delay, namespace=namespace),
+        delay,
+        retries,
+    )
+
+
+def retry_on_lock_timeout(fn, delay, retries, on_retry=None):
+    """Calls :param:`fn` until it does not time out waiting for a lock,
+    waiting :param:`delay` seconds between at most :param:`retries`
+    retries
+
+    """
+
+    while True:
+        try:
+            return fn()
+        except OperationalError as e:
+            if "timeout" in str(e):
+                logger.warning("Attempt timed out")
+            else:
+                raise
+
+            if retries <= 0:
+                raise RuntimeError("Max retries exceeded")
+
+            logger.info(
+                f"Trying again in {delay} seconds ({retries} retries remaining)"
+            )
+            time.sleep(delay)
+            retries -= 1
+            if on_retry:
+                on_retry()
+
+
+def get_schema(connection):
+    """Returns the tables of the current schema, and its indexes with
+    whether they are valid
+
+    """
+
+    tables = {row[0] for row in execute(connection, SELECT_TABLES_SQL)}
+    indexes = {row[0]: row[1] for row in execute(connection, SELECT_INDEXES_SQL)}
+    return tables, indexes
+
+
+def compile_ddl(connection, element):
+    return str(element.compile(dialect=connection.dialect)).strip()
+
+
+def create_index_sql(connection, index, concurrently):
+    options = index.dialect_options["postgresql"]
+    previous = options["concurrently"]
+    options["concurrently"] = concurrently
     try:
-        return create_graph_tables(engine, delay, namespace=namespace)
+        return compile_ddl(connection, CreateIndex(index))
+    finally:
+        options["concurrently"] = previous
+
+
+def plan_graph_schema(connection, namespace=None):
+    """Compares the live catalog with the tables and indexes of the
+    loaded models and returns the steps creating what is missing.
+
+    Missing tables, with their indexes, are created in dependency order
+    (a table is empty when its indexes are built).  Missing indexes of
+    existing tables are then built CONCURRENTLY, an invalid index left
+    by an interrupted build being dropped first.  Changes to existing
+    tables (e.g. new columns) are not planned.
+
+    Besides the node and edge tables, the tables psqlgraph keeps outside
+    of the models (voided nodes) are planned the same way.
+
+    """
+
+    orm_base = ext.get_orm_base(namespace) if namespace else ORMBase
+    metadata_tables = (
+        orm_base.metadata.sorted_tables + VoidedBase.metadata.sorted_tables
+    )
+    tables, indexes = get_schema(connection)
+
+    steps = []
+    for table in metadata_tables:
+        if table.name in tables:
+            continue
+        statements = [compile_ddl(connection, CreateTable(table))]
+        statements.extend(
+            create_index_sql(connection, index, False)
+            for index in sorted(table.indexes, key=lambda index: index.name)
+            if index.name not in indexes
+        )
+        steps.append(
+            DDLStep(f"create table {table.name}", table.name, statements, False, [])
+        )
+
+    for table in metadata_tables:
+        if table.name not in tables:
+            continue
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if not indexes.get(index.name):
+                steps.append(create_index_step(connection, index, indexes))
+
+    return steps
+
+
+def create_index_step(connection, index, indexes):
+    """Returns the step building :param:`index` CONCURRENTLY, dropping
+    it first if it is in :param:`indexes` (i.e. left INVALID)
+
+    """
+
+    # an index build that fails or times out is left INVALID
+    drop = DROP_INDEX_SQL.format(index=index.name)
+    statements = [create_index_sql(connection, index, True)]
+    if index.name in indexes:
+        statements.insert(0, drop)
+    return DDLStep(
+        f"create index {index.name}", index.table.name, statements, True, [drop]
+    )
+
+
+def get_graph_indexes(namespace=None):
+    """Yields the secondary key, lower case secondary key and tag
+    indexes of every node table
+
+    """
+
+    node_cls = ext.get_abstract_node(namespace)
+    for cls in node_cls.get_subclasses():
+        names = get_index_names(cls)
+        for index in sorted(cls.__table__.indexes, key=lambda index: index.name):
+            if index.name in names:
+                yield index
+
+
+def plan_graph_indexes(connection, namespace=None):
+    """Returns the steps building the graph indexes that are missing or
+    INVALID on existing tables
+
+    """
+
+    return plan_index_steps(connection, get_graph_indexes(namespace))
+
 
-    except OperationalError as e:
-        if "timeout" in str(e):
-            logger.warning("Attempt timed out")
-        else:
-            raise
+def plan_index_steps(connection, graph_indexes):
+    """Returns the steps building those of :param:`graph_indexes` that
+    are missing or INVALID on existing tables
 
-        if retries <= 0:
-            raise RuntimeError("Max retries exceeded")
+    """
+
+    tables, indexes = get_schema(connection)
+    return [
+        create_index_step(connection, index, indexes)
+        for index in graph_indexes
+        if index.table.name in tables and not indexes.get(index.name)
+    ]
+
+
+def execute_ddl_step(engine, step, timeout):
+    """Runs a step in its own transaction (or, for CONCURRENTLY builds,
+    its own autocommit connection) with its own lock_timeout
+
+    """
+
+    logger.info("Running step: %s", step.name)
+    timeout_sql = "SET {}lock_timeout = '{}s'".format(
+        "" if step.concurrently else "LOCAL ", int(timeout + 1)
+    )
+
+    if not step.concurrently:
+        with engine.begin() as connection:
+            execute(connection, timeout_sql)
+            for statement in step.statements:
+                execute(connection, statement)
+        return
+
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        # the session level setting would outlive the step on the pooled connection
+        execute(connection, timeout_sql)
+        try:
+            for statement in step.statements:
+                execute(connection, statement)
+        finally:
+            execute(connection, "RESET lock_timeout")
+
+
+def execute_ddl_cleanup(engine, step):
+    if not step.cleanup:
+        return
+    with engine.connect() as connection:
+        connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+        for statement in step.cleanup:
+            execute(connection, statement)
+
+
+def execute_ddl_steps(engine, steps, delay, retries, workers=1):
+    """Runs :param:`steps` on at most :param:`workers` connections at a
+    time, each retried on lock timeouts on its own
+
+    The steps of a table run one after the other, in order, in a single
+    worker: concurrent index builds on the same table wait on each other
+    and would only hold a connection (and a snapshot) while waiting.
+    Only steps of different tables run in parallel.
+
+    """
 
-        logger.info(
-            f"Trying again in {delay} seconds ({retries} retries remaining)"
+    def run(step):
+        retry_on_lock_timeout(
+            lambda: execute_ddl_step(engine, step, delay),
+            delay,
+            retries,
+            on_retry=lambda: execute_ddl_cleanup(engine, step),
         )
-        time.sleep(delay)
 
-        create_tables(engine, delay, retries - 1, namespace=namespace)
+    if workers <= 1:
+        for step in steps:
+            run(step)
+        return
+
+    def run_table(table_steps):
+        for step in table_steps:
+            run(step)
+
+    steps_by_table = defaultdict(list)
+    for step in steps:
+        steps_by_table[step.table].append(step)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(run_table, table_steps)
+            for table_steps in steps_by_table.values()
+        ]
+        for future in futures:
+            future.result()
+
+
+def print_ddl_steps(steps):
+    for step in steps:
+        print(f"-- {step.name}")
+        print(";\n".join(step.statements) + ";")
+
+
+def report_index_progress(engine, done, interval):
+    """Logs the progress of this process's index builds every
+    :param:`interval` seconds until :param:`done` is set
+
+    """
+
+    while not done.wait(interval):
+        for row in execute(engine, SELECT_INDEX_PROGRESS_SQL, app_name=app_name):
+            logger.info(
+                "%s: %s (blocks %s/%s, tuples %s/%s)",
+                row.relname,
+                row.phase,
+                row.blocks_done,
+                row.blocks_total,
+                row.tuples_done,
+                row.tuples_total,
+            )
+
+
+def migrate_graph_schema(engine, delay, retries, namespace=None, dry_run=False):
+    """Creates the missing tables and indexes of the loaded models one
+    step at a time, each step retried on lock timeouts on its own
+
+    """
+
+    logger.info("Running table creator named %s", app_name)
+    with engine.connect() as connection:
+        steps = plan_graph_schema(connection, namespace)
+
+    logger.info("Planned %d steps", len(steps))
+    if dry_run:
+        print_ddl_steps(steps)
+        return steps
+
+    execute_ddl_steps(engine, steps, delay, retries)
+    return steps
+
+
+def build_graph_indexes(
+    engine,
+    delay,
+    retries,
+    namespace=None,
+    workers=4,
+    dry_run=False,
+    progress_interval=30,
+):
+    """Builds the missing or INVALID graph indexes CONCURRENTLY, on at
+    most :param:`workers` tables at a time
+
+    """
+
+    with engine.connect() as connection:
+        steps = plan_graph_indexes(connection, namespace)
+
+    logger.info("Planned %d index builds", len(steps))
+    if dry_run:
+        print_ddl_steps(steps)
+        return steps
+
+    done = threading.Event()
+    monitor = threading.Thread(
+        target=report_index_progress,
+        args=(engine, done, progress_interval),
+        daemon=True,
+    )
+    monitor.start()
+    try:
+        execute_ddl_steps(engine, steps, delay, retries, workers)
+    finally:
+        done.set()
+        monitor.join()
+    return steps
 
 
 def subcommand_create(args):
@@ -156,7 +595,32 @@ def subcommand_create(args):
         engine=engine, delay=args.delay, retries=args.retries, namespace=args.namespace
     )
 
-    return create_tables(**kwargs)
+    if args.all_at_once:
+        return create_tables(**kwargs)
+    return migrate_graph_schema(dry_run=args.dry_run, **kwargs)
+
+
+def subcommand_index(args):
+    """Build the secondary key and tag indexes of existing node tables
+    CONCURRENTLY, skipping valid indexes and rebuilding invalid ones.
+
+    """
+
+    logger.info("Running subcommand 'index'")
+    engine = get_engine(args.host, args.user, args.password, args.database)
+    return build_graph_indexes(
+        engine,
+        delay=args.delay,
+        retries=args.retries,
+        namespace=args.namespace,
+        workers=args.workers,
+        dry_run=args.dry_run,
+        progress_interval=args.progress_interval,
+    )
+
+
+def get_users(users):
+    return [u for u in (users or "").split(",") if u]
 
 
 def subcommand_grant(args):
@@ -171,15 +635,13 @@ def subcommand_grant(args):
 
     assert args.read or args.write, "No premission types/users specified."
 
-    if args.read:
-        users_read = [u for u in args.read.split(",") if u]
-        for user in users_read:
-            grant_read_permissions_to_graph(engine, user, args.namespace)
-
-    if args.write:
-        users_write = [u for u in args.write.split(",") if u]
-        for user in users_write:
-            grant_write_permissions_to_graph(engine, user, args.namespace)
+    privileges = [
+        (GRANT_READ_PRIVS_BATCH_SQL, get_users(args.read)),
+        (GRANT_WRITE_PRIVS_BATCH_SQL, get_users(args.write)),
+    ]
+    apply_privileges_to_graph(
+        engine, privileges, args.namespace, args.workers, args.dry_run
+    )
 
 
 def subcommand_revoke(args):
@@ -192,15 +654,13 @@ def subcommand_revoke(args):
     logger.info("Running subcommand 'revoke'")
     engine = get_engine(args.host, args.user, args.password, args.database)
 
-    if args.read:
-        users_read = [u for u in args.read.split(",") if u]
-        for user in users_read:
-            revoke_read_permissions_to_graph(engine, user, args.namespace)
-
-    if args.write:
-        users_write = [u for u in args.write.split(",") if u]
-        for user in users_write:
-            revoke_write_permissions_to_graph(engine, user, args.namespace)
+    privileges = [
+        (REVOKE_READ_PRIVS_BATCH_SQL, get_users(args.read)),
+        (REVOKE_WRITE_PRIVS_BATCH_SQL, get_users(args.write)),
+    ]
+    apply_privileges_to_graph(
+        engine, privileges, args.namespace, args.workers, args.dry_run
+    )
 
 
 def add_base_args(subparser):
@@ -253,6 +713,70 @@ def add_subcommand_create(subparsers):
         default=10,
         help="If blocked by important process, how many times to retry after waiting `delay` seconds.",
     )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the planned steps instead of running them.",
+    )
+    parser.add_argument(
+        "--all-at-once",
+        action="store_true",
+        help="Create all tables in a single transaction rather than step by step.",
+    )
+
+
+def add_privilege_args(parser):
+    parser.add_argument(
+        "--workers",
+        type=int,
+        action="store",
+        default=4,
+        help="How many connections to split the tables between.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the statements that would be run instead of running them.",
+    )
+
+
+def add_subcommand_index(subparsers):
+    parser = add_base_args(
+        subparsers.add_parser("graph-index", help=subcommand_index.__doc__)
+    )
+    parser.add_argument(
+        "--delay",
+        type=int,
+        action="store",
+        default=60,
+        help="How many seconds to wait for a lock before retrying a build.",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        action="store",
+        default=10,
+        help="How many times to retry a build that timed out waiting for a lock.",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        action="store",
+        default=4,
+        help="How many tables to build indexes on at a time.",
+    )
+    parser.add_argument(
+        "--progress-interval",
+        type=int,
+        action="store",
+        default=30,
+        help="How many seconds between progress reports.",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Print the planned index builds instead of running them.",
+    )
 
 
 def add_subcommand_grant(subparsers):
@@ -271,6 +795,7 @@ def add_subcommand_grant(subparsers):
         action="store",
         help="Users to grant read/write access to (comma separated).",
     )
+    add_privilege_args(parser)
 
 
 def add_subcommand_revoke(subparsers):
@@ -292,12 +817,14 @@ def add_subcommand_revoke(subparsers):
             "NOTE: The user will still have read privs!!"
         ),
     )
+    add_privilege_args(parser)
 
 
 def get_parser():
     parser = argparse.ArgumentParser()
     subparsers = parser.add_subparsers(dest="subcommand")
     add_subcommand_create(subparsers)
+    add_subcommand_index(subparsers)
     add_subcommand_grant(subparsers)
     add_subcommand_revoke(subparsers)
     return parser
@@ -313,6 +840,7 @@ def main(args=None):
 
     return_value = {
         "graph-create": subcommand_create,
+        "graph-index": subcommand_index,
         "graph-grant": subcommand_grant,
         "graph-revoke": subcommand_revoke,
     }[args.subcommand](args)
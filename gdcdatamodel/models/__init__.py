@@ -16,6 +16,7 @@ import hashlib
 import logging
 import os
 import sys
+import threading
 from collections import defaultdict
 from functools import lru_cache
 from types import ModuleType
@@ -26,11 +27,14 @@ from sqlalchemy.ext.hybrid import Comparator, hybrid_property
 from sqlalchemy.orm import configure_mappers
 
 from gdcdatamodel.models import (
+    ancestry,
     batch,
     notifications,
+    profiling,
     qcreport,
     redaction,
     released_data,
+    spec_cache,
     studyrule,
     submission,
     versioned_nodes,
@@ -45,7 +49,11 @@ from gdcdatamodel.models.caching import (
     related_cases_from_cache,
     related_cases_from_parents,
 )
-from gdcdatamodel.models.indexes import cls_add_indexes, get_secondary_key_indexes
+from gdcdatamodel.models.indexes import (
+    cls_add_indexes,
+    get_secondary_key_indexes,
+    get_tag_indexes,
+)
 from gdcdatamodel.models.misc import FileReport  # noqa
 from gdcdatamodel.models.utils import py3_to_bytes
 from gdcdatamodel.models.versioned_nodes import VersionedNode  # noqa
@@ -83,18 +91,26 @@ def register_class(cls, package_namespace=None):
 
     """
     if package_namespace:
-        m = get_cls_package(package_namespace)
-        pkg = sys.modules.get(m)
-        if not pkg:
-            pkg = ModuleType(m)
-            sys.modules[m] = pkg
-            globals()[package_namespace] = pkg
-        setattr(pkg, cls.__name__, cls)
+        setattr(get_package(package_namespace), cls.__name__, cls)
 
     else:
         globals()[cls.__name__] = cls
 
 
+def get_package(package_namespace):
+    """Returns the module classes for :param:`package_namespace` are
+    registered in, creating it if needed
+
+    """
+    m = get_cls_package(package_namespace)
+    pkg = sys.modules.get(m)
+    if not pkg:
+        pkg = ModuleType(m)
+        sys.modules[m] = pkg
+        globals()[package_namespace] = pkg
+    return pkg
+
+
 def get_links(schema):
     """Given a schema, pull out all of the ``links`` that this type can
     have an edge to.
@@ -129,9 +145,11 @@ def types_from_str(types):
     ]
 
 
-def PropertyFactory(name, schema, key=None):
-    """Returns a pg_property (psqlgraph specific type of hybrid_property)"""
-    key = name if key is None else key
+def compile_property(schema):
+    """Resolve a property schema into a JSON serializable spec of the
+    form ``{"types": [<type name>], "enum": <enum or None>}``
+
+    """
 
     # Assert the dictionary has no references for properties
     assert "$ref" not in schema.keys(), (
@@ -156,14 +174,19 @@ def PropertyFactory(name, schema, key=None):
     # If None is all we have left over, then turn it into a list of None.
     types = [types] if not isinstance(types, list) else types
 
-    # Convert the list of string type identifiers to Python types
-    python_types = types_from_str(types)
-
     # If there is an enum defined, grab it for pg_property validation
-    enum = schema.get("enum")
+    return {"types": types, "enum": schema.get("enum")}
+
+
+def property_from_spec(name, spec, key=None):
+    """Returns a pg_property given a spec from :func:`compile_property`"""
+    key = name if key is None else key
+
+    # Convert the list of string type identifiers to Python types
+    python_types = types_from_str(spec["types"])
 
     # Create pg_property setter
-    @pg_property(*python_types, enum=enum)
+    @pg_property(*python_types, enum=spec["enum"])
     def setter(self, val):
         self._set_property(key, val)
 
@@ -172,6 +195,11 @@ def PropertyFactory(name, schema, key=None):
     return setter
 
 
+def PropertyFactory(name, schema, key=None):
+    """Returns a pg_property (psqlgraph specific type of hybrid_property)"""
+    return property_from_spec(name, compile_property(schema), key)
+
+
 def get_class_name_from_id(_id):
     return "".join([a.capitalize() for a in _id.split("_")])
 
@@ -270,7 +298,15 @@ def cls_inject_secondary_keys(cls, schema):
 
     """
 
-    unique_keys = schema.get("uniqueKeys", [])
+    cls_inject_unique_keys(cls, schema.get("uniqueKeys", []))
+
+
+def cls_inject_unique_keys(cls, unique_keys):
+    """Injects the secondary key lookups described in
+    :func:`cls_inject_secondary_keys` given the ``uniqueKeys`` list
+
+    """
+
     cls.__pg_secondary_keys = [keys for keys in unique_keys if "id" not in keys]
 
     class SecondaryKeyComparator(Comparator):
@@ -311,17 +347,79 @@ def cls_inject_secondary_keys(cls, schema):
     cls._secondary_keys = _secondary_keys
     cls._secondary_keys_dicts = _secondary_keys_dicts
 
-    cls_add_indexes(cls, get_secondary_key_indexes(cls))
+    with profiling.profile.phase("cls_add_indexes"):
+        cls_add_indexes(cls, get_secondary_key_indexes(cls))
+
+
+#: Schema keys that are not copied into a node class' ``_dictionary``
+skipped_dict_vals = [
+    "$schema",
+    "systemProperties",
+    "additionalProperties",
+    "links",
+    "properties",
+    "uniqueKeys",
+    "id",
+    "tagProperties",
+    "tagBuilderConfig",
+]
+
+
+def compile_node(_id, schema):
+    """Resolve a node schema into the JSON serializable spec consumed by
+    :func:`node_factory_from_spec`.
+
+    Links depend on the rest of the dictionary, so they are left empty
+    here and resolved by :func:`compile_dictionary`.
+
+    """
+
+    links = get_links(schema)
+    properties = schema.get("properties", {})
+
+    return {
+        "id": _id,
+        "name": get_class_name_from_id(_id),
+        "tablename": get_class_tablename_from_id(_id),
+        # Pull the JSONB properties from the `properties` key
+        "properties": {
+            key: compile_property(subschema)
+            for key, subschema in properties.items()
+            if key not in links and key not in excluded_props
+        },
+        # default value for specified fields in the dictionary
+        "defaults": {
+            key: values["default"]
+            for key, values in properties.items()
+            if "default" in values
+        },
+        "dictionary": {
+            key: schema[key] for key in schema if key not in skipped_dict_vals
+        },
+        "tag_properties": schema.get("tagProperties"),
+        "tag_builder_config": schema.get("tagBuilderConfig", {}),
+        "unique_keys": schema.get("uniqueKeys", []),
+        "links": [],
+        "related_cases_link": None,
+    }
 
 
 def NodeFactory(_id, schema, node_cls=Node, package_namespace=None):
     """Returns a node class given a schema."""
 
-    name = get_class_name_from_id(_id)
-    links = get_links(schema)
+    return node_factory_from_spec(
+        compile_node(_id, schema), node_cls, package_namespace
+    )
+
+
+def node_factory_from_spec(spec, node_cls=Node, package_namespace=None):
+    """Returns a node class given a spec from :func:`compile_node`."""
 
-    tag_props = schema.get("tagProperties")
-    tag_config = schema.get("tagBuilderConfig", {})
+    _id = spec["id"]
+    name = spec["name"]
+
+    tag_props = spec["tag_properties"]
+    tag_config = spec["tag_builder_config"]
 
     @property
     def node_id(self, value):
@@ -404,34 +502,13 @@ def NodeFactory(_id, schema, node_cls=Node, package_namespace=None):
         """
         return self._sysan.get(versioning.TagKeys.tag)
 
-    # Pull the JSONB properties from the `properties` key
     attributes = {
-        key: PropertyFactory(key, schema)
-        for key, schema in schema.get("properties", {}).items()
-        if key not in links and key not in excluded_props
-    }
-
-    skipped_dict_vals = [
-        "$schema",
-        "systemProperties",
-        "additionalProperties",
-        "links",
-        "properties",
-        "uniqueKeys",
-        "id",
-        "tagProperties",
-        "tagBuilderConfig",
-    ]
-    attributes["_dictionary"] = {
-        key: schema[key] for key in schema if key not in skipped_dict_vals
+        key: property_from_spec(key, prop) for key, prop in spec["properties"].items()
     }
+    attributes["_dictionary"] = dict(spec["dictionary"])
 
     # _defaults: default value for specified fields in the dictionary
-    attributes["_defaults"] = {
-        key: values["default"]
-        for key, values in schema.get("properties", {}).items()
-        if "default" in values
-    }
+    attributes["_defaults"] = dict(spec["defaults"])
 
     # _pg_links are out_edges, links TO other types
     attributes["_pg_links"] = {}
@@ -465,7 +542,7 @@ def NodeFactory(_id, schema, node_cls=Node, package_namespace=None):
         (node_cls,),
         dict(
             __module__=get_cls_package(package_namespace),
-            __tablename__=get_class_tablename_from_id(_id),
+            __tablename__=spec["tablename"],
             __label__=_id,
             id=node_id,
             **attributes
@@ -475,10 +552,12 @@ def NodeFactory(_id, schema, node_cls=Node, package_namespace=None):
     cls_inject_created_datetime_hook(cls)
     cls_inject_updated_datetime_hook(cls)
     cls_inject_versioned_nodes_lookup(cls)
-    cls_inject_secondary_keys(cls, schema)
+    cls_inject_unique_keys(cls, spec["unique_keys"])
 
     if tag_props:
         versioning.inject_set_tag_after_insert(cls)
+        with profiling.profile.phase("cls_add_indexes"):
+            cls_add_indexes(cls, get_tag_indexes(cls))
 
     node_cls.add_subclass(cls)
     return cls
@@ -533,6 +612,7 @@ def EdgeFactory(
     node_cls=Node,
     edge_cls=Edge,
     package_namespace=None,
+    tablename=None,
     _assigned_association_proxies=defaultdict(lambda: defaultdict(set)),
 ):
     """Returns an edge class.
@@ -547,6 +627,9 @@ def EdgeFactory(
     :param dst_src_assoc:
         The backref name i.e. ``dst.dst_src_assoc`` returns a list of
         source type nodes
+    :param tablename:
+        The precomputed edge table name, generated from the labels if
+        not given
     :param _assigned_association_proxies:
         Don't pass this parameter. This will be used to store what
         links and backrefs have been assigned to the source and
@@ -567,7 +650,7 @@ def EdgeFactory(
 
     # Generate the tablename. If it is too long, it will be hashed and
     # truncated.
-    tablename = generate_edge_tablename(src_label, label, dst_label)
+    tablename = tablename or generate_edge_tablename(src_label, label, dst_label)
 
     # Lookup the tablenames for the source and destination classes
     src_cls = node_cls.get_subclass(src_label)
@@ -598,14 +681,17 @@ def EdgeFactory(
 
     hooks_before_insert = edge_cls._session_hooks_before_insert + [
         cache_related_cases_on_insert,
+        ancestry.node_ancestry_on_insert,
     ]
 
     hooks_before_update = edge_cls._session_hooks_before_update + [
         cache_related_cases_on_update,
+        ancestry.node_ancestry_on_update,
     ]
 
     hooks_before_delete = edge_cls._session_hooks_before_delete + [
         cache_related_cases_on_delete,
+        ancestry.node_ancestry_on_delete,
     ]
 
     cls = type(
@@ -632,6 +718,118 @@ def EdgeFactory(
     return cls
 
 
+def compile_link(src_label, name, link, dictionary):
+    """Resolve a link from :param:`src_label` into the JSON serializable
+    spec of the edge class that implements it
+
+    """
+
+    dst_label = link["target_type"]
+    if dst_label not in dictionary.schema:
+        raise RuntimeError(
+            "Destination '{}' for edge '{}' from '{}' not defined".format(
+                dst_label, name, src_label
+            )
+        )
+
+    dst_label = remove_spaces(dictionary.schema[dst_label]["id"])
+    edge_label = remove_spaces(link["label"])
+    edge_name = "".join(map(get_class_name_from_id, [src_label, edge_label, dst_label]))
+
+    return {
+        "name": name,
+        "label": edge_label,
+        "backref": link["backref"],
+        "target_type": dst_label,
+        "edge_name": remove_spaces(edge_name),
+        "edge_tablename": generate_edge_tablename(src_label, edge_label, dst_label),
+    }
+
+
+def compile_dictionary(dictionary, digest=None):
+    """Walk the dictionary once and resolve everything needed to build
+    the Node and Edge classes into a JSON serializable spec::
+
+        {
+            "version": <spec_cache.SPEC_VERSION>,
+            "hash": <dictionary hash or None>,
+            "nodes": [<compile_node() + resolved links>],
+        }
+
+    :param dictionary: gdc dictionary or an extension of it
+    :param digest: hash of the dictionary the spec is keyed by
+
+    """
+
+    nodes = []
+    for subschema in dictionary.schema.values():
+        node = compile_node(subschema["id"], subschema)
+        src_label = remove_spaces(node["id"])
+
+        node["links"] = [
+            compile_link(src_label, name, link, dictionary)
+            for name, link in get_links(subschema).items()
+        ]
+
+        cache_case = node["dictionary"].get(
+            "category"
+        ) not in NOT_RELATED_CASES_CATEGORIES or node["id"] in ["annotation"]
+
+        if cache_case:
+            link = {
+                "target_type": "case",
+                "label": "relates_to",
+                "backref": f"_related_{node['id']}",
+            }
+            node["related_cases_link"] = compile_link(
+                src_label, RELATED_CASES_LINK_NAME, link, dictionary
+            )
+
+        nodes.append(node)
+
+    return {"version": spec_cache.SPEC_VERSION, "hash": digest, "nodes": nodes}
+
+
+def get_dictionary_spec(dictionary, package_namespace=None, cache_dir=None):
+    """Returns the compiled spec for :param:`dictionary`.
+
+    If :param:`cache_dir` (or ``$GDC_DICTIONARY_SPEC_CACHE``) is set,
+    the spec is read from the artifact stored there, and (re)compiled
+    and written back if the artifact is missing or was compiled from a
+    different dictionary.
+
+    """
+
+    cache_dir = cache_dir or os.environ.get(spec_cache.SPEC_CACHE_ENV)
+    if not cache_dir:
+        return compile_dictionary(dictionary)
+
+    digest = spec_cache.dictionary_hash(dictionary)
+    path = spec_cache.get_spec_path(cache_dir, package_namespace)
+
+    spec = spec_cache.read_spec(path, digest)
+    if spec is None:
+        spec = compile_dictionary(dictionary, digest)
+        try:
+            spec_cache.write_spec(path, spec)
+        except OSError as e:
+            logger.warning("Unable to write dictionary spec %s: %s", path, e)
+
+    return spec
+
+
+@lru_cache(maxsize=10)
+def get_spec(dictionary, package_namespace=None):
+    """Returns the spec of :param:`dictionary` from
+    :func:`get_dictionary_spec`, compiled (or read from the spec cache)
+    once per dictionary and shared by :func:`load_dictionary` and the
+    public ``load_*`` helpers
+
+    """
+
+    return get_dictionary_spec(dictionary, package_namespace)
+
+
 def load_nodes(dictionary, node_cls=None, package_namespace=None):
     """Parse all nodes from dictionary and create Node subclasses
     Args:
@@ -639,93 +837,88 @@ def load_nodes(dictionary, node_cls=None, package_namespace=None):
         node_cls (psqlgraph.Node): Node class definition
         package_namespace (str): package name
     """
+    load_nodes_from_spec(
+        get_spec(dictionary, package_namespace), node_cls, package_namespace
+    )
+
+
+def load_nodes_from_spec(spec, node_cls=None, package_namespace=None):
+    """Create Node subclasses from a spec from :func:`compile_dictionary`
+    Args:
+        spec (dict): The compiled dictionary
+        node_cls (psqlgraph.Node): Node class definition
+        package_namespace (str): package name
+    """
     node_cls = node_cls or Node
-    for entity, subschema in dictionary.schema.items():
-        _id = subschema["id"]
-        name = get_class_name_from_id(_id)
+    for node_spec in spec["nodes"]:
+        name = node_spec["name"]
         if not node_cls.is_subclass_loaded(name):
             try:
-                cls = NodeFactory(_id, subschema, node_cls, package_namespace)
+                with profiling.profile.cls(name, "node", package_namespace):
+                    cls = node_factory_from_spec(node_spec, node_cls, package_namespace)
                 register_class(cls, package_namespace)
             except Exception:
                 print(f"Unable to load {name}")
                 raise
 
 
-def parse_edge(
-    src_label,
-    name,
-    edge_label,
-    subschema,
-    link,
-    dictionary,
-    node_cls=Node,
-    edge_cls=Edge,
-    package_namespace=None,
-):
-    """Parse an edge from the dictionary and create and Edge subclass
+def load_edges(dictionary, node_cls=Node, edge_cls=Edge, package_namespace=None):
+    """Add a dictionry of links from this class
 
-    :returns: The outbound name of the edge
+    { <link name>: {'backref': <backref name>, 'type': <source type> } }
 
     """
 
-    dst_label = link["target_type"]
-    backref = link["backref"]
+    load_edges_from_spec(
+        get_spec(dictionary, package_namespace), node_cls, edge_cls, package_namespace
+    )
 
-    src_label = subschema["id"]
-    if dst_label not in dictionary.schema:
-        raise RuntimeError(
-            "Destination '{}' for edge '{}' from '{}' not defined".format(
-                dst_label, name, src_label
-            )
-        )
 
-    dst_label = dictionary.schema[dst_label]["id"]
-    edge_name = "".join(map(get_class_name_from_id, [src_label, edge_label, dst_label]))
+def load_edge_from_spec(
+    src_label, link, node_cls=Node, edge_cls=Edge, package_namespace=None
+):
+    """Create the Edge subclass for a link spec from :func:`compile_link`
+
+    :returns: The outbound name of the edge
+
+    """
 
-    if edge_cls.is_subclass_loaded(name):
+    edge_name = link["edge_name"]
+    if edge_cls.is_subclass_loaded(edge_name):
         return f"_{edge_name}_out"
 
-    edge = EdgeFactory(
-        edge_name,
-        edge_label,
-        src_label,
-        dst_label,
-        name,
-        backref,
-        node_cls=node_cls,
-        edge_cls=edge_cls,
-        package_namespace=package_namespace,
-    )
+    with profiling.profile.cls(edge_name, "edge", package_namespace):
+        edge = EdgeFactory(
+            edge_name,
+            link["label"],
+            src_label,
+            link["target_type"],
+            link["name"],
+            link["backref"],
+            node_cls=node_cls,
+            edge_cls=edge_cls,
+            package_namespace=package_namespace,
+            tablename=link["edge_tablename"],
+        )
 
     return f"_{edge.__name__}_out"
 
 
-def load_edges(dictionary, node_cls=Node, edge_cls=Edge, package_namespace=None):
-    """Add a dictionry of links from this class
-
-    { <link name>: {'backref': <backref name>, 'type': <source type> } }
+def load_edges_from_spec(spec, node_cls=Node, edge_cls=Edge, package_namespace=None):
+    """Create Edge subclasses, and the ``_pg_links`` of their source
+    classes, from a spec from :func:`compile_dictionary`
 
     """
 
-    for src_label, subschema in dictionary.schema.items():
-
+    for node_spec in spec["nodes"]:
+        src_label = node_spec["id"]
         src_cls = node_cls.get_subclass(src_label)
         if not src_cls:
             raise RuntimeError(f"No source class labeled {src_label}")
 
-        for name, link in get_links(subschema).items():
-            edge_label = link["label"]
-            edge_name = parse_edge(
-                src_label,
-                name,
-                edge_label,
-                subschema,
-                link,
-                dictionary=dictionary,
-                node_cls=node_cls,
-                edge_cls=edge_cls,
-                package_namespace=package_namespace,
+        for link in node_spec["links"]:
+            edge_name = load_edge_from_spec(
+                src_label, link, node_cls, edge_cls, package_namespace
             )
             src_cls._pg_links[link["name"]] = {
                 "edge_out": edge_name,
@@ -733,37 +926,18 @@ def load_edges(dictionary, node_cls=Node, edge_cls=Edge, package_namespace=None)
                 "backref": link["backref"],
             }
 
-    for src_cls in node_cls.get_subclasses():
-        cache_case = not src_cls._dictionary[
-            "category"
-        ] in NOT_RELATED_CASES_CATEGORIES or src_cls.get_label() in ["annotation"]
-
-        if not cache_case:
-            continue
-
-        link = {
-            "name": RELATED_CASES_LINK_NAME,
-            "multiplicity": "many_to_one",
-            "required": False,
-            "target_type": "case",
-            "label": "relates_to",
-            "backref": f"_related_{src_cls.label}",
-        }
-
-        parse_edge(
-            src_cls.label,
-            link["name"],
-            "relates_to",
-            {"id": src_cls.label},
-            link,
-            dictionary=dictionary,
-            node_cls=node_cls,
-            edge_cls=edge_cls,
-            package_namespace=package_namespace,
-        )
+    for node_spec in spec["nodes"]:
+        if node_spec["related_cases_link"]:
+            load_edge_from_spec(
+                node_spec["id"],
+                node_spec["related_cases_link"],
+                node_cls,
+                edge_cls,
+                package_namespace,
+            )
 
 
-def inject_pg_backrefs(dictionary, node_cls):
+def inject_pg_backrefs(dictionary, node_cls, package_namespace=None):
     """Add a dict of links to this class.  Backrefs look like:
 
     .. code-block::
@@ -771,12 +945,19 @@ def inject_pg_backrefs(dictionary, node_cls):
 
     """
 
-    for src_label, subschema in dictionary.schema.items():
-        for name, link in get_links(subschema).items():
+    inject_pg_backrefs_from_spec(get_spec(dictionary, package_namespace), node_cls)
+
+
+def inject_pg_backrefs_from_spec(spec, node_cls):
+    """Add ``_pg_backrefs`` given a spec from :func:`compile_dictionary`"""
+
+    for node_spec in spec["nodes"]:
+        src_cls = node_cls.get_subclass(node_spec["id"])
+        for link in node_spec["links"]:
             dst_cls = node_cls.get_subclass(link["target_type"])
             dst_cls._pg_backrefs[link["backref"]] = {
                 "name": link["name"],
-                "src_type": node_cls.get_subclass(src_label),
+                "src_type": src_cls,
             }
 
 
@@ -822,13 +1003,223 @@ def inject_pg_edges(node_cls):
         cls_inject_backward_edges(cls)
 
 
+class LazyDictionaryLoader:
+    """Builds the Node and Edge classes of a compiled dictionary on
+    first access instead of all at once.
+
+    Completing a class builds it, every edge class to or from it, and
+    the neighbour classes those edges need to be mapped.  Neighbours
+    are only built "shallow": their own edges (and ``_pg_links``,
+    ``_pg_backrefs`` and ``_pg_edges``) are filled in once they are
+    accessed themselves.
+
+    ``Node.get_subclasses()`` completes every class before returning,
+    callers iterating over all node classes (the related case cache
+    audit, ``snapshot_project``, the migrations) see the same classes
+    as with eager loading, at the cost of building them all.
+
+    Only lookups on :attr:`node_cls` itself are routed through the
+    loader, and only for labels of this dictionary.  Every other
+    lookup, including those on the base classes of other namespaces,
+    goes to the unpatched psqlgraph methods.
+
+    ::NOTE:: the related case cache hooks only cascade over edges that
+    have been built.  Processes that write to the graph should load
+    eagerly, or call :meth:`load_all` first.
+
+    """
+
+    def __init__(self, spec, node_cls, edge_cls, package_namespace=None):
+        self.node_cls = node_cls
+        self.edge_cls = edge_cls
+        self.package_namespace = package_namespace
+
+        self.nodes = {node["id"]: node for node in spec["nodes"]}
+        self.labels = {node["name"]: node["id"] for node in spec["nodes"]}
+
+        #: edge class name -> label of the node that owns it
+        self.edge_owners = {}
+
+        #: dst label -> [(src label, link)]
+        self.backrefs = defaultdict(list)
+
+        for node in spec["nodes"]:
+            for link in node["links"]:
+                self.edge_owners[link["edge_name"]] = node["id"]
+                self.backrefs[link["target_type"]].append((node["id"], link))
+            if node["related_cases_link"]:
+                self.edge_owners[node["related_cases_link"]["edge_name"]] = node["id"]
+
+        self.completed = set()
+        self.building = 0
+        self.lock = threading.RLock()
+
+        # The unpatched lookups, the patched ones are inherited by the
+        # base classes of other namespaces which must not be affected
+        self._get_subclass = node_cls.get_subclass.__func__
+        self._get_subclass_named = node_cls.get_subclass_named.__func__
+        self._get_subclasses = node_cls.get_subclasses.__func__
+
+    def owns(self, cls):
+        return cls is self.node_cls
+
+    def install(self):
+        """Route ``get_subclass`` lookups and attribute access on the
+        class package through this loader
+
+        """
+
+        loader = self
+
+        def get_subclass(cls, label):
+            if not loader.owns(cls) or label not in loader.nodes:
+                return loader._get_subclass(cls, label)
+            return loader.get_subclass(label)
+
+        def get_subclass_named(cls, name):
+            if not loader.owns(cls) or name not in loader.labels:
+                return loader._get_subclass_named(cls, name)
+            return loader.get_subclass(loader.labels[name])
+
+        def get_subclasses(cls):
+            if loader.owns(cls):
+                with loader.lock:
+                    if not loader.building:
+                        loader.load_all()
+            return loader._get_subclasses(cls)
+
+        self.node_cls.get_subclass = classmethod(get_subclass)
+        self.node_cls.get_subclass_named = classmethod(get_subclass_named)
+        self.node_cls.get_subclasses = classmethod(get_subclasses)
+
+        lazy_loaders[self.package_namespace] = self
+        if self.package_namespace:
+            get_package(self.package_namespace).__getattr__ = self.getattr
+
+    def getattr(self, name):
+        """Module level ``__getattr__`` for the class package"""
+
+        if name in self.labels:
+            return self.get_subclass(self.labels[name])
+
+        if name in self.edge_owners:
+            self.get_subclass(self.edge_owners[name])
+            return getattr(self.get_package(), name)
+
+        raise AttributeError(
+            f"module {get_cls_package(self.package_namespace)!r} has no attribute {name!r}"
+        )
+
+    def get_package(self):
+        if self.package_namespace:
+            return get_package(self.package_namespace)
+        return sys.modules[__name__]
+
+    def get_subclass(self, label):
+        """Returns the class labeled :param:`label`.  While classes are
+        being built only a shallow class is created so that building one
+        class does not cascade over the whole dictionary.
+
+        """
+
+        if label not in self.nodes:
+            return self._get_subclass(self.node_cls, label)
+
+        with self.lock:
+            if self.building:
+                return self.get_shallow(label)
+            return self.complete(label)
+
+    def get_shallow(self, label):
+        node_spec = self.nodes[label]
+        if self.node_cls.is_subclass_loaded(node_spec["name"]):
+            return self._get_subclass(self.node_cls, label)
+
+        with profiling.profile.cls(node_spec["name"], "node", self.package_namespace):
+            cls = node_factory_from_spec(
+                node_spec, self.node_cls, self.package_namespace
+            )
+        register_class(cls, self.package_namespace)
+        return cls
+
+    def complete(self, label):
+        """Build the class labeled :param:`label` with all of its edges"""
+
+        cls = self.get_shallow(label)
+        if label in self.completed:
+            return cls
+
+        node_spec = self.nodes[label]
+        args = (self.node_cls, self.edge_cls, self.package_namespace)
+
+        self.building += 1
+        try:
+            for link in node_spec["links"]:
+                dst_cls = self.get_shallow(link["target_type"])
+                cls._pg_links[link["name"]] = {
+                    "edge_out": load_edge_from_spec(label, link, *args),
+                    "dst_type": dst_cls,
+                }
+                cls._pg_edges[link["name"]] = {
+                    "backref": link["backref"],
+                    "type": dst_cls,
+                }
+
+            for src_label, link in self.backrefs[label]:
+                src_cls = self.get_shallow(src_label)
+                load_edge_from_spec(src_label, link, *args)
+                cls._pg_backrefs[link["backref"]] = {
+                    "name": link["name"],
+                    "src_type": src_cls,
+                }
+                cls._pg_edges[link["backref"]] = {
+                    "backref": link["name"],
+                    "type": src_cls,
+                }
+
+            if node_spec["related_cases_link"]:
+                self.get_shallow("case")
+                load_edge_from_spec(label, node_spec["related_cases_link"], *args)
+
+            with profiling.profile.phase("configure_mappers"):
+                configure_mappers()
+            self.completed.add(label)
+        finally:
+            self.building -= 1
+
+        return cls
+
+    def load_all(self):
+        """Complete every class in the dictionary"""
+
+        with self.lock:
+            for label in self.nodes:
+                self.complete(label)
+
+
+#: package_namespace -> LazyDictionaryLoader for lazily loaded dictionaries
+lazy_loaders = {}
+
+
+def __getattr__(name):
+    loader = lazy_loaders.get(None)
+    if loader:
+        return loader.getattr(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 @lru_cache(maxsize=10)
-def load_dictionary(dictionary=None, package_namespace=None):
+def load_dictionary(dictionary=None, package_namespace=None, lazy=False):
     """Loads all classes defined in dictionary, this method is expected to be called only once
         and very early in the application lifecycle. Subsequent calls are cached
+
+        The dictionary is first compiled into a flat spec (see :func:`get_dictionary_spec`), which is
+        read from disk instead when ``GDC_DICTIONARY_SPEC_CACHE`` points at a directory holding an up to
+        date artifact
     Args:
         dictionary: gdc dictionary or an extension of it
         package_namespace (str): module namespace used to insert all class generated from the dictionary
+        lazy (bool): only build classes when they are first accessed, see :class:`LazyDictionaryLoader`
     Raises:
         AssertionError: If method is called more than maxsize of the lru_cache, which is 10. This method should only
             be called once
@@ -839,22 +1230,33 @@ def load_dictionary(dictionary=None, package_namespace=None):
 
         dictionary = gdcdictionary
 
+    profile = profiling.profile
     node_cls, edge_cls = ext.register_base_class(package_namespace)
 
-    load_nodes(dictionary, node_cls, package_namespace)
-    load_edges(dictionary, node_cls, edge_cls, package_namespace)
-    inject_pg_backrefs(dictionary, node_cls)
-    inject_pg_edges(node_cls)
-    configure_mappers()
+    with profile.phase("get_dictionary_spec"):
+        spec = get_spec(dictionary, package_namespace)
+
+    if lazy:
+        LazyDictionaryLoader(spec, node_cls, edge_cls, package_namespace).install()
+    else:
+        with profile.phase("load_nodes"):
+            load_nodes_from_spec(spec, node_cls, package_namespace)
+        with profile.phase("load_edges"):
+            load_edges_from_spec(spec, node_cls, edge_cls, package_namespace)
+        with profile.phase("inject_pg_backrefs"):
+            inject_pg_backrefs_from_spec(spec, node_cls)
+        with profile.phase("inject_pg_edges"):
+            inject_pg_edges(node_cls)
+        with profile.phase("configure_mappers"):
+            configure_mappers()
 
     # register abstract node and edge in package
     if package_namespace:
-        m = get_cls_package(package_namespace)
-        pkg = sys.modules.get(m)
+        pkg = get_package(package_namespace)
         setattr(pkg, "Node", node_cls)
         setattr(pkg, "Edge", edge_cls)
 
 
 # load default dictionary
 if os.environ.get("LOAD_GDC_DICTIONARY", "True") == "True":
-    load_dictionary()
+    load_dictionary(lazy=os.environ.get("LAZY_LOAD_GDC_DICTIONARY", "False") == "True")
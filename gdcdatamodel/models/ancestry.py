@@ -0,0 +1,267 @@
+"""gdcdatamodel.models.ancestry
+----------------------------------
+
+An optional closure table of the ancestors of every node, so that the
+ancestors of any label (``case``, ``project``, ...) or the descendants
+of any node are a single indexed lookup instead of a walk over the
+edge tables.
+
+**node_ancestors**:
+    One row per (descendant, ancestor, depth) with the number of
+    distinct paths of that length between them.  Counting paths makes
+    the table exact under both edge inserts and deletes: adding or
+    removing an edge ``src -> dst`` adds or subtracts, for every
+    descendant of ``src`` and ancestor of ``dst``, the product of the
+    path counts on either side, and rows that drop to zero paths are
+    deleted.  This assumes the graph is acyclic, and paths longer than
+    :data:`MAX_DEPTH` are not recorded.  The case shortcut edges are not
+    part of the lineage and are ignored.
+
+**maintenance**:
+    When enabled (for a session with :func:`enable_node_ancestry` or
+    for all sessions with ``GDC_NODE_ANCESTRY=True``) the edge hooks
+    below apply each inserted, moved or deleted edge with one
+    statement.  The table can be built, or rebuilt after it was
+    disabled, with ``migrations.node_ancestors``, which holds
+    :data:`NODE_ANCESTRY_LOCK_ID` meanwhile so that the hooks wait for
+    the rebuild to finish.
+
+"""
+
+import os
+
+from sqlalchemy import BigInteger, Column, Index, Integer, Text, func, text
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm.attributes import get_history
+
+from gdcdatamodel.models.caching import is_related_case_edge
+
+Base = declarative_base()
+
+#: Whether sessions maintain the ancestor closure table unless
+#: overridden with :func:`enable_node_ancestry`
+NODE_ANCESTRY = os.environ.get("GDC_NODE_ANCESTRY", "False") == "True"
+
+#: Session.info key overriding :data:`NODE_ANCESTRY`
+NODE_ANCESTRY_KEY = "gdcdatamodel.node_ancestry"
+
+#: Paths longer than this are not recorded, by the hooks or by a
+#: rebuild, so that a cycle in the graph doesn't recurse forever
+MAX_DEPTH = 32
+
+#: Advisory lock held exclusively while the table is rebuilt and shared
+#: by the transactions maintaining it
+NODE_ANCESTRY_LOCK_ID = 7290843451
+
+
+class NodeAncestor(Base):
+
+    __tablename__ = "node_ancestors"
+    __table_args__ = (
+        Index("node_ancestors_ancestor_id_idx", "ancestor_id", "descendant_id"),
+    )
+
+    def __repr__(self):
+        return "<NodeAncestor(descendant_id='{}', ancestor_id='{}', depth={})>".format(
+            self.descendant_id, self.ancestor_id, self.depth
+        )
+
+    descendant_id = Column(Text, primary_key=True)
+
+    ancestor_id = Column(Text, primary_key=True)
+
+    depth = Column(Integer, primary_key=True)
+
+    ancestor_label = Column(
+        Text,
+        nullable=False,
+    )
+
+    paths = Column(
+        BigInteger,
+        nullable=False,
+        default=1,
+    )
+
+
+#: The paths created (or removed) by an edge: every descendant of the
+#: edge's src, including itself, to every ancestor of its dst,
+#: including itself
+EDGE_PATHS_SQL = """
+WITH descendants (descendant_id, depth, paths) AS (
+        SELECT CAST(:src_id AS text), 0, CAST(1 AS bigint)
+    UNION ALL
+        SELECT descendant_id, depth, paths
+        FROM node_ancestors
+        WHERE ancestor_id = :src_id
+), ancestors (ancestor_id, ancestor_label, depth, paths) AS (
+        SELECT CAST(:dst_id AS text), CAST(:dst_label AS text), 0, CAST(1 AS bigint)
+    UNION ALL
+        SELECT ancestor_id, ancestor_label, depth, paths
+        FROM node_ancestors
+        WHERE descendant_id = :dst_id
+), edge_paths AS (
+    SELECT descendants.descendant_id,
+           ancestors.ancestor_id,
+           ancestors.ancestor_label,
+           descendants.depth + ancestors.depth + 1 AS depth,
+           sum(descendants.paths * ancestors.paths) AS paths
+    FROM descendants CROSS JOIN ancestors
+    WHERE descendants.depth + ancestors.depth + 1 <= :max_depth
+    GROUP BY 1, 2, 3, 4
+)"""
+
+INSERT_EDGE_SQL = EDGE_PATHS_SQL + """
+INSERT INTO node_ancestors (descendant_id, ancestor_id, ancestor_label, depth, paths)
+SELECT descendant_id, ancestor_id, ancestor_label, depth, paths FROM edge_paths
+ON CONFLICT (descendant_id, ancestor_id, depth)
+DO UPDATE SET paths = node_ancestors.paths + excluded.paths
+"""
+
+DELETE_EDGE_SQL = EDGE_PATHS_SQL + """, deleted AS (
+    DELETE FROM node_ancestors USING edge_paths
+    WHERE node_ancestors.descendant_id = edge_paths.descendant_id
+    AND   node_ancestors.ancestor_id   = edge_paths.ancestor_id
+    AND   node_ancestors.depth         = edge_paths.depth
+    AND   node_ancestors.paths        <= edge_paths.paths
+)
+UPDATE node_ancestors SET paths = node_ancestors.paths - edge_paths.paths
+FROM edge_paths
+WHERE node_ancestors.descendant_id = edge_paths.descendant_id
+AND   node_ancestors.ancestor_id   = edge_paths.ancestor_id
+AND   node_ancestors.depth         = edge_paths.depth
+AND   node_ancestors.paths         > edge_paths.paths
+"""
+
+
+def enable_node_ancestry(session, enabled=True):
+    """Maintain the ancestor closure table in :param:`session`"""
+
+    session.info[NODE_ANCESTRY_KEY] = enabled
+
+
+def is_node_ancestry(session):
+    return session.info.get(NODE_ANCESTRY_KEY, NODE_ANCESTRY)
+
+
+def get_edge_ids(target):
+    """Returns the (src_id, dst_id) of an edge instance, from its related
+    nodes if the ids have not been set yet
+
+    """
+
+    src_id = target.src_id if target.src_id is not None else target.src.node_id
+    dst_id = target.dst_id if target.dst_id is not None else target.dst.node_id
+    return src_id, dst_id
+
+
+def get_dst_label(target):
+    node_cls = target.get_node_class()
+    return node_cls.get_subclass_named(target.__dst_class__).get_label()
+
+
+def apply_edge(session, statement, src_id, dst_id, dst_label):
+    if src_id is None or dst_id is None:
+        return
+
+    # waits for a rebuild of the table to finish
+    session.execute(
+        text("SELECT pg_advisory_xact_lock_shared(:lock_id)"),
+        {"lock_id": NODE_ANCESTRY_LOCK_ID},
+    )
+    session.execute(
+        text(statement),
+        {
+            "src_id": src_id,
+            "dst_id": dst_id,
+            "dst_label": dst_label,
+            "max_depth": MAX_DEPTH,
+        },
+    )
+
+
+def node_ancestry_on_insert(target, session, flush_context, instances):
+    """Hook on inserted edges.  Add the paths through the edge."""
+
+    if not is_node_ancestry(session) or is_related_case_edge(type(target)):
+        return
+
+    apply_edge(session, INSERT_EDGE_SQL, *get_edge_ids(target), get_dst_label(target))
+
+
+def node_ancestry_on_update(target, session, flush_context, instances):
+    """Hook on updated edges.  If the edge was moved, remove the paths
+    through its old ends and add those through its new ends.
+
+    This is also called when an edge is removed through an association
+    proxy: one of its ends is unset and it is deleted as an orphan
+    during the flush, without calling the delete hooks.
+
+    """
+
+    if not is_node_ancestry(session) or is_related_case_edge(type(target)):
+        return
+
+    src, dst = get_history(target, "src_id"), get_history(target, "dst_id")
+    old_ids = (
+        (src.deleted or src.unchanged or [None])[0],
+        (dst.deleted or dst.unchanged or [None])[0],
+    )
+
+    if target.src is None or target.dst is None:
+        new_ids = (None, None)
+    else:
+        new_ids = (target.src.node_id, target.dst.node_id)
+
+    if old_ids == new_ids:
+        return
+
+    dst_label = get_dst_label(target)
+    apply_edge(session, DELETE_EDGE_SQL, *old_ids, dst_label)
+    apply_edge(session, INSERT_EDGE_SQL, *new_ids, dst_label)
+
+
+def node_ancestry_on_delete(target, session, flush_context, instances):
+    """Hook on deleted edges.  Remove the paths through the edge."""
+
+    if not is_node_ancestry(session) or is_related_case_edge(type(target)):
+        return
+
+    apply_edge(session, DELETE_EDGE_SQL, *get_edge_ids(target), get_dst_label(target))
+
+
+def ancestors(session, node_ids, label=None):
+    """Returns a query of (descendant_id, ancestor_id, depth) of the
+    ancestors of :param:`node_ids`, optionally only those with
+    :param:`label`, at the shortest depth they are reached
+
+    """
+
+    query = session.query(
+        NodeAncestor.descendant_id,
+        NodeAncestor.ancestor_id,
+        func.min(NodeAncestor.depth).label("depth"),
+    ).filter(NodeAncestor.descendant_id.in_(node_ids))
+
+    if label is not None:
+        query = query.filter(NodeAncestor.ancestor_label == label)
+
+    return query.group_by(NodeAncestor.descendant_id, NodeAncestor.ancestor_id)
+
+
+def descendants(session, node_ids):
+    """Returns a query of (ancestor_id, descendant_id, depth) of the
+    descendants of :param:`node_ids`, at the shortest depth they are
+    reached
+
+    """
+
+    return (
+        session.query(
+            NodeAncestor.ancestor_id,
+            NodeAncestor.descendant_id,
+            func.min(NodeAncestor.depth).label("depth"),
+        )
+        .filter(NodeAncestor.ancestor_id.in_(node_ids))
+        .group_by(NodeAncestor.ancestor_id, NodeAncestor.descendant_id)
+    )
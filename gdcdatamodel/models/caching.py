@@ -12,9 +12,42 @@ GDC datamodel.
     cache when the set of graph edges is modified.  The value of this
     key in sysan should be a list of case ids
 
+**batched mode**:
+    By default the edge hooks below walk the graph through the ORM once
+    per modified edge.  When batched mode is enabled (for a session with
+    :func:`enable_batched_related_cases` or for all sessions with
+    ``GDC_BATCH_RELATED_CASES=True``) the hooks only record the source
+    of each modified edge.  At the end of the flush
+    :func:`refresh_related_cases` then computes the affected subgraph
+    once, recomputes the related cases in topological order from
+    ``case`` outward and writes the difference to the shortcut edge
+    tables with batched statements.
+
+**metrics**:
+    A callback set with :func:`set_related_cases_metrics_callback` is
+    called after every flush in which the edge hooks ran, with the
+    number of hooks, nodes visited, maximum recursion depth, queries
+    issued, seconds spent and cascades deferred.
+
+**deferred cascades**:
+    With a threshold set (with :func:`set_defer_related_cases_threshold`
+    or ``GDC_DEFER_RELATED_CASES_THRESHOLD``), a hook whose cascade
+    visits more nodes than the threshold stops and queues the source of
+    its edge in the ``related_cases_queue`` table instead.  A worker
+    then refreshes the queued trees with set-based statements, see
+    :func:`process_related_cases_queue`.
+
 """
 
+import functools
 import logging
+import os
+import time
+from collections import defaultdict
+
+from sqlalchemy import Column, DateTime, Text, event, select, text, tuple_
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
 
 logger = logging.getLogger("gdcdatamodel")
 
@@ -29,6 +62,66 @@ NOT_RELATED_CASES_CATEGORIES = {
     "TBD",
 }
 
+#: Whether sessions maintain the related case cache in batched mode
+#: unless overridden with :func:`enable_batched_related_cases`
+BATCH_RELATED_CASES = os.environ.get("GDC_BATCH_RELATED_CASES", "False") == "True"
+
+#: Session.info key overriding :data:`BATCH_RELATED_CASES`
+BATCH_RELATED_CASES_KEY = "gdcdatamodel.batch_related_cases"
+
+#: Session.info key holding the nodes to refresh at the end of the flush
+PENDING_RELATED_CASES_KEY = "gdcdatamodel.pending_related_cases"
+
+#: Maximum number of ids bound to a single statement
+BATCH_SIZE = 5000
+
+#: Called with (session, metrics) after each flush in which the edge
+#: hooks ran, unless overridden with
+#: :func:`set_related_cases_metrics_callback`
+RELATED_CASES_METRICS_CALLBACK = None
+
+#: Session.info key overriding :data:`RELATED_CASES_METRICS_CALLBACK`
+RELATED_CASES_METRICS_CALLBACK_KEY = "gdcdatamodel.related_cases_metrics_callback"
+
+#: Session.info key holding the metrics of the current flush
+RELATED_CASES_METRICS_KEY = "gdcdatamodel.related_cases_metrics"
+
+#: Number of nodes an edge hook may visit before the rest of its
+#: cascade is deferred to the queue table, 0 to never defer, unless
+#: overridden with :func:`set_defer_related_cases_threshold`
+DEFER_RELATED_CASES_THRESHOLD = int(
+    os.environ.get("GDC_DEFER_RELATED_CASES_THRESHOLD", "0")
+)
+
+#: Session.info key overriding :data:`DEFER_RELATED_CASES_THRESHOLD`
+DEFER_RELATED_CASES_THRESHOLD_KEY = "gdcdatamodel.defer_related_cases_threshold"
+
+Base = declarative_base()
+
+
+class RelatedCasesQueue(Base):
+    """Nodes whose trees' related cases are to be refreshed by
+    :func:`process_related_cases_queue`
+
+    """
+
+    __tablename__ = "related_cases_queue"
+
+    node_id = Column(Text, primary_key=True)
+
+    queued = Column(
+        DateTime(timezone=True),
+        nullable=False,
+        server_default=text("now()"),
+    )
+
+
+class RelatedCasesDeferred(Exception):
+    """Raised to stop a cascade that visited more nodes than the defer
+    threshold
+
+    """
+
 
 def get_related_case_edge_cls(node):
     """Returns the Edge class for related cases of a given node
@@ -53,7 +146,8 @@ def get_related_case_edge_cls_name(node):
 
     """
 
-    return f"{node.__class__.__name__}RelatesToCase"
+    node_cls = node if isinstance(node, type) else node.__class__
+    return f"{node_cls.__name__}RelatesToCase"
 
 
 def get_edge_src(edge):
@@ -151,7 +245,7 @@ def related_cases_from_parents(node):
 
 
 def cache_related_cases_recursive(
-    node, session, flush_context, instances, visited_nodes=None
+    node, session, flush_context, instances, visited_nodes=None, depth=0
 ):
     """Update the related case cache on source node and its children
     recursively iff the this update changes the related case source
@@ -165,6 +259,9 @@ def cache_related_cases_recursive(
         Usually None, this is the collection of objects which can be
         passed to the Session.flush() method (note this usage is
         deprecated).
+    :raises RelatedCasesDeferred:
+        If more nodes than the defer threshold of the session are
+        visited
 
     """
 
@@ -182,6 +279,15 @@ def cache_related_cases_recursive(
 
     visited_nodes.add(node.node_id)
 
+    metrics = session.info.get(RELATED_CASES_METRICS_KEY)
+    if metrics is not None:
+        metrics["nodes_visited"] += 1
+        metrics["max_depth"] = max(metrics["max_depth"], depth)
+
+    threshold = get_defer_related_cases_threshold(session)
+    if threshold and len(visited_nodes) > threshold:
+        raise RelatedCasesDeferred(node.node_id)
+
     # These are the cases that are currently connected by a shortcut edge
     current_cases = {c.node_id: c for c in related_cases_from_cache(node)}
 
@@ -207,6 +313,7 @@ def cache_related_cases_recursive(
             flush_context,
             instances,
             visited_nodes,
+            depth + 1,
         )
 
     return
@@ -241,6 +348,41 @@ def update_cache_edges(node, session, correct_cases):
         assoc_proxy.append(case)
 
 
+def measure_related_cases_hook(hook):
+    """Wraps an edge hook to record its metrics, if the session has a
+    metrics callback, and to queue the cascade if it is deferred
+
+    """
+
+    @functools.wraps(hook)
+    def wrapper(target, session, flush_context, instances):
+        metrics = get_related_cases_metrics(session)
+        if metrics is None:
+            try:
+                return hook(target, session, flush_context, instances)
+            except RelatedCasesDeferred:
+                return enqueue_related_cases(target, session)
+
+        def count_query(*args):
+            metrics["queries"] += 1
+
+        connection = session.connection()
+        event.listen(connection, "before_cursor_execute", count_query)
+        start = time.perf_counter()
+        try:
+            return hook(target, session, flush_context, instances)
+        except RelatedCasesDeferred:
+            metrics["deferred"] += 1
+            return enqueue_related_cases(target, session)
+        finally:
+            metrics["hooks"] += 1
+            metrics["seconds"] += time.perf_counter() - start
+            event.remove(connection, "before_cursor_execute", count_query)
+
+    return wrapper
+
+
+@measure_related_cases_hook
 def cache_related_cases_on_insert(target, session, flush_context, instances):
     """Hook on updated edges.  Update the related case cache on source
     node and its children iff the this update changes the related case
@@ -260,6 +402,9 @@ def cache_related_cases_on_insert(target, session, flush_context, instances):
 
     """
 
+    if is_batched_related_cases(session):
+        return defer_related_cases(target, session)
+
     if not target.src:
         target.src = get_edge_src(target)
 
@@ -274,6 +419,7 @@ def cache_related_cases_on_insert(target, session, flush_context, instances):
     )
 
 
+@measure_related_cases_hook
 def cache_related_cases_on_update(target, session, flush_context, instances):
     """Hook on deleted edges.  Update the related case cache on source
     node and its children.
@@ -291,6 +437,9 @@ def cache_related_cases_on_update(target, session, flush_context, instances):
         deprecated).
 
     """
+    if is_batched_related_cases(session):
+        return defer_related_cases(target, session)
+
     cache_related_cases_recursive(
         get_edge_src(target),
         session,
@@ -299,6 +448,7 @@ def cache_related_cases_on_update(target, session, flush_context, instances):
     )
 
 
+@measure_related_cases_hook
 def cache_related_cases_on_delete(target, session, flush_context, instances):
     """Hook on deleted edges.  Update the related case cache on source
     node and its children.
@@ -316,6 +466,9 @@ def cache_related_cases_on_delete(target, session, flush_context, instances):
         deprecated).
 
     """
+    if is_batched_related_cases(session):
+        return defer_related_cases(target, session)
+
     # Remove the source and destination of application local
     # association_proxy so cache_related_cases_update_children doesn't
     # traverse the edge
@@ -326,3 +479,911 @@ def cache_related_cases_on_delete(target, session, flush_context, instances):
         flush_context,
         instances,
     )
+
+
+def enable_batched_related_cases(session, enabled=True):
+    """Maintain the related case cache of :param:`session` in batched
+    mode, see :func:`refresh_related_cases`
+
+    """
+
+    session.info[BATCH_RELATED_CASES_KEY] = enabled
+
+
+def is_batched_related_cases(session):
+    return session.info.get(BATCH_RELATED_CASES_KEY, BATCH_RELATED_CASES)
+
+
+def get_edge_src_id(target):
+    if target.src_id is not None:
+        return target.src_id
+    elif target.src is not None:
+        return target.src.node_id
+    return None
+
+
+def defer_related_cases(target, session):
+    """Record the source of edge :param:`target` to have its related
+    cases refreshed once the flush has been executed
+
+    """
+
+    src_id = get_edge_src_id(target)
+    if src_id is None:
+        return
+
+    node_cls = target.get_node_class()
+    src_cls = node_cls.get_subclass_named(target.__src_class__)
+    pending = session.info.setdefault(PENDING_RELATED_CASES_KEY, defaultdict(set))
+    pending[src_cls].add(src_id)
+
+
+def set_related_cases_metrics_callback(callback, session=None):
+    """Call :param:`callback` with (session, metrics) after each flush of
+    :param:`session`, or of all sessions, in which the edge hooks ran
+
+    """
+
+    if session is None:
+        global RELATED_CASES_METRICS_CALLBACK
+        RELATED_CASES_METRICS_CALLBACK = callback
+    else:
+        session.info[RELATED_CASES_METRICS_CALLBACK_KEY] = callback
+
+
+def get_related_cases_metrics(session):
+    """Returns the metrics of the current flush, or None if the session
+    has no metrics callback
+
+    """
+
+    callback = session.info.get(
+        RELATED_CASES_METRICS_CALLBACK_KEY, RELATED_CASES_METRICS_CALLBACK
+    )
+    if callback is None:
+        return None
+
+    return session.info.setdefault(
+        RELATED_CASES_METRICS_KEY,
+        {
+            "hooks": 0,
+            "nodes_visited": 0,
+            "max_depth": 0,
+            "queries": 0,
+            "seconds": 0.0,
+            "deferred": 0,
+        },
+    )
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def report_related_cases_metrics(session, flush_context):
+    """Call the metrics callback with the metrics of the flush"""
+
+    metrics = session.info.pop(RELATED_CASES_METRICS_KEY, None)
+    callback = session.info.get(
+        RELATED_CASES_METRICS_CALLBACK_KEY, RELATED_CASES_METRICS_CALLBACK
+    )
+    if metrics and callback is not None:
+        callback(session, metrics)
+
+
+def set_defer_related_cases_threshold(session, threshold):
+    """Defer the cascades of :param:`session` that visit more than
+    :param:`threshold` nodes, 0 to never defer
+
+    """
+
+    session.info[DEFER_RELATED_CASES_THRESHOLD_KEY] = threshold
+
+
+def get_defer_related_cases_threshold(session):
+    return session.info.get(
+        DEFER_RELATED_CASES_THRESHOLD_KEY, DEFER_RELATED_CASES_THRESHOLD
+    )
+
+
+ENQUEUE_RELATED_CASES_SQL = """
+INSERT INTO related_cases_queue (node_id) VALUES (:node_id)
+ON CONFLICT (node_id) DO NOTHING
+"""
+
+DEQUEUE_RELATED_CASES_SQL = """
+DELETE FROM related_cases_queue
+WHERE node_id IN (
+    SELECT node_id FROM related_cases_queue
+    ORDER BY queued
+    LIMIT :limit
+    FOR UPDATE SKIP LOCKED)
+RETURNING node_id
+"""
+
+
+def enqueue_related_cases(target, session):
+    """Queue the source of edge :param:`target` to have the related cases
+    of its tree refreshed by :func:`process_related_cases_queue`
+
+    """
+
+    src_id = get_edge_src_id(target)
+    if src_id is None:
+        return
+
+    logger.info("Deferring the related cases of %s", src_id)
+    session.execute(text(ENQUEUE_RELATED_CASES_SQL), {"node_id": src_id})
+
+
+def process_related_cases_queue(session, limit=BATCH_SIZE):
+    """Refresh the trees of up to :param:`limit` queued nodes with
+    :func:`refresh_related_case_trees`.  Concurrent workers skip the
+    nodes being refreshed by each other.
+
+    :returns: dict of counts of ``dequeued`` nodes, ``nodes`` in their
+        trees, ``inserted`` and ``deleted`` shortcut edges
+
+    """
+
+    node_ids = [
+        row[0]
+        for row in session.execute(text(DEQUEUE_RELATED_CASES_SQL), {"limit": limit})
+    ]
+    if not node_ids:
+        return {"dequeued": 0, "nodes": 0, "inserted": 0, "deleted": 0}
+
+    counts = refresh_related_case_trees(session, node_ids)
+    counts["dequeued"] = len(node_ids)
+    return counts
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def refresh_deferred_related_cases(session, flush_context):
+    """Refresh the related cases recorded by :func:`defer_related_cases`
+    during the flush
+
+    """
+
+    pending = session.info.pop(PENDING_RELATED_CASES_KEY, None)
+    if pending:
+        refresh_related_cases(session, pending)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def clear_deferred_related_cases(session, previous_transaction):
+    """Drop the sources recorded by :func:`defer_related_cases` during a
+    flush that failed before their related cases were refreshed
+
+    """
+
+    session.info.pop(PENDING_RELATED_CASES_KEY, None)
+
+
+def chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i : i + size]
+
+
+def is_related_case_edge(edge_cls):
+    return getattr(edge_cls, "__src_dst_assoc__", None) == RELATED_CASES_LINK_NAME
+
+
+def get_lineage_edge_classes(node_cls):
+    """Returns the edge classes out of and into :param:`node_cls`,
+    excluding case shortcut edges
+
+    :returns: tuple of (edges_out, edges_in)
+
+    """
+
+    edge_cls = node_cls.get_edge_class()
+    edges_out = [
+        edge
+        for edge in edge_cls._get_edges_with_src(node_cls.__name__)
+        if not is_related_case_edge(edge)
+    ]
+    edges_in = [
+        edge
+        for edge in edge_cls._get_edges_with_dst(node_cls.__name__)
+        if not is_related_case_edge(edge)
+    ]
+    return edges_out, edges_in
+
+
+def get_edge_node_cls(edge_cls, direction):
+    """Returns the class of the src (``direction="src"``) or dst node of
+    an edge class
+
+    """
+
+    name = edge_cls.__src_class__ if direction == "src" else edge_cls.__dst_class__
+    return edge_cls.get_node_class().get_subclass_named(name)
+
+
+def select_edges(conn, edge_cls, column, ids):
+    """Yields (src_id, dst_id) of edges whose :param:`column` is in
+    :param:`ids`
+
+    """
+
+    table = edge_cls.__table__
+    for chunk in chunks(ids):
+        query = select([table.c.src_id, table.c.dst_id]).where(
+            table.c[column].in_(chunk)
+        )
+        yield from conn.execute(query)
+
+
+def select_cached_cases(conn, node_cls, ids):
+    """Returns {node_id: {case_id}} from the shortcut edges of :param:`ids`"""
+
+    cached = defaultdict(set)
+    if hasattr(node_cls, RELATED_CASES_LINK_NAME):
+        edge_cls = get_related_case_edge_cls(node_cls)
+        for src_id, dst_id in select_edges(conn, edge_cls, "src_id", ids):
+            cached[src_id].add(dst_id)
+    return cached
+
+
+def select_existing(conn, node_cls, ids):
+    table = node_cls.__table__
+    existing = set()
+    for chunk in chunks(ids):
+        query = select([table.c.node_id]).where(table.c.node_id.in_(chunk))
+        existing.update(row[0] for row in conn.execute(query))
+    return existing
+
+
+def get_descendants(conn, seeds):
+    """Walk edges into :param:`seeds` to find every node whose related
+    cases may depend on them.  Nodes without a case cache are not
+    descended into.
+
+    :param seeds: {node class: iterable of node ids}
+    :returns:
+        tuple of ({node class: {node ids}}, {(class, id): {(class, id)}})
+        of the closure and the children of each node in it
+
+    """
+
+    closure = defaultdict(set)
+    children = defaultdict(set)
+
+    frontier = {cls: set(ids) for cls, ids in seeds.items()}
+    while frontier:
+        next_frontier = defaultdict(set)
+        for cls, ids in frontier.items():
+            ids = ids - closure[cls]
+            if not ids or not hasattr(cls, RELATED_CASES_LINK_NAME):
+                continue
+
+            closure[cls].update(ids)
+            for edge_cls in get_lineage_edge_classes(cls)[1]:
+                src_cls = get_edge_node_cls(edge_cls, "src")
+                if not hasattr(src_cls, RELATED_CASES_LINK_NAME):
+                    continue
+                for src_id, dst_id in select_edges(conn, edge_cls, "dst_id", ids):
+                    children[(cls, dst_id)].add((src_cls, src_id))
+                    next_frontier[src_cls].add(src_id)
+
+        frontier = next_frontier
+
+    return closure, children
+
+
+def get_parents(conn, closure):
+    """Returns {(class, id): {(class, id)}} of the parents of every node
+    in :param:`closure`
+
+    """
+
+    parents = defaultdict(set)
+    for cls, ids in closure.items():
+        for edge_cls in get_lineage_edge_classes(cls)[0]:
+            dst_cls = get_edge_node_cls(edge_cls, "dst")
+            for src_id, dst_id in select_edges(conn, edge_cls, "src_id", ids):
+                parents[(cls, src_id)].add((dst_cls, dst_id))
+    return parents
+
+
+def topological_order(nodes, parents):
+    """Order :param:`nodes` such that every node follows its parents.
+    Nodes on a cycle are appended in arbitrary order.
+
+    """
+
+    nodes = set(nodes)
+    pending_parents = {
+        node: {parent for parent in parents[node] if parent in nodes} for node in nodes
+    }
+
+    children = defaultdict(set)
+    for node, node_parents in pending_parents.items():
+        for parent in node_parents:
+            children[parent].add(node)
+
+    ready = [node for node, node_parents in pending_parents.items() if not node_parents]
+    order = []
+    while ready:
+        node = ready.pop()
+        order.append(node)
+        for child in children[node]:
+            pending_parents[child].discard(node)
+            if not pending_parents[child]:
+                ready.append(child)
+
+    ordered = set(order)
+    order.extend(node for node in nodes if node not in ordered)
+    return order
+
+
+def refresh_related_cases(session, seeds, prune=True):
+    """Recompute the case shortcut edges of :param:`seeds` and their
+    descendants with a fixed number of statements per class instead of
+    walking the graph through the ORM.
+
+    The result matches :func:`cache_related_cases_recursive`: the
+    related cases of a node are the cases it links to plus the cached
+    related cases of its parents.  Nodes are visited in topological
+    order so parents are always up to date before their children.
+
+    The shortcut edges are written with core statements, so no session
+    hooks fire.  Loaded instances whose cache changed are expired.
+
+    :param session: The session to execute in
+    :param seeds: {node class: iterable of node ids} to recompute
+    :param prune:
+        If True, like the per-edge hooks, descendants are only
+        recomputed if one of their parents' related cases changed.  If
+        False, every node in the closure is recomputed, repairing
+        stale caches.
+    :returns: dict of counts of ``nodes`` visited, ``inserted`` and
+        ``deleted`` shortcut edges
+
+    """
+
+    conn = session.connection()
+    seeds = {
+        cls: select_existing(conn, cls, ids)
+        for cls, ids in seeds.items()
+        if hasattr(cls, RELATED_CASES_LINK_NAME)
+    }
+
+    closure, _ = get_descendants(conn, seeds)
+    parents = get_parents(conn, closure)
+
+    current = {}
+    for cls, ids in closure.items():
+        cached = select_cached_cases(conn, cls, ids)
+        current.update({(cls, node_id): cached[node_id] for node_id in ids})
+
+    # Cached cases of parents outside of the closure
+    outside = defaultdict(set)
+    for node_parents in parents.values():
+        for parent in node_parents:
+            if parent not in current:
+                outside[parent[0]].add(parent[1])
+
+    external = {}
+    for cls, ids in outside.items():
+        cached = select_cached_cases(conn, cls, ids)
+        external.update({(cls, node_id): cached[node_id] for node_id in ids})
+
+    seeded = {(cls, node_id) for cls, ids in seeds.items() for node_id in ids}
+    updated = {}
+    changed = set()
+
+    for node in topological_order(current, parents):
+        stale = not prune or node in seeded or parents[node] & changed
+        if not stale:
+            updated[node] = current[node]
+            continue
+
+        cases = set()
+        for parent in parents[node]:
+            parent_cls, parent_id = parent
+            if parent_cls.get_label() == "case":
+                cases.add(parent_id)
+            cases.update(updated.get(parent, external.get(parent, ())))
+
+        updated[node] = cases
+        if cases != current[node]:
+            changed.add(node)
+
+    counts = {"nodes": len(current), "inserted": 0, "deleted": 0}
+    for cls in closure:
+        inserts = [
+            (node_id, case_id)
+            for (node_cls, node_id) in changed
+            if node_cls is cls
+            for case_id in updated[(cls, node_id)] - current[(cls, node_id)]
+        ]
+        deletes = [
+            (node_id, case_id)
+            for (node_cls, node_id) in changed
+            if node_cls is cls
+            for case_id in current[(cls, node_id)] - updated[(cls, node_id)]
+        ]
+        edge_cls = get_related_case_edge_cls(cls)
+        counts["inserted"] += insert_cache_edges(conn, edge_cls, inserts)
+        counts["deleted"] += delete_cache_edges(conn, edge_cls, deletes)
+
+    expire_related_cases(session, {node_id for _, node_id in changed})
+    return counts
+
+
+def insert_cache_edges(conn, edge_cls, pairs):
+    """Insert shortcut edges for (src_id, case_id) :param:`pairs`"""
+
+    table = edge_cls.__table__
+    for chunk in chunks(pairs):
+        conn.execute(
+            table.insert(),
+            [
+                {
+                    "src_id": src_id,
+                    "dst_id": dst_id,
+                    "_props": {},
+                    "_sysan": {},
+                    "acl": [],
+                }
+                for src_id, dst_id in chunk
+            ],
+        )
+    return len(pairs)
+
+
+def delete_cache_edges(conn, edge_cls, pairs):
+    """Delete shortcut edges for (src_id, case_id) :param:`pairs`"""
+
+    table = edge_cls.__table__
+    for chunk in chunks(pairs):
+        conn.execute(
+            table.delete().where(tuple_(table.c.src_id, table.c.dst_id).in_(chunk))
+        )
+    return len(pairs)
+
+
+def expire_related_cases(session, node_ids):
+    """Expire the case shortcut collections of loaded instances, and
+    remove shortcut edge instances that may have been deleted from the
+    session, after the related cases of :param:`node_ids` changed
+
+    """
+
+    if not node_ids:
+        return
+
+    for instance in list(session.identity_map.values()):
+        if is_related_case_edge(type(instance)):
+            if instance.src_id in node_ids:
+                session.expunge(instance)
+
+        elif getattr(instance, "node_id", None) in node_ids:
+            if hasattr(instance, RELATED_CASES_LINK_NAME):
+                edge_name = get_related_case_edge_cls_name(instance)
+                session.expire(instance, [f"_{edge_name}_out"])
+
+        elif getattr(instance, "label", None) == "case":
+            session.expire(
+                instance,
+                [
+                    f"_{edge.__name__}_in"
+                    for edge in instance.get_edge_class().get_subclasses()
+                    if is_related_case_edge(edge)
+                ],
+            )
+
+
+RECONCILE_RELATED_CASES_SQL = """
+WITH RECURSIVE lineage_edges (src_id, dst_id, dst_is_case) AS (
+    {lineage_edges}
+), scope AS (
+    SELECT node_id FROM {node_table}{sample} WHERE {scope}
+), lineage (node_id, ancestor_id, is_case) AS (
+        SELECT node_id, node_id, FALSE FROM scope
+    UNION
+        SELECT lineage.node_id, lineage_edges.dst_id, lineage_edges.dst_is_case
+        FROM lineage
+        JOIN lineage_edges ON lineage_edges.src_id = lineage.ancestor_id
+        WHERE NOT lineage.is_case
+), expected AS (
+    SELECT DISTINCT node_id AS src_id, ancestor_id AS dst_id
+    FROM lineage
+    WHERE is_case
+), missing AS (
+    SELECT src_id, dst_id FROM expected
+    WHERE NOT EXISTS (
+        SELECT 1 FROM {cache_table}
+        WHERE {cache_table}.src_id = expected.src_id
+        AND   {cache_table}.dst_id = expected.dst_id)
+), stale AS (
+    SELECT src_id, dst_id FROM {cache_table}
+    WHERE src_id IN (SELECT node_id FROM scope)
+    AND NOT EXISTS (
+        SELECT 1 FROM expected
+        WHERE expected.src_id = {cache_table}.src_id
+        AND   expected.dst_id = {cache_table}.dst_id){apply}
+){select}
+"""
+
+#: Final select of the reconcile statement, counting the differences
+RECONCILE_COUNT_SQL = """
+SELECT (SELECT count(*) FROM missing) AS missing,
+       (SELECT count(*) FROM stale)   AS stale"""
+
+#: Final select of the reconcile statement, listing the differences
+RECONCILE_DIFF_SQL = """
+SELECT 'missing' AS kind, src_id, dst_id FROM missing
+UNION ALL
+SELECT 'extra' AS kind, src_id, dst_id FROM stale
+ORDER BY kind, src_id, dst_id"""
+
+#: Final select of the reconcile statement, counting the differences and
+#: listing the nodes whose shortcut edges change
+RECONCILE_CHANGED_SQL = """
+SELECT (SELECT count(*) FROM missing) AS missing,
+       (SELECT count(*) FROM stale)   AS stale,
+       ARRAY(SELECT src_id FROM missing UNION SELECT src_id FROM stale) AS src_ids"""
+
+RECONCILE_APPLY_SQL = """
+), inserted AS (
+    INSERT INTO {cache_table} (src_id, dst_id, _props, _sysan, acl)
+    SELECT src_id, dst_id, '{{}}'::jsonb, '{{}}'::jsonb, '{{}}'::text[]
+    FROM missing
+    RETURNING 1
+), deleted AS (
+    DELETE FROM {cache_table} USING stale
+    WHERE {cache_table}.src_id = stale.src_id
+    AND   {cache_table}.dst_id = stale.dst_id
+    RETURNING 1"""
+
+
+def get_case_lineage_edges(node_cls):
+    """Returns the edges, from the ``_pg_links`` of each class, on any
+    path from :param:`node_cls` to ``case`` that only passes through
+    classes with a case cache, i.e. the edges
+    :func:`related_cases_from_parents` follows
+
+    :returns: list of (edge class, whether the edge's dst is ``case``)
+
+    """
+
+    lineage_edges = []
+    visited = set()
+    to_visit = [node_cls]
+    while to_visit:
+        cls = to_visit.pop()
+        if cls in visited:
+            continue
+        visited.add(cls)
+
+        for link in cls._pg_links.values():
+            edge_cls = getattr(cls, link["edge_out"]).property.mapper.class_
+            dst_cls = link["dst_type"]
+            if dst_cls.get_label() == "case":
+                lineage_edges.append((edge_cls, True))
+            elif hasattr(dst_cls, RELATED_CASES_LINK_NAME):
+                lineage_edges.append((edge_cls, False))
+                to_visit.append(dst_cls)
+
+    return lineage_edges
+
+
+def get_reconcile_related_cases_sql(
+    node_cls, scope="TRUE", dry_run=False, sample=None, select=RECONCILE_COUNT_SQL
+):
+    """Returns the statement that recomputes the case shortcut edges of
+    :param:`node_cls` nodes matching :param:`scope` with a recursive
+    CTE over the lineage edge tables, and returns the number of
+    ``missing`` and ``stale`` edges.  Unless :param:`dry_run`, missing
+    edges are inserted and stale edges deleted.
+
+    :param sample: Only recompute this percentage of the node table,
+        sampled by page with ``TABLESAMPLE SYSTEM``
+    :param select: The final select over the ``missing`` and ``stale``
+        CTEs, e.g. :data:`RECONCILE_DIFF_SQL` to list the differences
+
+    """
+
+    cache_table = get_related_case_edge_cls(node_cls).__tablename__
+    lineage_edges = [
+        f"SELECT src_id, dst_id, {str(is_case).upper()} FROM {edge_cls.__tablename__}"
+        for edge_cls, is_case in get_case_lineage_edges(node_cls)
+    ] or ["SELECT NULL::text, NULL::text, FALSE WHERE FALSE"]
+
+    apply = "" if dry_run else RECONCILE_APPLY_SQL.format(cache_table=cache_table)
+    sample = "" if sample is None else f" TABLESAMPLE SYSTEM ({float(sample)})"
+
+    return RECONCILE_RELATED_CASES_SQL.format(
+        lineage_edges="\n    UNION ALL ".join(lineage_edges),
+        node_table=node_cls.__tablename__,
+        sample=sample,
+        cache_table=cache_table,
+        scope=scope,
+        apply=apply,
+        select=select,
+    )
+
+
+def reconcile_related_cases(
+    session, project_id=None, node_ids=None, dry_run=False, node_cls=None
+):
+    """Recompute the case shortcut edges entirely inside Postgres,
+    inserting missing and deleting stale edges, with one statement per
+    case shortcut table.  No session hooks fire.
+
+    Without :param:`project_id` or :param:`node_ids` every node in the
+    database is reconciled.
+
+    :param session: The session to execute in
+    :param project_id: Only reconcile nodes with this ``project_id``
+    :param node_ids: Only reconcile nodes with these ids
+    :param dry_run: Only count the difference
+    :param node_cls: The abstract Node class of the models' namespace
+    :returns: {label: {"missing": count, "stale": count}} for each class
+        that has differences
+
+    """
+
+    scope, params = ["TRUE"], {}
+    if project_id is not None:
+        scope.append("_props->>'project_id' = :project_id")
+        params["project_id"] = project_id
+    if node_ids is not None:
+        scope.append("node_id = ANY(:node_ids)")
+        params["node_ids"] = list(node_ids)
+
+    return reconcile_related_cases_in_scope(
+        session, " AND ".join(scope), params, dry_run, node_cls
+    )
+
+
+def reconcile_related_cases_in_scope(
+    session, scope, params=None, dry_run=False, node_cls=None
+):
+    """Like :func:`reconcile_related_cases` for the nodes of each class
+    matching the SQL condition :param:`scope`, bound with
+    :param:`params`
+
+    Pending changes are flushed first so that the statements see them,
+    and only the loaded shortcut edges of the nodes that changed are
+    expired afterwards.
+
+    """
+
+    from psqlgraph import Node
+
+    node_cls = node_cls or Node
+
+    session.flush()
+
+    diff, changed = {}, set()
+    for cls in node_cls.get_subclasses():
+        if not hasattr(cls, RELATED_CASES_LINK_NAME):
+            continue
+
+        if dry_run:
+            statement = get_reconcile_related_cases_sql(cls, scope, dry_run)
+            missing, stale = session.execute(text(statement), params or {}).fetchone()
+        else:
+            statement = get_reconcile_related_cases_sql(
+                cls, scope, select=RECONCILE_CHANGED_SQL
+            )
+            missing, stale, src_ids = session.execute(
+                text(statement), params or {}
+            ).fetchone()
+            changed.update(src_ids)
+        logger.debug("%s: %d missing, %d stale", cls.get_label(), missing, stale)
+
+        if missing or stale:
+            diff[cls.get_label()] = {"missing": missing, "stale": stale}
+
+    expire_related_cases(session, changed)
+
+    return diff
+
+
+#: Temporary table holding the closure of :func:`refresh_related_case_trees`
+CLOSURE_TABLE = "related_case_closure"
+
+CREATE_CLOSURE_SQL = """
+DROP TABLE IF EXISTS {closure_table};
+CREATE TEMPORARY TABLE {closure_table} (node_id TEXT PRIMARY KEY) ON COMMIT DROP
+"""
+
+INSERT_CLOSURE_SQL = """
+INSERT INTO {closure_table}
+WITH RECURSIVE lineage_edges (src_id, dst_id) AS (
+    {lineage_edges}
+), closure (node_id) AS (
+        SELECT unnest(CAST(:root_ids AS text[]))
+    UNION
+        SELECT lineage_edges.src_id
+        FROM closure
+        JOIN lineage_edges ON lineage_edges.dst_id = closure.node_id
+)
+SELECT node_id FROM closure
+"""
+
+
+def get_related_case_closure_sql(node_cls):
+    """Returns the statement inserting the ids of the roots (bound as
+    ``root_ids``) and of every node whose related cases are derived
+    through them into :data:`CLOSURE_TABLE`
+
+    """
+
+    tables = {
+        edge_cls.__tablename__
+        for cls in node_cls.get_subclasses()
+        if hasattr(cls, RELATED_CASES_LINK_NAME)
+        for edge_cls, _ in get_case_lineage_edges(cls)
+    }
+    lineage_edges = [
+        f"SELECT src_id, dst_id FROM {table}" for table in sorted(tables)
+    ] or ["SELECT NULL::text, NULL::text WHERE FALSE"]
+
+    return INSERT_CLOSURE_SQL.format(
+        closure_table=CLOSURE_TABLE,
+        lineage_edges="\n    UNION ALL ".join(lineage_edges),
+    )
+
+
+def refresh_related_case_trees(session, root_ids, dry_run=False, node_cls=None):
+    """Recompute the case shortcut edges of :param:`root_ids` and all of
+    their descendants with set-based statements: the closure is
+    computed once into a temporary table, then each case shortcut
+    table is reconciled against it with one statement.  No session
+    hooks fire.
+
+    The roots can be of any label, e.g. the ``case`` of a tree.
+
+    :param session: The session to execute in
+    :param root_ids: Ids of the nodes whose trees to refresh
+    :param dry_run: Only count the difference
+    :param node_cls: The abstract Node class of the models' namespace
+    :returns: dict of counts of ``nodes`` in the closure, ``inserted``
+        and ``deleted`` shortcut edges
+
+    """
+
+    from psqlgraph import Node
+
+    node_cls = node_cls or Node
+
+    session.flush()
+
+    session.execute(text(CREATE_CLOSURE_SQL.format(closure_table=CLOSURE_TABLE)))
+    nodes = session.execute(
+        text(get_related_case_closure_sql(node_cls)), {"root_ids": list(root_ids)}
+    ).rowcount
+    session.execute(text(f"ANALYZE {CLOSURE_TABLE}"))
+
+    diff = reconcile_related_cases_in_scope(
+        session,
+        f"node_id IN (SELECT node_id FROM {CLOSURE_TABLE})",
+        dry_run=dry_run,
+        node_cls=node_cls,
+    )
+    session.execute(text(f"DROP TABLE {CLOSURE_TABLE}"))
+
+    return {
+        "nodes": nodes,
+        "inserted": sum(counts["missing"] for counts in diff.values()),
+        "deleted": sum(counts["stale"] for counts in diff.values()),
+    }
+
+
+REPAIR_INSERT_SQL = """
+INSERT INTO {cache_table} (src_id, dst_id, _props, _sysan, acl)
+SELECT src_id, dst_id, '{{}}'::jsonb, '{{}}'::jsonb, '{{}}'::text[]
+FROM unnest(CAST(:src_ids AS text[]), CAST(:dst_ids AS text[])) AS diff (src_id, dst_id)
+ON CONFLICT DO NOTHING
+"""
+
+REPAIR_DELETE_SQL = """
+DELETE FROM {cache_table}
+USING unnest(CAST(:src_ids AS text[]), CAST(:dst_ids AS text[])) AS diff (src_id, dst_id)
+WHERE {cache_table}.src_id = diff.src_id
+AND   {cache_table}.dst_id = diff.dst_id
+"""
+
+
+def audit_related_cases(session, labels=None, sample=None, node_cls=None):
+    """Compare the case shortcut edges of each class against the related
+    cases derived inside Postgres from the lineage edge tables, without
+    modifying either.
+
+    :param session: The session to execute in
+    :param labels: Only audit the classes with these labels
+    :param sample: Only audit this percentage of each node table
+    :param node_cls: The abstract Node class of the models' namespace
+    :returns: {label: {"missing": [(src_id, case_id)], "extra": [...]}}
+        for each class that has differences
+
+    """
+
+    from psqlgraph import Node
+
+    node_cls = node_cls or Node
+
+    diff = {}
+    for cls in node_cls.get_subclasses():
+        if not hasattr(cls, RELATED_CASES_LINK_NAME):
+            continue
+        if labels is not None and cls.get_label() not in labels:
+            continue
+
+        statement = text(
+            get_reconcile_related_cases_sql(
+                cls, dry_run=True, sample=sample, select=RECONCILE_DIFF_SQL
+            )
+        )
+        edges = {"missing": [], "extra": []}
+        for kind, src_id, dst_id in session.execute(statement):
+            edges[kind].append((src_id, dst_id))
+
+        logger.debug(
+            "%s: %d missing, %d extra",
+            cls.get_label(),
+            len(edges["missing"]),
+            len(edges["extra"]),
+        )
+        if edges["missing"] or edges["extra"]:
+            diff[cls.get_label()] = edges
+
+    return diff
+
+
+def repair_related_cases(session, label, missing=(), extra=(), node_cls=None):
+    """Insert the :param:`missing` and delete the :param:`extra`
+    (src_id, case_id) shortcut edges of the class with :param:`label`,
+    e.g. one batch of the diff from :func:`audit_related_cases`.  No
+    session hooks fire.
+
+    The batch is first checked against the current lineage of its
+    nodes, and only the edges that are still missing or extra are
+    applied.  Edges fixed since the audit are skipped.  So are edges
+    whose nodes were deleted or re-linked since.  A diff can therefore
+    be applied more than once, and from an old report.
+
+    :returns: tuple of the number of edges (inserted, deleted)
+
+    """
+
+    from psqlgraph import Node
+
+    cls = (node_cls or Node).get_subclass(label)
+    cache_table = get_related_case_edge_cls(cls).__tablename__
+
+    current = {"missing": set(), "extra": set()}
+    src_ids = {src_id for src_id, _ in missing} | {src_id for src_id, _ in extra}
+    if src_ids:
+        statement = get_reconcile_related_cases_sql(
+            cls, "node_id = ANY(:node_ids)", dry_run=True, select=RECONCILE_DIFF_SQL
+        )
+        params = {"node_ids": sorted(src_ids)}
+        for kind, src_id, dst_id in session.execute(text(statement), params):
+            current[kind].add((src_id, dst_id))
+
+    missing = [edge for edge in missing if tuple(edge) in current["missing"]]
+    extra = [edge for edge in extra if tuple(edge) in current["extra"]]
+
+    inserted = deleted = 0
+    if missing:
+        src_ids, dst_ids = zip(*missing)
+        inserted = session.execute(
+            text(REPAIR_INSERT_SQL.format(cache_table=cache_table)),
+            {"src_ids": list(src_ids), "dst_ids": list(dst_ids)},
+        ).rowcount
+    if extra:
+        src_ids, dst_ids = zip(*extra)
+        deleted = session.execute(
+            text(REPAIR_DELETE_SQL.format(cache_table=cache_table)),
+            {"src_ids": list(src_ids), "dst_ids": list(dst_ids)},
+        ).rowcount
+
+    expire_related_cases(
+        session, {src_id for src_id, _ in missing} | {src_id for src_id, _ in extra}
+    )
+    return inserted, deleted
@@ -5,7 +5,7 @@
 Specialization of PsqlGraph Node/Edge indexes specific to the GDC datamodel.
 
 This module can be used to inject indexes into Node classes for common
-query patterns (e.g. secondary_keys).
+query patterns (e.g. secondary_keys, version tags).
 
 """
 
@@ -85,6 +85,31 @@ def get_secondary_key_indexes(cls):
     return tuple(key_indexes) + tuple(lower_key_indexes)
 
 
+def get_tag_indexes(cls):
+    """Returns tuple of indexes used to look up the versions of a tag
+    on a class with ``tagProperties``
+
+    - cls._sysan["tag"].astext
+
+    """
+
+    tag = cls._sysan["tag"].astext.label("tag")
+    return (Index(index_name(cls, "tag"), tag),)
+
+
+def get_index_names(cls):
+    """Returns the names of the secondary key and tag indexes the GDC
+    datamodel may add to the class
+
+    """
+
+    secondary_keys = {key for pair in cls.__pg_secondary_keys for key in pair}
+    names = {index_name(cls, "tag")}
+    for key in secondary_keys:
+        names.update({index_name(cls, key), index_name(cls, key + "_lower")})
+    return names
+
+
 def cls_add_indexes(cls, indexes):
     """Add indexes to given class"""
 
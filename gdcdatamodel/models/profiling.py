@@ -0,0 +1,183 @@
+"""gdcdatamodel.models.profiling
+----------------------------------
+
+Opt-in instrumentation of :func:`gdcdatamodel.models.load_dictionary`.
+
+When enabled, wall time and net allocated memory (as traced by
+:mod:`tracemalloc`) are recorded for each loading phase and for each
+generated Node and Edge class.  Phases may nest
+(e.g. ``cls_add_indexes`` runs within ``load_nodes``), in which case
+the inner phase is also counted in its parent.
+
+Set ``PROFILE_GDC_DICTIONARY=True`` before importing
+:mod:`gdcdatamodel.models` to profile the import time load, or call
+``profile.enable()`` before calling ``load_dictionary()``.  The report
+can be printed with::
+
+    python -m gdcdatamodel --profile-startup
+
+"""
+
+import contextlib
+import os
+import time
+import tracemalloc
+
+#: Environment variable enabling profiling at import time
+PROFILE_ENV = "PROFILE_GDC_DICTIONARY"
+
+
+class StartupProfile:
+    """Collects timings of dictionary loading"""
+
+    def __init__(self, enabled=False):
+        self.enabled = False
+        self._started_tracing = False
+        self.reset()
+        if enabled:
+            self.enable()
+
+    def enable(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self.enabled = True
+
+    def disable(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        self.enabled = False
+
+    def reset(self):
+        #: phase name -> {"parent", "calls", "seconds", "allocated_bytes"}
+        self.phases = {}
+        #: [{"name", "kind", "namespace", "seconds", "allocated_bytes"}]
+        self.classes = []
+        self._stack = []
+
+    @contextlib.contextmanager
+    def _measure(self):
+        usage = {}
+        start_time = time.perf_counter()
+        start_mem = tracemalloc.get_traced_memory()[0]
+        try:
+            yield usage
+        finally:
+            usage["seconds"] = time.perf_counter() - start_time
+            usage["allocated_bytes"] = tracemalloc.get_traced_memory()[0] - start_mem
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Record the time spent in a loading phase.  Repeated calls are
+        accumulated.
+
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(name)
+        try:
+            with self._measure() as usage:
+                yield
+        finally:
+            self._stack.pop()
+
+        stats = self.phases.setdefault(
+            name,
+            {"parent": parent, "calls": 0, "seconds": 0.0, "allocated_bytes": 0},
+        )
+        stats["calls"] += 1
+        stats["seconds"] += usage["seconds"]
+        stats["allocated_bytes"] += usage["allocated_bytes"]
+
+    @contextlib.contextmanager
+    def cls(self, name, kind, package_namespace=None):
+        """Record the time spent generating a single class
+
+        :param kind: "node" or "edge"
+
+        """
+
+        if not self.enabled:
+            yield
+            return
+
+        with self._measure() as usage:
+            yield
+
+        self.classes.append(
+            dict(usage, name=name, kind=kind, namespace=package_namespace)
+        )
+
+    def report(self):
+        """Returns the structured report::
+
+        {
+            "total_seconds": <time spent in top level phases>,
+            "total_allocated_bytes": <memory allocated in top level phases>,
+            "phases": [{"name", "parent", "calls", "seconds", "allocated_bytes"}],
+            "classes": [{"name", "kind", "namespace", "seconds", "allocated_bytes"}],
+        }
+
+        Classes are sorted slowest first.
+
+        """
+
+        phases = [dict(stats, name=name) for name, stats in self.phases.items()]
+        top_level = [phase for phase in phases if phase["parent"] is None]
+
+        return {
+            "total_seconds": sum(phase["seconds"] for phase in top_level),
+            "total_allocated_bytes": sum(
+                phase["allocated_bytes"] for phase in top_level
+            ),
+            "phases": phases,
+            "classes": sorted(self.classes, key=lambda c: c["seconds"], reverse=True),
+        }
+
+
+def format_report(report, limit=20):
+    """Returns a human readable rendering of :meth:`StartupProfile.report`
+
+    :param limit: how many of the slowest classes to include
+
+    """
+
+    lines = [
+        "Dictionary load: {:.3f}s, {:.1f} MiB".format(
+            report["total_seconds"], report["total_allocated_bytes"] / 2**20
+        ),
+        "",
+        "{:<30} {:>6} {:>10} {:>12}".format("phase", "calls", "seconds", "KiB"),
+    ]
+
+    for phase in report["phases"]:
+        name = phase["name"] if phase["parent"] is None else "  " + phase["name"]
+        lines.append(
+            "{:<30} {:>6} {:>10.3f} {:>12.1f}".format(
+                name, phase["calls"], phase["seconds"], phase["allocated_bytes"] / 1024
+            )
+        )
+
+    classes = report["classes"]
+    lines += [
+        "",
+        f"Slowest {min(limit, len(classes))} of {len(classes)} classes:",
+        "{:<50} {:>6} {:>10} {:>12}".format("class", "kind", "seconds", "KiB"),
+    ]
+    for cls in classes[:limit]:
+        lines.append(
+            "{:<50} {:>6} {:>10.3f} {:>12.1f}".format(
+                cls["name"], cls["kind"], cls["seconds"], cls["allocated_bytes"] / 1024
+            )
+        )
+
+    return "\n".join(lines)
+
+
+#: The profile load_dictionary records to
+profile = StartupProfile(enabled=os.environ.get(PROFILE_ENV, "False") == "True")
@@ -0,0 +1,137 @@
+"""gdcdatamodel.models.spec_cache
+----------------------------------
+
+Persist the resolved class specs produced by
+:func:`gdcdatamodel.models.compile_dictionary` so that processes
+importing :mod:`gdcdatamodel.models` can build the ORM classes without
+walking the dictionary schema.
+
+An artifact is a JSON document holding the spec format version and a
+hash of the dictionary it was compiled from.  If either no longer
+matches, the artifact is deleted and recompiled on the next load.
+
+Caching is enabled by pointing ``GDC_DICTIONARY_SPEC_CACHE`` at a
+writable directory.  To build the artifact ahead of time (e.g. in a
+docker build step)::
+
+    LOAD_GDC_DICTIONARY=False python -m gdcdatamodel.models.spec_cache <dir>
+
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+#: Bump this whenever the layout of a compiled spec, or the way it
+#: is compiled, changes.  Artifacts written with another version are
+#: discarded.
+SPEC_VERSION = 1
+
+#: Environment variable naming the directory artifacts are kept in
+SPEC_CACHE_ENV = "GDC_DICTIONARY_SPEC_CACHE"
+
+
+def dictionary_hash(dictionary):
+    """Returns a hex digest identifying the content of a dictionary
+
+    :param dictionary: gdc dictionary or an extension of it
+
+    """
+
+    content = json.dumps(dictionary.schema, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_spec_path(cache_dir, package_namespace=None):
+    """Returns the artifact path for the dictionary loaded into
+    :param:`package_namespace`
+
+    """
+
+    return os.path.join(cache_dir, f"{package_namespace or 'default'}.spec.json")
+
+
+def discard_spec(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def read_spec(path, digest):
+    """Returns the spec stored at :param:`path` or None.  Artifacts that
+    are unreadable, of another :data:`SPEC_VERSION` or compiled from a
+    dictionary other than :param:`digest` are removed.
+
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path) as f:
+            spec = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Discarding unreadable dictionary spec %s: %s", path, e)
+        discard_spec(path)
+        return None
+
+    if spec.get("version") != SPEC_VERSION or spec.get("hash") != digest:
+        logger.info("Discarding stale dictionary spec %s", path)
+        discard_spec(path)
+        return None
+
+    return spec
+
+
+def write_spec(path, spec):
+    """Atomically write :param:`spec` to :param:`path` so concurrent
+    readers never see a partial artifact
+
+    """
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(spec, f, sort_keys=True)
+        os.replace(tmp_path, path)
+    except Exception:
+        discard_spec(tmp_path)
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the dictionary spec cache")
+    parser.add_argument("cache_dir", type=str, help="directory to write the spec to")
+    parser.add_argument(
+        "-N",
+        "--namespace",
+        type=lambda x: x if x else None,
+        help="psqlgraph model namespace",
+    )
+    args = parser.parse_args()
+
+    from gdcdictionary import gdcdictionary
+
+    from gdcdatamodel import models
+
+    spec = models.get_dictionary_spec(
+        gdcdictionary, args.namespace, cache_dir=args.cache_dir
+    )
+    print(
+        "Wrote {} ({} nodes)".format(
+            get_spec_path(args.cache_dir, args.namespace), len(spec["nodes"])
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
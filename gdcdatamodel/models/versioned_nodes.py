@@ -1,6 +1,17 @@
 from copy import copy
 
-from sqlalchemy import BigInteger, Column, DateTime, Index, Text, text
+from sqlalchemy import (
+    BigInteger,
+    Column,
+    DateTime,
+    Index,
+    Text,
+    literal,
+    literal_column,
+    null,
+    select,
+    text,
+)
 from sqlalchemy.dialects.postgresql import ARRAY, JSONB
 from sqlalchemy.ext.declarative import declarative_base
 
@@ -86,3 +97,108 @@ class VersionedNode(Base):
                 + [edge.src_id for edge in node.edges_in]
             ),
         )
+
+
+#: Neighbors of a node in the order of :meth:`VersionedNode.clone`: the
+#: dst of each edge out, then the src of each edge in
+NEIGHBORS_SQL = """ARRAY(
+    SELECT neighbor_id FROM (
+        {edges}
+    ) AS neighbors (neighbor_id, edge_order)
+    ORDER BY edge_order, neighbor_id
+)"""
+
+
+def get_neighbors_sql(node_cls):
+    """Returns the ARRAY of the neighbor ids of each row of
+    :param:`node_cls`'s table, as :meth:`VersionedNode.clone` collects
+    them from ``edges_out`` and ``edges_in``
+
+    """
+
+    node_id = f"{node_cls.__tablename__}.node_id"
+    edges = [
+        (getattr(node_cls, name).property.mapper.class_, "dst_id", "src_id")
+        for name in node_cls._edges_out
+    ] + [
+        (getattr(node_cls, name).property.mapper.class_, "src_id", "dst_id")
+        for name in node_cls._edges_in
+    ]
+    if not edges:
+        return "ARRAY[]::text[]"
+
+    return NEIGHBORS_SQL.format(
+        edges="\n        UNION ALL ".join(
+            f"SELECT {neighbor}, {i} FROM {edge_cls.__tablename__} "
+            f"WHERE {column} = {node_id}"
+            for i, (edge_cls, neighbor, column) in enumerate(edges)
+        )
+    )
+
+
+def snapshot_nodes(session, node_cls, query=None, project_id=None, gdc_versions=None):
+    """Insert the VersionedNode of every node of :param:`node_cls` with a
+    single ``INSERT ... SELECT``, without loading the nodes or their
+    edges.  The rows are the ones :meth:`VersionedNode.clone` would
+    create.
+
+    :param session: The session to execute in
+    :param node_cls: The Node class to snapshot
+    :param query: Only snapshot the nodes of this query of :param:`node_cls`
+    :param project_id: Only snapshot the nodes of this project
+    :param gdc_versions: Stamped on every row, left NULL if not given
+    :returns: number of rows inserted
+
+    """
+
+    table = node_cls.__table__
+    template = {key: None for key in node_cls.get_property_list()}
+
+    columns = [
+        literal(node_cls.get_label(), Text).label("label"),
+        table.c.node_id,
+        table.c._props["project_id"].astext.label("project_id"),
+        table.c.created,
+        table.c.acl,
+        table.c._sysan.label("system_annotations"),
+        literal(template, JSONB).op("||")(table.c._props).label("properties"),
+        literal_column(get_neighbors_sql(node_cls)).label("neighbors"),
+        (
+            null() if gdc_versions is None else literal(list(gdc_versions), ARRAY(Text))
+        ).label("gdc_versions"),
+    ]
+
+    nodes = select(columns)
+    if query is not None:
+        nodes = nodes.where(
+            table.c.node_id.in_(
+                query.with_entities(node_cls.node_id).statement.correlate(None)
+            )
+        )
+    if project_id is not None:
+        nodes = nodes.where(table.c._props["project_id"].astext == project_id)
+
+    statement = VersionedNode.__table__.insert().from_select(
+        [column.name for column in columns], nodes
+    )
+    return session.execute(statement).rowcount
+
+
+def snapshot_project(session, node_base, project_id, gdc_versions=None):
+    """Snapshot every node of :param:`project_id`, one statement per
+    class, see :func:`snapshot_nodes`
+
+    :param node_base: The abstract Node class of the models' namespace
+    :returns: {label: number of rows inserted} of classes with nodes in
+        the project
+
+    """
+
+    counts = {}
+    for cls in node_base.get_subclasses():
+        inserted = snapshot_nodes(
+            session, cls, project_id=project_id, gdc_versions=gdc_versions
+        )
+        if inserted:
+            counts[cls.get_label()] = inserted
+    return counts
@@ -1,14 +1,44 @@
+import json
 import os
 import uuid
-from functools import lru_cache
-
-from sqlalchemy import and_, event, select
+from collections import OrderedDict, defaultdict, namedtuple
+
+from sqlalchemy import (
+    Integer,
+    Text,
+    all_,
+    and_,
+    any_,
+    bindparam,
+    cast,
+    event,
+    func,
+    select,
+)
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB
+from sqlalchemy.orm import Session, object_session
 
 UUID_NAMESPACE_SEED = os.getenv(
     "UUID_NAMESPACE_SEED", "86bb916a-24c5-48e4-8a46-5ea73a379d47"
 )
 UUID_NAMESPACE = uuid.UUID(f"urn:uuid:{UUID_NAMESPACE_SEED}", version=4)
 
+#: Maximum number of tags kept by a single :class:`TagCache`
+TAG_CACHE_SIZE = int(os.getenv("GDC_TAG_CACHE_SIZE", "10000"))
+
+#: Session.info key holding the session's :class:`TagCache`
+TAG_CACHE_KEY = "gdcdatamodel.tag_cache"
+
+#: Whether sessions tag inserted nodes once per flush unless
+#: overridden with :func:`enable_batched_tagging`
+BATCH_TAGGING = os.environ.get("GDC_BATCH_TAGGING", "False") == "True"
+
+#: Session.info key overriding :data:`BATCH_TAGGING`
+BATCH_TAGGING_KEY = "gdcdatamodel.batch_tagging"
+
+#: Session.info key holding the (node, tag) pairs to version at the end of the flush
+PENDING_TAGS_KEY = "gdcdatamodel.pending_tags"
+
 
 class TagKeys:
     tag = "tag"
@@ -110,20 +140,153 @@ def __generate_hash(seed, label):
     return str(uuid.uuid5(namespace, name))
 
 
-@lru_cache(maxsize=None)
-def compute_tag(node):
+TagCacheInfo = namedtuple("TagCacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class TagCache:
+    """Bounded LRU cache of computed tags
+
+    Entries are keyed on the node id, label and tag property values
+    rather than on node instances, so the cache never keeps nodes (or
+    their sessions) alive and a property edit is never answered with a
+    stale tag.  A tag also depends on the node's parents, so a cache
+    must not outlive changes to the graph: nodes in a session share a
+    cache that is emptied before and after every flush, and transient
+    nodes get a cache per call (see :func:`get_tag_cache`).  A cache
+    passed in explicitly must be evicted by its owner.
+    """
+
+    def __init__(self, maxsize=TAG_CACHE_SIZE):
+        """
+        Args:
+            maxsize (int): number of tags kept before the least recently used is dropped
+        """
+        self.maxsize = maxsize
+        self._tags = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(node):
+        """Returns the cache key of a node instance
+        Args:
+            node (models.Node): node instance
+        Returns:
+            tuple: hashable key
+        """
+        return node.node_id, node.label, tuple(node.get_tag_property_values())
+
+    def get(self, key):
+        tag = self._tags.get(key)
+        if tag is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._tags.move_to_end(key)
+        return tag
+
+    def put(self, key, tag):
+        self._tags[key] = tag
+        self._tags.move_to_end(key)
+        while len(self._tags) > self.maxsize:
+            self._tags.popitem(last=False)
+
+    def evict(self, node_ids):
+        """Drops the tags of the given node ids
+        Args:
+            node_ids (iterable[str]): ids of the nodes to drop
+        """
+        node_ids = set(node_ids)
+        for key in [key for key in self._tags if key[0] in node_ids]:
+            del self._tags[key]
+
+    def clear(self):
+        """Drops all tags and resets the counters"""
+        self._tags.clear()
+        self.hits = self.misses = 0
+
+    def info(self):
+        """
+        Returns:
+            TagCacheInfo: hit/miss counters and size of the cache
+        """
+        return TagCacheInfo(self.hits, self.misses, self.maxsize, len(self._tags))
+
+
+def get_tag_cache(node):
+    """Returns the cache to use when tagging a node: the one of the
+    node's session, or a new one for transient nodes, whose parents can
+    change at any time
+    Args:
+        node (models.Node): node instance
+    Returns:
+        TagCache: tag cache
+    """
+    session = object_session(node)
+    if session is None:
+        return TagCache()
+
+    cache = session.info.get(TAG_CACHE_KEY)
+    if cache is None:
+        cache = session.info[TAG_CACHE_KEY] = TagCache()
+    return cache
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def clear_session_tag_cache(session, flush_context):
+    """Edges may change between flushes, which changes the tags of
+    everything below them, so session caches only last a flush
+    """
+    cache = session.info.get(TAG_CACHE_KEY)
+    if cache is not None:
+        cache.clear()
+
+
+@event.listens_for(Session, "before_flush")
+def clear_session_tag_cache_before_flush(session, flush_context, instances):
+    """Drops the tags cached by :func:`compute_tag` calls made since the
+    last flush, edges may have changed since
+    """
+    clear_session_tag_cache(session, flush_context)
+
+
+def compute_tag(node, cache=None):
     """Computes unique tag for given node
     Args:
         node (models.Node): mode instance
+        cache (TagCache): cache to use, defaults to :func:`get_tag_cache`
     Returns:
         str: computed tag
     """
-    keys = node.get_tag_property_values()
-    keys += sorted(
-        compute_tag(p.dst)
-        for p in node.edges_out
-        if p.dst.is_taggable() and p.label != "relates_to"
+    if cache is None:
+        cache = get_tag_cache(node)
+
+    key = cache.key(node)
+    tag = cache.get(key)
+    if tag is not None:
+        return tag
+
+    tag = build_tag(
+        node,
+        [
+            compute_tag(p.dst, cache)
+            for p in node.edges_out
+            if p.dst.is_taggable() and p.label != "relates_to"
+        ],
     )
+    cache.put(key, tag)
+    return tag
+
+
+def build_tag(node, parent_tags):
+    """Computes the tag of a node given the tags of its taggable parents
+    Args:
+        node (models.Node): node instance
+        parent_tags (list[str]): tags of the parents, in any order
+    Returns:
+        str: computed tag
+    """
+    keys = node.get_tag_property_values() + sorted(parent_tags)
     return __generate_hash(keys, node.label)
 
 
@@ -153,6 +316,117 @@ def __get_tagged_version(node_id, table, tag, conn):
     return max_version + 1
 
 
+def enable_batched_tagging(session, enabled=True):
+    """Version the nodes inserted by a session once per flush with
+    :func:`set_tagged_versions` instead of once per node
+    Args:
+        session (sqlalchemy.orm.Session): session to configure
+        enabled (bool): False to restore per node tagging
+    """
+    session.info[BATCH_TAGGING_KEY] = enabled
+
+
+def is_batched_tagging(session):
+    return session.info.get(BATCH_TAGGING_KEY, BATCH_TAGGING)
+
+
+@event.listens_for(Session, "before_flush")
+def clear_pending_tagged_versions(session, flush_context, instances):
+    """Drops the nodes left pending by a flush that failed before they
+    were versioned, their inserts were rolled back
+    """
+    session.info.pop(PENDING_TAGS_KEY, None)
+
+
+@event.listens_for(Session, "after_flush")
+def set_pending_tagged_versions(session, flush_context):
+    """Versions the nodes tagged during the flush, one table at a time"""
+    pending = session.info.pop(PENDING_TAGS_KEY, None)
+    if not pending:
+        return
+
+    by_table = defaultdict(list)
+    for node, tag in pending:
+        by_table[node.__table__].append((node, tag))
+
+    conn = session.connection()
+    for table, tagged in by_table.items():
+        set_tagged_versions(conn, table, tagged)
+
+
+def set_tagged_versions(conn, table, tagged):
+    """Sets the tag, version and latest flag of newly inserted nodes of a
+    single table with three statements, independent of the number of
+    nodes.  The result is the same as tagging each node in turn
+    with :func:`inject_set_tag_after_insert`: nodes sharing a tag are
+    versioned in the order given, following the highest existing
+    version, and only the last of them is the latest.
+
+    Args:
+        conn (sqlalchemy.engine.Connection): currently active connection instance
+        table (sqlalchemy.Table): node table instance
+        tagged (list[tuple[models.Node, str]]): inserted nodes and their computed tags
+    """
+    new_ids = [node.node_id for node, _ in tagged]
+    tag_column = table.c._sysan[TagKeys.tag].astext
+    version_column = table.c._sysan[TagKeys.version].astext.cast(Integer)
+
+    query = (
+        select(
+            [
+                tag_column,
+                func.max(func.coalesce(version_column, 0)),
+                func.array_agg(table.c.node_id),
+            ]
+        )
+        .where(
+            and_(
+                tag_column == any_(cast(bindparam("tags"), ARRAY(Text))),
+                table.c.node_id != all_(cast(bindparam("new_ids"), ARRAY(Text))),
+            )
+        )
+        .group_by(tag_column)
+    )
+    max_versions, previous_ids = {}, []
+    params = {"tags": sorted({tag for _, tag in tagged}), "new_ids": new_ids}
+    for tag, max_version, node_ids in conn.execute(query, params):
+        max_versions[tag] = max_version
+        previous_ids += node_ids
+
+    # reset latest
+    if previous_ids:
+        conn.execute(
+            table.update()
+            .where(table.c.node_id == any_(cast(bindparam("ids"), ARRAY(Text))))
+            .values(
+                _sysan=table.c._sysan.op("||")(
+                    cast(json.dumps({TagKeys.latest: False}), JSONB)
+                )
+            ),
+            {"ids": previous_ids},
+        )
+
+    latest = {}
+    for node, tag in tagged:
+        if tag in latest:
+            latest[tag]._sysan[TagKeys.latest] = False
+
+        max_versions[tag] = max_versions.get(tag, 0) + 1
+        latest[tag] = node
+
+        node._sysan[TagKeys.tag] = tag
+        node._sysan[TagKeys.latest] = True
+        node._sysan[TagKeys.version] = max_versions[tag]
+
+    # update tag and version
+    conn.execute(
+        table.update()
+        .where(table.c.node_id == bindparam("_node_id"))
+        .values(_sysan=bindparam("_sysan")),
+        [{"_node_id": node.node_id, "_sysan": node._sysan} for node, _ in tagged],
+    )
+
+
 def inject_set_tag_after_insert(cls):
     """Injects an event listener that sets the tag and version properties on nodes, just before they are inserted
     Args:
@@ -168,6 +442,11 @@ def inject_set_tag_after_insert(cls):
 
         tag = compute_tag(node)
 
+        session = object_session(node)
+        if session is not None and is_batched_tagging(session):
+            session.info.setdefault(PENDING_TAGS_KEY, []).append((node, tag))
+            return
+
         version = __get_tagged_version(node.node_id, table, tag, conn)
 
         node._sysan[TagKeys.tag] = tag
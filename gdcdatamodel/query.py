@@ -1,6 +1,65 @@
-from psqlgraph import Edge, Node
+"""gdcdatamodel.query
+----------------------------------
 
+Unions of :meth:`subq_path` over every path between two labels.
+
+The paths between each pair of labels (the traversal table) are
+enumerated once per model namespace, on first use, from an adjacency
+map of the node classes.  As the enumeration is exponential in the
+size of the graph, the table can be computed ahead of time and kept in
+``$GDC_TRAVERSAL_CACHE``, e.g. in a docker build step::
+
+    python -m gdcdatamodel.query <dir>
+
+A stored table is only used if the adjacency map it was computed from
+matches the loaded models.
+
+By default :func:`union_subq_path` UNIONs one branch per path.  With
+``plan=True`` it queries a plan of the paths instead (see
+:func:`plan_union_subq_path`): paths to and through ``case`` are
+replaced by the ``_related_cases`` shortcut edges when those cover
+them, and the remaining paths share the subqueries of their common
+prefixes.
+
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import defaultdict, namedtuple
+from functools import lru_cache
+
+from psqlgraph import ext
+from sqlalchemy import select, union
+
+from gdcdatamodel.models.caching import RELATED_CASES_LINK_NAME
+
+logger = logging.getLogger(__name__)
+
+#: Bump this whenever the layout of a stored table, or the way it is
+#: computed, changes
+TRAVERSAL_VERSION = 1
+
+#: Environment variable naming the directory tables are kept in
+TRAVERSAL_CACHE_ENV = "GDC_TRAVERSAL_CACHE"
+
+#: Traversal table of the default namespace, {src label: {dst label: {path}}}
 traversals = {}
+
+#: Traversal tables by model namespace
+namespace_traversals = {None: traversals}
+
+traversals_lock = threading.Lock()
+
+#: Paths left to query between two labels, the tries they are merged
+#: into keyed by path length (or None) and the number of subqueries
+#: needed before (naive_cost) and after planning
+PathPlan = namedtuple("PathPlan", ["paths", "tries", "cost", "naive_cost"])
+
 terminal_nodes = [
     "annotations",
     "centers",
@@ -27,65 +86,450 @@ terminal_nodes = [
 ]
 
 
-def construct_traversals(root, node, visited, path):
-    recurse = lambda neighbor: (
-        neighbor
-        # no backtracking
-        and neighbor not in visited
-        and neighbor != node
-        # no traveling THROUGH terminal nodes
-        and (
-            path[-1] not in terminal_nodes
-            if path
-            else neighbor.label not in terminal_nodes
-        )
-        and (
-            not path[-1].startswith("_related")
-            if path
-            else not neighbor.label.startswith("_related")
+def is_stop(name):
+    """Paths don't travel THROUGH terminal nodes or related case edges"""
+    return name in terminal_nodes or name.startswith("_related")
+
+
+def get_adjacency(package_namespace=None):
+    """Returns {label: [(association, neighbor label)]} over both the out
+    and in edges of every node class of :param:`package_namespace`
+
+    """
+
+    node_cls = ext.get_abstract_node(package_namespace)
+    edge_cls = ext.get_abstract_edge(package_namespace)
+    classes = {cls.__name__: cls for cls in node_cls.get_subclasses()}
+
+    adjacency = {}
+    for name, cls in classes.items():
+        neighbors = [
+            (edge.__src_dst_assoc__, classes[edge.__dst_class__].label)
+            for edge in edge_cls._get_edges_with_src(name)
+        ]
+        neighbors.extend(
+            (edge.__dst_src_assoc__, classes[edge.__src_class__].label)
+            for edge in edge_cls._get_edges_with_dst(name)
         )
+        adjacency[cls.label] = neighbors
+    return adjacency
+
+
+def adjacency_hash(adjacency):
+    """Returns a hex digest identifying an adjacency map (and the
+    terminal nodes it is traversed with)
+
+    """
+
+    content = json.dumps(
+        [sorted((k, sorted(v)) for k, v in adjacency.items()), terminal_nodes]
     )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
-    for edge in Edge._get_edges_with_src(node.__name__):
-        neighbor = [
-            n for n in Node.get_subclasses() if n.__name__ == edge.__dst_class__
-        ][0]
-        if recurse(neighbor):
-            construct_traversals(
-                root, neighbor, visited + [node], path + [edge.__src_dst_assoc__]
-            )
 
-    for edge in Edge._get_edges_with_dst(node.__name__):
-        neighbor = [
-            n for n in Node.get_subclasses() if n.__name__ == edge.__src_class__
-        ][0]
-        if recurse(neighbor):
-            construct_traversals(
-                root, neighbor, visited + [node], path + [edge.__dst_src_assoc__]
-            )
+def construct_traversals(adjacency, root):
+    """Returns {dst label: {path}} of every path from :param:`root` that
+    never visits a label twice.  The path being walked and the labels on
+    it are a single stack shared by the whole search.
+
+    """
+
+    table = defaultdict(set)
+    visited = {root}
+    path = []
+
+    def visit(label, joined):
+        table[label].add(joined)
+        if path and is_stop(path[-1]):
+            return
+        for assoc, neighbor in adjacency[label]:
+            if neighbor in visited or (not path and is_stop(neighbor)):
+                continue
+            visited.add(neighbor)
+            path.append(assoc)
+            visit(neighbor, f"{joined}.{assoc}" if joined else assoc)
+            path.pop()
+            visited.discard(neighbor)
+
+    visit(root, "")
+    return dict(table)
+
+
+def construct_traversals_for_all_nodes(package_namespace=None):
+    """Returns the traversal table of :param:`package_namespace`"""
+    adjacency = get_adjacency(package_namespace)
+    return {label: construct_traversals(adjacency, label) for label in adjacency}
+
+
+def get_traversal_path(cache_dir, package_namespace=None):
+    return os.path.join(cache_dir, f"{package_namespace or 'default'}.traversals.json")
+
+
+def discard_traversals(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def read_traversals(path, digest):
+    """Returns the table stored at :param:`path`, or None if it is
+    missing, unreadable or was computed from another adjacency map
+
+    """
+
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path) as f:
+            stored = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning("Discarding unreadable traversal table %s: %s", path, e)
+        discard_traversals(path)
+        return None
+
+    if stored.get("version") != TRAVERSAL_VERSION or stored.get("hash") != digest:
+        logger.info("Discarding stale traversal table %s", path)
+        discard_traversals(path)
+        return None
+
+    return {
+        src: {dst: set(paths) for dst, paths in dsts.items()}
+        for src, dsts in stored["traversals"].items()
+    }
+
+
+def write_traversals(path, digest, table):
+    """Atomically write :param:`table` to :param:`path`"""
+
+    stored = {
+        "version": TRAVERSAL_VERSION,
+        "hash": digest,
+        "traversals": {
+            src: {dst: sorted(paths) for dst, paths in dsts.items()}
+            for src, dsts in table.items()
+        },
+    }
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(stored, f, sort_keys=True)
+        os.replace(tmp_path, path)
+    except Exception:
+        discard_traversals(tmp_path)
+        raise
+
+
+def load_traversals(package_namespace=None, cache_dir=None):
+    """Returns the traversal table of :param:`package_namespace`, read
+    from (and stored in) :param:`cache_dir` or ``$GDC_TRAVERSAL_CACHE``
+    when set
+
+    """
+
+    cache_dir = cache_dir or os.environ.get(TRAVERSAL_CACHE_ENV)
+    if not cache_dir:
+        return construct_traversals_for_all_nodes(package_namespace)
+
+    adjacency = get_adjacency(package_namespace)
+    digest = adjacency_hash(adjacency)
+    path = get_traversal_path(cache_dir, package_namespace)
+
+    table = read_traversals(path, digest)
+    if table is None:
+        table = {label: construct_traversals(adjacency, label) for label in adjacency}
+        try:
+            write_traversals(path, digest, table)
+        except OSError as e:
+            logger.warning("Unable to store traversal table %s: %s", path, e)
+    return table
+
+
+def get_traversals(package_namespace=None):
+    """Returns the traversal table of :param:`package_namespace`, built
+    once per process.  Threads asking for a table that is being built
+    wait for it rather than building their own.
+
+    """
+
+    table = namespace_traversals.get(package_namespace)
+    if table:
+        return table
+
+    with traversals_lock:
+        table = namespace_traversals.setdefault(package_namespace, {})
+        if not table:
+            table.update(load_traversals(package_namespace))
+    return table
+
+
+def get_case_lineages(cls, visited=()):
+    """Yields the paths, as tuples of links, from :param:`cls` to the
+    first ``case`` along the parent links the related case cache is
+    computed from (see :func:`caching.related_cases_from_parents`)
 
-    traversals[root][node.label] = traversals[root].get(node.label) or set()
-    traversals[root][node.label].add(".".join(path))
+    """
 
+    for name, link in cls._pg_links.items():
+        dst_cls = link["dst_type"]
+        if name.startswith("_related") or dst_cls in visited:
+            continue
+        if dst_cls.get_label() == "case":
+            yield (name,)
+        elif hasattr(dst_cls, RELATED_CASES_LINK_NAME):
+            for lineage in get_case_lineages(dst_cls, visited + (cls,)):
+                yield (name,) + lineage
 
-def construct_traversals_for_all_nodes():
-    for node in Node.get_subclasses():
-        traversals[node.label] = {}
-        construct_traversals(node.label, node, [node], [])
+
+def get_case_prefix_length(cls, links):
+    """Returns the number of leading links of a path that reach ``case``
+    through parent links (see :func:`get_case_lineages`), possibly ending
+    with a ``_related_cases`` shortcut, or None if the path doesn't
+    start with such links
+
+    """
+
+    for i, name in enumerate(links):
+        if name == RELATED_CASES_LINK_NAME:
+            return i + 1
+        link = cls._pg_links.get(name)
+        if link is None or name.startswith("_related"):
+            return None
+        cls = link["dst_type"]
+        if cls.get_label() == "case":
+            return i + 1
+        if not hasattr(cls, RELATED_CASES_LINK_NAME):
+            return None
+    return None
+
+
+def covers_lineage(prefix, lineage):
+    """Whether the cases reached by :param:`prefix` include those of
+    :param:`lineage`
+
+    """
+
+    if prefix == lineage:
+        return True
+    head, _, last = prefix.rpartition(".")
+    return last == RELATED_CASES_LINK_NAME and (
+        not head or lineage.startswith(head + ".")
+    )
+
+
+def prune_paths(src_cls, paths, filter_count=0):
+    """Returns the paths of :param:`paths` that are left once those
+    covered by the related case cache are replaced with the
+    ``_related_cases`` shortcut.
+
+    Paths that reach ``case`` through parent links (or the shortcut of
+    a parent) and then continue with the same suffix are replaced by a
+    single shortcut path when, together, they cover every case lineage
+    of :param:`src_cls`, as the shortcut edges then link to exactly the
+    cases they reach.  Paths with post filters on a node before
+    ``case`` are kept as is.
+
+    """
+
+    if "" in paths:
+        return {""}
+    if not hasattr(src_cls, RELATED_CASES_LINK_NAME):
+        return set(paths)
+
+    lineages = {".".join(lineage) for lineage in get_case_lineages(src_cls)}
+
+    pruned = set()
+    prefixes = defaultdict(set)
+    for path in paths:
+        links = path.split(".")
+        length = get_case_prefix_length(src_cls, links)
+        if length is None or filter_count > len(links) - length + 1:
+            pruned.add(path)
+        else:
+            prefixes[tuple(links[length:])].add(".".join(links[:length]))
+
+    for suffix, case_prefixes in prefixes.items():
+        if all(
+            any(covers_lineage(prefix, lineage) for prefix in case_prefixes)
+            for lineage in lineages
+        ):
+            pruned.add(".".join((RELATED_CASES_LINK_NAME,) + suffix))
+        else:
+            pruned.update(".".join((prefix,) + suffix) for prefix in case_prefixes)
+
+    return pruned
+
+
+def build_trie(paths):
+    """Returns nested {link: {link: ...}} dicts sharing common prefixes"""
+    trie = {}
+    for path in filter(None, paths):
+        node = trie
+        for link in path.split("."):
+            node = node.setdefault(link, {})
+    return trie
+
+
+def get_trie_cost(trie):
+    """The number of subqueries (each joining an edge table and a node
+    table) needed to filter on every path of a trie
+
+    """
+
+    return sum(1 + get_trie_cost(child) for child in trie.values())
+
+
+@lru_cache(maxsize=None)
+def plan_union_subq_path(src_cls, dst_label, filter_count=0, package_namespace=None):
+    """Returns the PathPlan filtering :param:`src_cls` nodes on having
+    a path to a :param:`dst_label` node.
+
+    Post filters are applied at a distance from the end of each path,
+    so with more than one filter, only paths of the same length share
+    a trie.
+
+    """
+
+    table = get_traversals(package_namespace)
+    paths = table.get(src_cls.label, {}).get(dst_label, set())
+    pruned = prune_paths(src_cls, paths, filter_count)
+
+    groups = defaultdict(set)
+    for path in pruned:
+        groups[len(path.split(".")) if filter_count > 1 else None].add(path)
+    tries = {length: build_trie(paths) for length, paths in groups.items()}
+
+    return PathPlan(
+        paths=frozenset(pruned),
+        tries=tries,
+        cost=sum(get_trie_cost(trie) for trie in tries.values()),
+        naive_cost=sum(len(path.split(".")) for path in paths if path),
+    )
+
+
+def select_trie_ids(q, trie, post_filters, length=None, depth=0):
+    """Returns a select of the ids of :param:`q` entity nodes with a path
+    in :param:`trie` (whose paths are :param:`length` links long, if
+    not None), applying post filters the same way :meth:`subq_path` does
+
+    """
+
+    entity = q.entity()
+    branches = []
+    for link, child in sorted(trie.items()):
+        _, this_id, next_id, target = q._get_link_details(entity, link)
+        next_q = q.session.query(target)
+        if child:
+            child_ids = select_trie_ids(next_q, child, post_filters, length, depth + 1)
+            next_q = next_q.filter(target.node_id.in_(child_ids))
+
+        if length is not None:
+            index = length - depth - 1
+        else:
+            index = None if child else 0
+        if index is not None and index < len(post_filters):
+            if post_filters[index] is not None:
+                next_q = post_filters[index](next_q)
+
+        next_sq = next_q.subquery()
+        branches.append(select([this_id]).where(next_id == next_sq.c.node_id))
+
+    return branches[0] if len(branches) == 1 else union(*branches)
 
 
 def union_subq_without_path(q, *args, **kwargs):
     return q.except_(union_subq_path(q, *args, **kwargs))
 
 
-def union_subq_path(q, dst_label, post_filters=[]):
-    if traversals == {}:
-        construct_traversals_for_all_nodes()
+def union_subq_path(
+    q, dst_label, post_filters=[], package_namespace=None, max_cost=None, plan=False
+):
+    """Filters :param:`q` on nodes with any path to a :param:`dst_label`
+    node.
+
+    :param post_filters: filters applied along the end of each path, see
+        :meth:`subq_path`
+    :param max_cost: with :param:`plan`, the maximum number of edge and
+        node table subqueries to query
+    :param plan: prune and merge the paths as :func:`plan_union_subq_path`
+        does, rather than UNION a :meth:`subq_path` per path
+    :raises ValueError: if the plan costs more than :param:`max_cost`
+
+    """
+
+    if not isinstance(post_filters, list):
+        post_filters = [post_filters]
+
+    entity = q.entity()
+    if not plan:
+        return union_subq_paths(q, dst_label, post_filters, package_namespace)
+
+    path_plan = plan_union_subq_path(
+        entity, dst_label, len(post_filters), package_namespace
+    )
+    if max_cost is not None and path_plan.cost > max_cost:
+        raise ValueError(
+            "Paths from {} to {} cost {}, over the budget of {}".format(
+                entity.label, dst_label, path_plan.cost, max_cost
+            )
+        )
+
+    if not path_plan.paths or "" in path_plan.paths:
+        return q
+
+    ids = [
+        select_trie_ids(q, trie, post_filters, length)
+        for length, trie in sorted(
+            path_plan.tries.items(), key=lambda item: item[0] or 0
+        )
+    ]
+    return q.filter(entity.node_id.in_(ids[0] if len(ids) == 1 else union(*ids)))
+
+
+def union_subq_paths(q, dst_label, post_filters=[], package_namespace=None):
+    """UNIONs a :meth:`subq_path` for every path to :param:`dst_label`"""
+    table = get_traversals(package_namespace)
     src_label = q.entity().label
-    if not traversals.get(src_label, {}).get(dst_label, {}):
+    if not table.get(src_label, {}).get(dst_label, {}):
         return q
-    paths = list(traversals[src_label][dst_label])
+    paths = list(table[src_label][dst_label])
     base = q.subq_path(paths.pop(), post_filters)
     while paths:
         base = base.union(q.subq_path(paths.pop(), post_filters))
     return base
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the traversal table cache")
+    parser.add_argument("cache_dir", type=str, help="directory to write the table to")
+    parser.add_argument(
+        "-N",
+        "--namespace",
+        type=lambda x: x if x else None,
+        help="psqlgraph model namespace",
+    )
+    args = parser.parse_args()
+
+    from gdcdictionary import gdcdictionary
+
+    from gdcdatamodel import models
+
+    if args.namespace:
+        models.load_dictionary(gdcdictionary, args.namespace)
+
+    table = load_traversals(args.namespace, cache_dir=args.cache_dir)
+    print(
+        "Wrote {} ({} paths)".format(
+            get_traversal_path(args.cache_dir, args.namespace),
+            sum(len(paths) for dsts in table.values() for paths in dsts.values()),
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,16 @@
-from gdcdictionary import gdcdictionary
+from collections import defaultdict, namedtuple
+
+from sqlalchemy import func, tuple_
+
+from gdcdatamodel.validators.plans import (
+    LinkGroup,
+    ValidationPlans,
+    compile_group,
+    compile_link,
+)
+
+#: Maximum number of key tuples (or ids) bound to a single query
+BATCH_SIZE = 1000
 
 
 class GDCGraphValidator:
@@ -8,15 +20,33 @@ class GDCGraphValidator:
 
     """
 
-    def __init__(self):
-        self.schemas = gdcdictionary
+    def __init__(self, dictionary=None, package_namespace=None):
+        """
+        :param dictionary: gdc dictionary or an extension of it,
+            defaults to gdcdictionary
+        :param package_namespace: namespace the dictionary's models
+            were loaded under
+        """
+        self.plans = ValidationPlans(dictionary, package_namespace)
+        self.schemas = self.plans.dictionary
         self.required_validators = {
-            "links_validator": GDCLinksValidator(),
-            "uniqueKeys_validator": GDCUniqueKeysValidator(),
+            "links_validator": GDCLinksValidator(plans=self.plans),
+            "uniqueKeys_validator": GDCUniqueKeysValidator(plans=self.plans),
         }
         self.optional_validators = {}
 
     def record_errors(self, graph, entities):
+        """Runs the required validators over all entities at once.
+
+        Each validator makes its database lookups for the whole batch up
+        front in the caller's session (see ``prefetch``), the only one
+        that can see the uncommitted submission, and then validates the
+        entities against those results.  The speedup over validating
+        entity by entity comes from this batching, validation itself is
+        serial.
+
+        """
+
         for validator in self.required_validators.values():
             validator.validate(entities, graph)
 
@@ -28,41 +58,152 @@ class GDCGraphValidator:
                     self.optional_validators[validator_name].validate()
 
 
+def chunks(values, size=BATCH_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+LinkTarget = namedtuple("LinkTarget", ["node_id", "label"])
+
+
+class LinksIndex:
+    """The targets of the links of a batch of nodes, and the number of
+    edges into each target, loaded up front with IN-list queries on the
+    edge tables
+
+    """
+
+    def __init__(self):
+        #: (src node_id, link name) -> [LinkTarget]
+        self.targets = {}
+        #: (edge class, dst node_id) -> number of edges
+        self.backrefs = defaultdict(int)
+
+    @staticmethod
+    def get_edge_cls(node_cls, association):
+        link = node_cls._pg_links.get(association)
+        if link is None:
+            return None
+        return getattr(node_cls, link["edge_out"]).property.mapper.class_
+
+    @classmethod
+    def load(cls, session, entities, plans):
+        index = cls()
+
+        src_ids = defaultdict(set)
+        for entity in entities:
+            node = entity.node
+            for link in plans.iter_links(node.label):
+                edge_cls = cls.get_edge_cls(type(node), link.name)
+                if edge_cls is not None:
+                    one_to = link.multiplicity in ["one_to_many", "one_to_one"]
+                    src_ids[(edge_cls, link.name, one_to)].add(node.node_id)
+
+        for (edge_cls, association, one_to), ids in src_ids.items():
+            dst_cls = plans.node_cls.get_subclass_named(edge_cls.__dst_class__)
+            dst_label = dst_cls.get_label()
+            for node_id in ids:
+                index.targets[(node_id, association)] = []
+
+            for chunk in chunks(ids):
+                query = session.query(edge_cls.src_id, edge_cls.dst_id).filter(
+                    edge_cls.src_id.in_(chunk)
+                )
+                for src_id, dst_id in query:
+                    index.targets[(src_id, association)].append(
+                        LinkTarget(dst_id, dst_label)
+                    )
+
+            if not one_to:
+                continue
+
+            dst_ids = {
+                target.node_id
+                for node_id in ids
+                for target in index.targets[(node_id, association)]
+            }
+            for chunk in chunks(dst_ids):
+                query = (
+                    session.query(edge_cls.dst_id, func.count())
+                    .filter(edge_cls.dst_id.in_(chunk))
+                    .group_by(edge_cls.dst_id)
+                )
+                for dst_id, count in query:
+                    index.backrefs[(edge_cls, dst_id)] = count
+
+        return index
+
+    def get_targets(self, node, association):
+        """Returns the targets of a link, None if they were not loaded"""
+        return self.targets.get((node.node_id, association))
+
+    def count_backrefs(self, node, association, target):
+        edge_cls = self.get_edge_cls(type(node), association)
+        return self.backrefs[(edge_cls, target.node_id)]
+
+
 class GDCLinksValidator:
-    def validate(self, entities, graph=None):
+    def __init__(self, prefetch=True, plans=None):
+        """
+        :param prefetch: load the links of all entities up front with a
+            few queries per edge table instead of lazy loading each
+            relationship
+        :param plans: the ValidationPlans of the dictionary to validate
+            against, defaults to those of gdcdictionary
+        """
+        self.prefetch_links = prefetch
+        self.plans = plans or ValidationPlans()
+
+    def prefetch(self, entities, graph=None):
+        """Returns the :class:`LinksIndex` of the entities, or None when
+        prefetching is disabled
+
+        """
+
+        if self.prefetch_links and graph is not None:
+            return LinksIndex.load(graph.current_session(), entities, self.plans)
+        return None
+
+    def validate(self, entities, graph=None, prefetched=None):
+        index = prefetched
+        if index is None:
+            index = self.prefetch(entities, graph)
+
         for entity in entities:
-            for link in gdcdictionary.schema[entity.node.label]["links"]:
-                if "name" in link:
-                    self.validate_edge(link, entity)
-                elif "subgroup" in link:
-                    self.validate_edge_group(link, entity)
+            for link in self.plans.get(entity.node.label).links:
+                if isinstance(link, LinkGroup):
+                    self.validate_link_group(link, entity, index)
+                else:
+                    self.validate_link(link, entity, index)
+
+    def validate_edge_group(self, schema, entity, index=None):
+        return self.validate_link_group(compile_group(schema), entity, index)
+
+    def validate_edge(self, link_sub_schema, entity, index=None):
+        return self.validate_link(compile_link(link_sub_schema), entity, index)
 
-    def validate_edge_group(self, schema, entity):
+    def validate_link_group(self, group, entity, index=None):
         submitted_links = []
         schema_links = []
         num_of_edges = 0
 
-        for group in schema["subgroup"]:
-            if "subgroup" in schema["subgroup"]:
-                # nested subgroup
-                result = self.validate_edge_group(group, entity)
-            if "name" in group:
-                result = self.validate_edge(group, entity)
+        for link in group.links:
+            result = self.validate_link(link, entity, index)
 
             if result["length"] > 0:
                 submitted_links.append(result)
                 num_of_edges += result["length"]
             schema_links.append(result["name"])
 
-        if schema.get("required") is True and len(submitted_links) == 0:
+        if group.required and len(submitted_links) == 0:
             names = ", ".join(schema_links[:-2] + [" or ".join(schema_links[-2:])])
             entity.record_error(
                 f"Entity is missing a required link to {names}",
                 keys=schema_links,
             )
 
-        if schema.get("exclusive") is True and len(submitted_links) > 1:
-            names = ", ".join(schema_links[:-2] + [" and ".join(schema_links[-2:])])
+        if group.exclusive and len(submitted_links) > 1:
             entity.record_error(
                 "Links to {} are exclusive.  More than one was provided: {}".format(
                     schema_links, entity.node.edges_out
@@ -72,16 +213,18 @@ class GDCLinksValidator:
             for edge in entity.node.edges_out:
                 entity.record_error(f"{edge.dst.submitter_id}")
 
-        result = {"length": num_of_edges, "name": ", ".join(schema_links)}
+        return {"length": num_of_edges, "name": ", ".join(schema_links)}
 
-    def validate_edge(self, link_sub_schema, entity):
-        association = link_sub_schema["name"]
+    def validate_link(self, link, entity, index=None):
+        association = link.name
         node = entity.node
-        targets = node[association]
+        targets = index and index.get_targets(node, association)
+        if targets is None:
+            index, targets = None, node[association]
         result = {"length": len(targets), "name": association}
 
         if len(targets) > 0:
-            multi = link_sub_schema["multiplicity"]
+            multi = link.multiplicity
 
             if multi in ["many_to_one", "one_to_one"]:
                 if len(targets) > 1:
@@ -92,21 +235,22 @@ class GDCLinksValidator:
 
             if multi in ["one_to_many", "one_to_one"]:
                 for target in targets:
-                    if len(target[link_sub_schema["backref"]]) > 1:
+                    if index:
+                        count = index.count_backrefs(node, association, target)
+                    else:
+                        count = len(target[link.backref])
+                    if count > 1:
                         entity.record_error(
                             "'{}' link has to be {}, target node {} already has {}".format(
                                 association,
                                 multi,
                                 target.label,
-                                link_sub_schema["backref"],
+                                link.backref,
                             ),
                             keys=[association],
                         )
-
-            if multi == "many_to_many":
-                pass
         else:
-            if link_sub_schema.get("required") is True:
+            if link.required:
                 entity.record_error(
                     f"Entity is missing required link to {association}",
                     keys=[association],
@@ -115,24 +259,111 @@ class GDCLinksValidator:
 
 
 class GDCUniqueKeysValidator:
-    def validate(self, entities, graph=None):
+    def __init__(self, batched=True, plans=None):
+        """
+        :param batched: look up the unique keys of all entities with one
+            query per node class instead of one query per entity and key
+        :param plans: the ValidationPlans of the dictionary to validate
+            against, defaults to those of gdcdictionary
+        """
+        self.batched = batched
+        self.plans = plans or ValidationPlans()
+
+    def get_unique_props(self, node):
+        """Yields the {property: value} of each of the node's unique keys"""
+        for keys in self.plans.get(node.label).unique_keys:
+            yield {key: node[key] for key in keys}
+
+    @staticmethod
+    def is_batchable(props):
+        return all(isinstance(value, str) for value in props.values())
+
+    def prefetch(self, entities, graph=None):
+        """Returns the number of nodes matching each of the unique keys of
+        each entity, as {id(entity.node): [count]}
+
+        """
+
+        checks = [
+            (entity, props)
+            for entity in entities
+            for props in self.get_unique_props(entity.node)
+        ]
+
+        counts = self.count_unique_props(graph, checks) if self.batched else {}
+
+        prefetched = {id(entity.node): [] for entity in entities}
+        for entity, props in checks:
+            if self.batched and self.is_batchable(props):
+                count = counts[self.get_count_key(props)]
+            else:
+                count = graph.nodes().props(props).count()
+            prefetched[id(entity.node)].append(count)
+
+        return prefetched
+
+    def validate(self, entities, graph=None, prefetched=None):
+        counts = prefetched
+        if counts is None:
+            counts = self.prefetch(entities, graph)
+
         for entity in entities:
-            schema = gdcdictionary.schema[entity.node.label]
-            node = entity.node
-            for keys in schema["uniqueKeys"]:
-                props = {}
-                if keys == ["id"]:
+            for props, count in zip(
+                self.get_unique_props(entity.node), counts[id(entity.node)]
+            ):
+                self.validate_count(entity, props, count)
+
+    def validate_count(self, entity, props, count):
+        if count > 1:
+            entity.record_error(
+                "{} with {} already exists in the GDC".format(entity.node.label, props),
+                keys=list(props.keys()),
+            )
+
+    @staticmethod
+    def get_count_key(props):
+        names = tuple(sorted(props))
+        return names, tuple(props[name] for name in names)
+
+    def count_unique_props(self, graph, checks):
+        """Counts the nodes matching each set of unique props with one
+        query per node table that has all of the props, using the
+        ``_props->>key`` secondary key indexes
+
+        Only string values are looked up this way, the count of other
+        values (which compare differently as text) is left to
+        :meth:`prefetch`.
+
+        :returns: {(prop names, prop values): number of matching nodes}
+
+        """
+
+        values_by_names = defaultdict(set)
+        for _, props in checks:
+            if self.is_batchable(props):
+                names, values = self.get_count_key(props)
+                values_by_names[names].add(values)
+
+        session = graph.current_session()
+        counts = {}
+        for names, values in values_by_names.items():
+            counts.update({(names, value): 0 for value in values})
+
+            for cls in self.plans.node_cls.get_subclasses():
+                if not all(name in cls.__pg_properties__ for name in names):
                     continue
-                for key in keys:
-                    prop = schema["properties"][key].get("systemAlias")
-                    if prop:
-                        props[prop] = node[prop]
-                    else:
-                        props[key] = node[key]
-                if graph.nodes().props(props).count() > 1:
-                    entity.record_error(
-                        "{} with {} already exists in the GDC".format(
-                            node.label, props
-                        ),
-                        keys=list(props.keys()),
+
+                columns = [cls._props[name].astext for name in names]
+                values = sorted(values)
+                for start in range(0, len(values), BATCH_SIZE):
+                    query = (
+                        session.query(*columns, func.count())
+                        .filter(
+                            tuple_(*columns).in_(values[start : start + BATCH_SIZE])
+                        )
+                        .group_by(*columns)
                     )
+                    for row in query:
+                        counts[(names, tuple(row[:-1]))] += row[-1]
+
+        return counts
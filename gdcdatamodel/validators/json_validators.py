@@ -23,14 +23,32 @@ def get_keys(error_msg):
 
 
 class GDCJSONValidator:
-    def __init__(self):
+    def __init__(self, prewarm=False):
+        """
+        :param prewarm: build the validators of every type up front
+            rather than on first use
+        """
         self.schemas = gdcdictionary
+        self.validators = {}
+        if prewarm:
+            self.prewarm()
+
+    def get_validator(self, _type):
+        """Returns the validator of a type, built once per type"""
+        validator = self.validators.get(_type)
+        if validator is None:
+            # Note whenever gdcdictionary use a newer version of jsonschema
+            # we need to update the Validator
+            validator = Draft4Validator(self.schemas.schema[_type])
+            self.validators[_type] = validator
+        return validator
+
+    def prewarm(self):
+        for _type in self.schemas.schema:
+            self.get_validator(_type)
 
     def iter_errors(self, doc):
-        # Note whenever gdcdictionary use a newer version of jsonschema
-        # we need to update the Validator
-        validator = Draft4Validator(self.schemas.schema[doc["type"]])
-        return validator.iter_errors(doc)
+        return self.get_validator(doc["type"]).iter_errors(doc)
 
     def record_errors(self, entities):
         for entity in entities:
@@ -0,0 +1,106 @@
+"""gdcdatamodel.validators.plans
+----------------------------------
+
+The link and unique key rules of each label of a dictionary, resolved
+once so that graph validation doesn't walk the dictionary schema (its
+``subgroup`` nesting and ``systemAlias`` properties) for every entity.
+
+"""
+
+from collections import namedtuple
+
+from gdcdictionary import gdcdictionary
+from psqlgraph import ext
+
+#: A single link to validate
+LinkRule = namedtuple("LinkRule", ["name", "multiplicity", "backref", "required"])
+
+#: Links of a subgroup, flattened from any nested subgroups
+LinkGroup = namedtuple("LinkGroup", ["links", "required", "exclusive"])
+
+#: The rules of a label.  ``links`` holds LinkRule and LinkGroup in
+#: dictionary order, ``unique_keys`` holds the property names (system
+#: aliases resolved) of each unique key but ``id``
+ValidationPlan = namedtuple("ValidationPlan", ["links", "unique_keys"])
+
+
+def compile_link(link):
+    return LinkRule(
+        name=link["name"],
+        multiplicity=link.get("multiplicity"),
+        backref=link.get("backref"),
+        required=link.get("required") is True,
+    )
+
+
+def flatten_links(links):
+    """Yields the LinkRule of links, including those in subgroups"""
+    for link in links:
+        if "name" in link:
+            yield compile_link(link)
+        elif "subgroup" in link:
+            yield from flatten_links(link["subgroup"])
+
+
+def compile_group(group):
+    return LinkGroup(
+        links=tuple(flatten_links(group["subgroup"])),
+        required=group.get("required") is True,
+        exclusive=group.get("exclusive") is True,
+    )
+
+
+def compile_plan(schema):
+    """Returns the ValidationPlan of a single label's schema"""
+
+    links = tuple(
+        compile_link(link) if "name" in link else compile_group(link)
+        for link in schema.get("links", [])
+        if "name" in link or "subgroup" in link
+    )
+
+    properties = schema.get("properties", {})
+    unique_keys = tuple(
+        tuple(properties[key].get("systemAlias") or key for key in keys)
+        for keys in schema.get("uniqueKeys", [])
+        if keys != ["id"]
+    )
+
+    return ValidationPlan(links=links, unique_keys=unique_keys)
+
+
+class ValidationPlans:
+    """The ValidationPlan of each label of a dictionary, compiled on first
+    use and kept for the life of the validators sharing it
+
+    """
+
+    def __init__(self, dictionary=None, package_namespace=None):
+        """
+        :param dictionary: gdc dictionary or an extension of it, defaults
+            to gdcdictionary
+        :param package_namespace: namespace the dictionary's models were
+            loaded under
+        """
+        self.dictionary = dictionary or gdcdictionary
+        self.package_namespace = package_namespace
+        self.plans = {}
+
+    @property
+    def node_cls(self):
+        """The abstract Node class of the dictionary's models"""
+        return ext.get_abstract_node(self.package_namespace)
+
+    def get(self, label):
+        plan = self.plans.get(label)
+        if plan is None:
+            plan = self.plans[label] = compile_plan(self.dictionary.schema[label])
+        return plan
+
+    def iter_links(self, label):
+        """Yields every LinkRule of a label, including those in groups"""
+        for link in self.get(label).links:
+            if isinstance(link, LinkGroup):
+                yield from link.links
+            else:
+                yield link
@@ -0,0 +1,252 @@
+#!/usr/bin/env python
+
+"""gdcdatamodel.migrations.audit_case_cache
+----------------------------------
+
+Audits the `_related_cases` shortcut edge tables against the real
+lineage of each node, and optionally repairs them.
+
+Each class is audited in its own process with a single statement
+(:func:`gdcdatamodel.models.caching.audit_related_cases`): the related
+cases every node should have are derived inside Postgres from the
+lineage edge tables and set-differenced against the shortcut table.
+Nothing is modified during the audit.
+
+The differences are written to a compact JSON report, per label the
+counts and (src_id, case_id) pairs of `missing` and `extra` shortcut
+edges.  With `--sample` only a percentage of each node table is
+audited, for a quick health check of a large database.
+
+With `--repair` the diff is then applied in batches, each in its own
+transaction, either right after the audit or from an earlier report
+given with `--from-report`.  Each batch is checked against the current
+lineage of its nodes before it is applied, and only the edges that are
+still missing or extra are repaired.  Replaying a report, or applying
+an old one, therefore skips edges that were fixed since, and edges
+whose nodes were deleted or re-linked since.
+
+Usage:
+
+```
+python -m migrations.audit_case_cache -H localhost -U test -D automated_test \\
+    --report /tmp/case_cache.json --sample 1
+```
+
+"""
+
+import argparse
+import getpass
+import json
+import logging
+import time
+from multiprocessing import Pool, cpu_count
+
+from psqlgraph import Node, PsqlGraphDriver
+
+from gdcdatamodel import models  # noqa
+from gdcdatamodel.models import caching
+
+logger = logging.getLogger("audit_case_cache")
+logging.basicConfig(level=logging.INFO)
+
+#: Number of shortcut edges repaired per transaction
+BATCH_SIZE = 5000
+
+
+def get_cached_labels(labels=None):
+    """Returns the labels of classes with a case cache"""
+
+    return sorted(
+        cls.get_label()
+        for cls in Node.get_subclasses()
+        if hasattr(cls, caching.RELATED_CASES_LINK_NAME)
+        and (not labels or cls.get_label() in labels)
+    )
+
+
+def audit_cls_job(job):
+    """Pool entry point, each process connects with its own driver"""
+
+    graph_kwargs, label, sample = job
+    graph = PsqlGraphDriver(**graph_kwargs)
+
+    start = time.time()
+    with graph.session_scope() as session:
+        diff = caching.audit_related_cases(session, labels=[label], sample=sample)
+    return label, diff.get(label), time.time() - start
+
+
+def audit(graph_kwargs, labels=None, sample=None, processes=None):
+    """Audits the shortcut edges of each class in parallel
+
+    :returns: {label: {"missing": [(src_id, case_id)], "extra": [...]}}
+        for each class that has differences
+
+    """
+
+    diff = {}
+    jobs = [(graph_kwargs, label, sample) for label in get_cached_labels(labels)]
+    with Pool(processes or cpu_count()) as pool:
+        for label, edges, elapsed in pool.imap_unordered(audit_cls_job, jobs):
+            edges = edges or {"missing": [], "extra": []}
+            logger.info(
+                "%s: %d missing, %d extra (%.1fs)",
+                label,
+                len(edges["missing"]),
+                len(edges["extra"]),
+                elapsed,
+            )
+            if edges["missing"] or edges["extra"]:
+                diff[label] = edges
+    return diff
+
+
+def write_report(path, diff, sample=None):
+    report = {
+        "sample": sample,
+        "classes": {
+            label: {
+                "missing": len(edges["missing"]),
+                "extra": len(edges["extra"]),
+                "edges": {
+                    kind: [list(pair) for pair in edges[kind]]
+                    for kind in ("missing", "extra")
+                },
+            }
+            for label, edges in sorted(diff.items())
+        },
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, separators=(",", ":"))
+
+
+def read_report(path):
+    """Returns the diff of a report written by :func:`write_report`"""
+
+    with open(path) as f:
+        report = json.load(f)
+
+    return {
+        label: {
+            kind: [tuple(pair) for pair in summary["edges"][kind]]
+            for kind in ("missing", "extra")
+        }
+        for label, summary in report["classes"].items()
+    }
+
+
+def repair(graph, diff, batch_size=BATCH_SIZE):
+    """Applies :param:`diff`, committing every :param:`batch_size` edges
+
+    :returns: tuple of the number of edges (inserted, deleted)
+
+    """
+
+    inserted = deleted = 0
+    for label, edges in sorted(diff.items()):
+        for kind in ("missing", "extra"):
+            for batch in caching.chunks(edges[kind], batch_size):
+                with graph.session_scope() as session:
+                    counts = caching.repair_related_cases(
+                        session, label, **{kind: batch}
+                    )
+                inserted += counts[0]
+                deleted += counts[1]
+
+        logger.info(
+            "%s: repaired %d missing, %d extra",
+            label,
+            len(edges["missing"]),
+            len(edges["extra"]),
+        )
+
+    return inserted, deleted
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Audit (and repair) the related case shortcut edges"
+    )
+    parser.add_argument(
+        "-H", "--host", type=str, action="store", required=True, help="psql-server host"
+    )
+    parser.add_argument(
+        "-U", "--user", type=str, action="store", required=True, help="psql test user"
+    )
+    parser.add_argument(
+        "-D",
+        "--database",
+        type=str,
+        action="store",
+        required=True,
+        help="psql test database",
+    )
+    parser.add_argument(
+        "-P", "--password", type=str, action="store", help="psql test password"
+    )
+    parser.add_argument(
+        "--report",
+        type=str,
+        action="store",
+        help="File to write the diff report to.",
+    )
+    parser.add_argument(
+        "--labels",
+        type=str,
+        action="store",
+        help="Only audit these node labels (comma separated).",
+    )
+    parser.add_argument(
+        "--sample",
+        type=float,
+        action="store",
+        help="Only audit this percentage of each node table.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        action="store",
+        help="Number of classes to audit in parallel, defaults to the cpu count.",
+    )
+    parser.add_argument(
+        "--repair",
+        action="store_true",
+        help="Insert the missing and delete the extra shortcut edges.",
+    )
+    parser.add_argument(
+        "--from-report",
+        type=str,
+        action="store",
+        help="Repair the diff of this report instead of auditing.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        action="store",
+        default=BATCH_SIZE,
+        help="Number of shortcut edges repaired per transaction.",
+    )
+
+    args = parser.parse_args()
+    password = args.password or getpass.getpass(f"Password for {args.user}:")
+    graph_kwargs = dict(
+        host=args.host, user=args.user, password=password, database=args.database
+    )
+
+    if args.from_report:
+        diff = read_report(args.from_report)
+    else:
+        labels = [label for label in (args.labels or "").split(",") if label]
+        diff = audit(graph_kwargs, labels, args.sample, args.processes)
+        if args.report:
+            write_report(args.report, diff, args.sample)
+
+    if args.repair or args.from_report:
+        inserted, deleted = repair(
+            PsqlGraphDriver(**graph_kwargs), diff, args.batch_size
+        )
+        logger.info("Inserted %d, deleted %d shortcut edges", inserted, deleted)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+migrations.index_tags
+----------------------------------
+
+Migrates up/down between states A -> B
+A: without
+B: with
+the following index per class with tagProperties
+- _sysan ->> 'tag'
+
+The indexes are planned and built by the same steps as the
+``graph-index`` subcommand of :mod:`gdcdatamodel.gdc_postgres_admin`:
+CONCURRENTLY, so that node tables stay writable, which cannot happen
+inside a transaction.  An index left INVALID by an interrupted build is
+dropped and built again.
+
+"""
+
+import logging
+
+from psqlgraph import Node
+from sqlalchemy import text
+
+from gdcdatamodel import gdc_postgres_admin as pgadmin
+from gdcdatamodel.models.indexes import index_name
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def get_indexes():
+    """Yields the tag indexes declared on the node tables by
+    :func:`gdcdatamodel.models.indexes.get_tag_indexes`
+
+    """
+
+    for cls in Node.get_subclasses():
+        for index in cls.__table__.indexes:
+            if index.name == index_name(cls, "tag"):
+                yield index
+
+
+def up_transaction(connection):
+    logger.info("Migrating index-tags: up")
+
+    for step in pgadmin.plan_index_steps(connection, get_indexes()):
+        logger.info("Running step: %s", step.name)
+        for statement in step.statements:
+            connection.execute(text(statement))
+
+
+def down_transaction(connection):
+    logger.info("Migrating index-tags: down")
+
+    for index in get_indexes():
+        logger.info("Dropping %s", index.name)
+        connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index.name}"))
+
+
+def up(connection):
+    up_transaction(connection.execution_options(isolation_level="AUTOCOMMIT"))
+
+
+def down(connection):
+    down_transaction(connection.execution_options(isolation_level="AUTOCOMMIT"))
@@ -0,0 +1,199 @@
+#!/usr/bin/env python
+
+"""gdcdatamodel.migrations.node_ancestors
+----------------------------------
+
+Creates the `node_ancestors` closure table (see
+:mod:`gdcdatamodel.models.ancestry`) and (re)builds it from the edge
+tables.
+
+The table is truncated and rebuilt one descendant class at a time, in
+parallel, with a recursive CTE that enumerates the paths out of the
+class's nodes, up to ``MAX_DEPTH`` edges long like the edge hooks, and
+counts them per (ancestor, depth).  The rebuild holds the
+``NODE_ANCESTRY_LOCK_ID`` advisory lock throughout, so writers
+maintaining the table wait for it to finish, and it waits for those
+already running.
+
+Usage:
+
+```
+python -m migrations.node_ancestors -H localhost -U test -D automated_test
+```
+
+"""
+
+import argparse
+import getpass
+import logging
+import time
+from multiprocessing import Pool, cpu_count
+
+from psqlgraph import Edge, Node, PsqlGraphDriver
+from sqlalchemy import text
+
+from gdcdatamodel import models
+from gdcdatamodel.models import ancestry, caching
+
+logger = logging.getLogger("node_ancestors")
+logging.basicConfig(level=logging.INFO)
+
+BUILD_ANCESTORS_SQL = """
+INSERT INTO node_ancestors (descendant_id, ancestor_id, ancestor_label, depth, paths)
+WITH RECURSIVE lineage_edges (src_id, dst_id, dst_label) AS (
+    {lineage_edges}
+), paths (descendant_id, ancestor_id, ancestor_label, depth) AS (
+        SELECT src_id, dst_id, dst_label, 1
+        FROM ({start_edges}) AS start_edges (src_id, dst_id, dst_label)
+    UNION ALL
+        SELECT paths.descendant_id, lineage_edges.dst_id, lineage_edges.dst_label,
+               paths.depth + 1
+        FROM paths
+        JOIN lineage_edges ON lineage_edges.src_id = paths.ancestor_id
+        WHERE paths.depth < {max_depth}
+)
+SELECT descendant_id, ancestor_id, ancestor_label, depth, count(*)
+FROM paths
+GROUP BY descendant_id, ancestor_id, ancestor_label, depth
+"""
+
+
+def up(connection):
+    logger.info("Migrating node_ancestors: up")
+
+    models.ancestry.Base.metadata.create_all(connection)
+
+
+def down(connection):
+    logger.info("Migrating node_ancestors: down")
+
+    models.ancestry.Base.metadata.drop_all(connection)
+
+
+def get_lineage_edges(src_label=None):
+    """Returns the SELECTs of (src_id, dst_id, dst_label) of every edge
+    table, or of those out of :param:`src_label`, without the case
+    shortcut edges
+
+    """
+
+    selects = []
+    for edge_cls in sorted(Edge.get_subclasses(), key=lambda e: e.__tablename__):
+        if caching.is_related_case_edge(edge_cls):
+            continue
+        if src_label is not None:
+            if caching.get_edge_node_cls(edge_cls, "src").get_label() != src_label:
+                continue
+
+        dst_label = caching.get_edge_node_cls(edge_cls, "dst").get_label()
+        selects.append(
+            f"SELECT src_id, dst_id, '{dst_label}' FROM {edge_cls.__tablename__}"
+        )
+    return selects
+
+
+def get_build_ancestors_sql(label):
+    start_edges = get_lineage_edges(label)
+    if not start_edges:
+        return None
+
+    return BUILD_ANCESTORS_SQL.format(
+        lineage_edges="\n    UNION ALL ".join(get_lineage_edges()),
+        start_edges="\n            UNION ALL ".join(start_edges),
+        max_depth=ancestry.MAX_DEPTH,
+    )
+
+
+def build_cls_ancestors(graph, label):
+    """Inserts the ancestors of every node of the class with
+    :param:`label`
+
+    :returns: number of rows inserted
+
+    """
+
+    statement = get_build_ancestors_sql(label)
+    if statement is None:
+        return 0
+
+    with graph.session_scope() as session:
+        return session.execute(text(statement)).rowcount
+
+
+def build_cls_job(job):
+    """Pool entry point, each process connects with its own driver"""
+
+    graph_kwargs, label = job
+    graph = PsqlGraphDriver(**graph_kwargs)
+
+    start = time.time()
+    rows = build_cls_ancestors(graph, label)
+    return label, rows, time.time() - start
+
+
+def rebuild_node_ancestors(graph_kwargs, processes=None):
+    """Truncates and rebuilds the closure table, holding the advisory
+    lock the edge hooks share for the duration
+
+    """
+
+    graph = PsqlGraphDriver(**graph_kwargs)
+    params = {"lock_id": ancestry.NODE_ANCESTRY_LOCK_ID}
+    with graph.engine.connect() as lock_connection:
+        lock_connection.execute(text("SELECT pg_advisory_lock(:lock_id)"), params)
+        try:
+            with graph.engine.begin() as connection:
+                up(connection)
+                connection.execute(text("TRUNCATE node_ancestors"))
+
+            jobs = [(graph_kwargs, cls.get_label()) for cls in Node.get_subclasses()]
+            with Pool(processes or cpu_count()) as pool:
+                for label, rows, elapsed in pool.imap_unordered(build_cls_job, jobs):
+                    if rows:
+                        logger.info("%s: %d rows (%.1fs)", label, rows, elapsed)
+
+            with graph.engine.begin() as connection:
+                connection.execute(text("ANALYZE node_ancestors"))
+        finally:
+            lock_connection.execute(text("SELECT pg_advisory_unlock(:lock_id)"), params)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Rebuild the node_ancestors closure table"
+    )
+    parser.add_argument(
+        "-H", "--host", type=str, action="store", required=True, help="psql-server host"
+    )
+    parser.add_argument(
+        "-U", "--user", type=str, action="store", required=True, help="psql test user"
+    )
+    parser.add_argument(
+        "-D",
+        "--database",
+        type=str,
+        action="store",
+        required=True,
+        help="psql test database",
+    )
+    parser.add_argument(
+        "-P", "--password", type=str, action="store", help="psql test password"
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        action="store",
+        help="Number of classes to build in parallel, defaults to the cpu count.",
+    )
+
+    args = parser.parse_args()
+    password = args.password or getpass.getpass(f"Password for {args.user}:")
+    graph_kwargs = dict(
+        host=args.host, user=args.user, password=password, database=args.database
+    )
+
+    rebuild_node_ancestors(graph_kwargs, args.processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""
+migrations.related_cases_queue
+----------------------------------
+
+Create the `related_cases_queue` table the related case hooks defer
+large cascades to.
+"""
+
+import logging
+
+from gdcdatamodel import models
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+
+def up(connection):
+    logger.info("Migrating related_cases_queue: up")
+
+    models.caching.Base.metadata.create_all(connection)
+
+
+def down(connection):
+    logger.info("Migrating related_cases_queue: down")
+
+    models.caching.Base.metadata.drop_all(connection)
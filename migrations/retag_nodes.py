@@ -0,0 +1,410 @@
+#!/usr/bin/env python
+
+"""gdcdatamodel.migrations.retag_nodes
+----------------------------------
+
+Computes (or repairs) the `tag`, `ver` and `latest` system annotations
+of every node in classes with `tagProperties`, without going through
+the insert hooks.
+
+Classes are processed bottom-up: a class is only tagged once all of
+the classes its tag depends on have been, so the tags of a node's
+parents are read back from the database instead of being recomputed.
+Classes at the same depth are tagged in parallel, one class per
+process.  Each class is done in two stages:
+
+1. tags: the class is streamed in chunks ordered by node_id, the tag
+   of each node is computed from its tag properties and its parents'
+   tags and written back with one batched UPDATE per chunk.  Nodes
+   that are not taggable lose their tag.
+2. versions: within each tag, nodes are numbered by `created` and the
+   last one is flagged `latest`, one set-based UPDATE per chunk of
+   tags.
+
+The tables are inconsistent while the tool runs, so it should be run
+offline.  Progress is committed per chunk and recorded in a checkpoint
+file per class, so an interrupted run picks up where it stopped when
+given the same checkpoint directory.
+
+Usage:
+
+```
+python -m migrations.retag_nodes -H localhost -U test -D automated_test \\
+    --checkpoint-dir /tmp/retag
+```
+
+"""
+
+import argparse
+import getpass
+import logging
+import os
+import time
+from collections import defaultdict
+from multiprocessing import Pool, cpu_count
+
+from psqlgraph import Node, PsqlGraphDriver
+from sqlalchemy import bindparam, select, text
+
+from gdcdatamodel import models  # noqa
+from gdcdatamodel.models import versioning
+from migrations import utils
+
+logger = logging.getLogger("retag_nodes")
+logging.basicConfig(level=logging.INFO)
+
+#: Number of nodes tagged (or tags versioned) per transaction
+CHUNK_SIZE = 5000
+
+VERSION_TAGS_SQL = """
+WITH tags AS (
+    SELECT DISTINCT _sysan->>'tag' AS tag
+    FROM {table}
+    WHERE _sysan->>'tag' > :last_tag
+    ORDER BY 1
+    LIMIT :limit
+), versions AS (
+    SELECT node_id,
+           row_number() OVER (
+               PARTITION BY _sysan->>'tag' ORDER BY created, node_id
+           ) AS ver,
+           count(*) OVER (PARTITION BY _sysan->>'tag') AS versions
+    FROM {table}
+    WHERE _sysan->>'tag' IN (SELECT tag FROM tags)
+), updated AS (
+    UPDATE {table}
+    SET _sysan = {table}._sysan || jsonb_build_object(
+        'ver', versions.ver,
+        'latest', versions.ver = versions.versions
+    )
+    FROM versions
+    WHERE {table}.node_id = versions.node_id
+    RETURNING 1
+)
+SELECT (SELECT max(tag) FROM tags), (SELECT count(*) FROM updated)
+"""
+
+
+def is_taggable_cls(cls):
+    return bool(cls._dictionary.get("tagProperties"))
+
+
+def get_tag_links(cls):
+    """Returns the (edge class, parent class) pairs of the out edges
+    whose destination contributes to the tag of :param:`cls` nodes
+
+    """
+
+    links = []
+    for link in cls._pg_links.values():
+        edge_cls = getattr(cls, link["edge_out"]).property.mapper.class_
+        if edge_cls.get_label() == "relates_to":
+            continue
+        if is_taggable_cls(link["dst_type"]):
+            links.append((edge_cls, link["dst_type"]))
+    return links
+
+
+def get_levels(classes):
+    """Orders taggable classes into levels where every class only
+    depends on classes of previous levels.  Classes in a dependency
+    cycle are placed in a last level.
+
+    """
+
+    pending = {
+        cls: {dst for _, dst in get_tag_links(cls) if dst is not cls and dst in classes}
+        for cls in classes
+    }
+
+    levels = []
+    while pending:
+        level = [cls for cls, deps in pending.items() if not deps]
+        if not level:
+            logger.warning(
+                "Dependency cycle between %s, parent tags may be stale",
+                sorted(cls.get_label() for cls in pending),
+            )
+            level = list(pending)
+
+        levels.append(sorted(level, key=lambda cls: cls.get_label()))
+        pending = {
+            cls: deps - set(level) for cls, deps in pending.items() if cls not in level
+        }
+
+    return levels
+
+
+class Checkpoint(utils.Checkpoint):
+    initial_state = {"stage": "tags", "last_id": "", "last_tag": ""}
+
+
+def get_parent_tags(session, cls, node_ids):
+    """Returns the tags of the parents of the given nodes, as read from
+    the database, keyed by node id.  Parents of the same class are left
+    out as they may not have been retagged yet.
+
+    """
+
+    parent_tags = defaultdict(list)
+    for edge_cls, dst_cls in get_tag_links(cls):
+        if dst_cls is cls:
+            continue
+
+        edges, parents = edge_cls.__table__, dst_cls.__table__
+        tag = parents.c._sysan[versioning.TagKeys.tag].astext
+        query = (
+            select([edges.c.src_id, tag])
+            .select_from(edges.join(parents, parents.c.node_id == edges.c.dst_id))
+            .where(edges.c.src_id.in_(node_ids))
+            .where(tag.isnot(None))
+        )
+        for node_id, parent_tag in session.execute(query):
+            parent_tags[node_id].append(parent_tag)
+
+    return parent_tags
+
+
+def get_self_parents(session, cls, node_ids):
+    """Returns the parents of the given nodes that are of the same class,
+    keyed by node id, with one query per self referencing edge table
+
+    """
+
+    parents = defaultdict(list)
+    for edge_cls, dst_cls in get_tag_links(cls):
+        if dst_cls is not cls:
+            continue
+
+        query = (
+            session.query(edge_cls.src_id, dst_cls)
+            .join(dst_cls, dst_cls.node_id == edge_cls.dst_id)
+            .filter(edge_cls.src_id.in_(node_ids))
+        )
+        for node_id, parent in query:
+            parents[node_id].append(parent)
+
+    return parents
+
+
+def tag_chunk(graph, cls, last_id, chunk_size=CHUNK_SIZE):
+    """Tags the next chunk of :param:`cls` nodes after :param:`last_id`
+
+    :returns: (id of the last node in the chunk, number of nodes in the
+        chunk), the id is None when there are no nodes left
+
+    """
+
+    cache = versioning.TagCache()
+
+    with graph.session_scope() as session:
+        nodes = (
+            graph.nodes(cls)
+            .filter(cls.node_id > last_id)
+            .order_by(cls.node_id)
+            .limit(chunk_size)
+            .all()
+        )
+        if not nodes:
+            return None, 0
+
+        node_ids = [node.node_id for node in nodes]
+        parent_tags = get_parent_tags(session, cls, node_ids)
+        self_parents = get_self_parents(session, cls, node_ids)
+
+        updates = []
+        for node in nodes:
+            sysan = dict(node._sysan)
+            if not node.is_taggable():
+                logger.debug("Removing tag: %s is not taggable", node)
+                for key in (
+                    versioning.TagKeys.tag,
+                    versioning.TagKeys.version,
+                    versioning.TagKeys.latest,
+                ):
+                    sysan.pop(key, None)
+            else:
+                try:
+                    sysan[versioning.TagKeys.tag] = versioning.build_tag(
+                        node,
+                        parent_tags[node.node_id]
+                        + [
+                            versioning.compute_tag(parent, cache)
+                            for parent in self_parents[node.node_id]
+                            if parent.is_taggable()
+                        ],
+                    )
+                except ValueError as e:
+                    logger.warning(
+                        "%s: could not compute tag, left unchanged: %s",
+                        node.node_id,
+                        e,
+                    )
+
+            if sysan != node._sysan:
+                updates.append({"_node_id": node.node_id, "_sysan": sysan})
+
+        if updates:
+            table = cls.__table__
+            session.execute(
+                table.update()
+                .where(table.c.node_id == bindparam("_node_id"))
+                .values(_sysan=bindparam("_sysan")),
+                updates,
+            )
+
+        return nodes[-1].node_id, len(nodes)
+
+
+def version_chunk(graph, cls, last_tag, chunk_size=CHUNK_SIZE):
+    """Versions the nodes of the next chunk of tags after :param:`last_tag`
+
+    :returns: (last tag of the chunk, number of nodes updated), the tag
+        is None when there are no tags left
+
+    """
+
+    statement = text(VERSION_TAGS_SQL.format(table=cls.__tablename__))
+    with graph.session_scope() as session:
+        return session.execute(
+            statement, {"last_tag": last_tag, "limit": chunk_size}
+        ).fetchone()
+
+
+def retag_cls(graph, cls, checkpoint_dir=None, chunk_size=CHUNK_SIZE):
+    """Tags then versions all nodes of a single class, resuming from
+    the class's checkpoint in :param:`checkpoint_dir`
+
+    """
+
+    checkpoint = Checkpoint(checkpoint_dir, cls.get_label())
+    start, count = time.time(), 0
+
+    if checkpoint.state["stage"] == "tags":
+        last_id = checkpoint.state["last_id"]
+        while True:
+            last_id, tagged = tag_chunk(graph, cls, last_id, chunk_size)
+            if last_id is None:
+                break
+            checkpoint.save(last_id=last_id)
+            count += tagged
+            logger.info("%s: tagged %d nodes", cls.get_label(), count)
+        checkpoint.save(stage="versions")
+
+    if checkpoint.state["stage"] == "versions":
+        last_tag = checkpoint.state["last_tag"]
+        while True:
+            last_tag, updated = version_chunk(graph, cls, last_tag, chunk_size)
+            if last_tag is None:
+                break
+            checkpoint.save(last_tag=last_tag)
+            logger.info("%s: versioned %d nodes", cls.get_label(), updated)
+        checkpoint.save(stage="done")
+
+    logger.info("%s: done in %.1fs", cls.get_label(), time.time() - start)
+
+
+def retag_cls_job(job):
+    """Pool entry point, each process connects with its own driver"""
+
+    graph_kwargs, label, checkpoint_dir, chunk_size = job
+    graph = PsqlGraphDriver(**graph_kwargs)
+    retag_cls(graph, Node.get_subclass(label), checkpoint_dir, chunk_size)
+    return label
+
+
+def retag_nodes(
+    graph_kwargs,
+    labels=None,
+    checkpoint_dir=None,
+    processes=None,
+    chunk_size=CHUNK_SIZE,
+):
+    """Retags all taggable classes (or only those in :param:`labels`).
+    Classes that are not selected are assumed to be correctly tagged.
+
+    """
+
+    classes = [
+        cls
+        for cls in Node.get_subclasses()
+        if is_taggable_cls(cls) and (not labels or cls.get_label() in labels)
+    ]
+
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    with Pool(processes or cpu_count()) as pool:
+        for level in get_levels(classes):
+            jobs = [
+                (graph_kwargs, cls.get_label(), checkpoint_dir, chunk_size)
+                for cls in level
+            ]
+            for label in pool.imap_unordered(retag_cls_job, jobs):
+                logger.info("Finished %s", label)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compute the tag, ver and latest annotations of all nodes"
+    )
+    parser.add_argument(
+        "-H", "--host", type=str, action="store", required=True, help="psql-server host"
+    )
+    parser.add_argument(
+        "-U", "--user", type=str, action="store", required=True, help="psql test user"
+    )
+    parser.add_argument(
+        "-D",
+        "--database",
+        type=str,
+        action="store",
+        required=True,
+        help="psql test database",
+    )
+    parser.add_argument(
+        "-P", "--password", type=str, action="store", help="psql test password"
+    )
+    parser.add_argument(
+        "--labels",
+        type=str,
+        action="store",
+        help="Only retag these node labels (comma separated).",
+    )
+    parser.add_argument(
+        "--checkpoint-dir",
+        type=str,
+        action="store",
+        help="Directory to record progress in and resume from.",
+    )
+    parser.add_argument(
+        "--processes",
+        type=int,
+        action="store",
+        help="Number of classes to retag in parallel, defaults to the cpu count.",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        action="store",
+        default=CHUNK_SIZE,
+        help="Number of nodes updated per transaction.",
+    )
+
+    args = parser.parse_args()
+    password = args.password or getpass.getpass(f"Password for {args.user}:")
+    graph_kwargs = dict(
+        host=args.host, user=args.user, password=password, database=args.database
+    )
+
+    retag_nodes(
+        graph_kwargs,
+        labels=[label for label in (args.labels or "").split(",") if label],
+        checkpoint_dir=args.checkpoint_dir,
+        processes=args.processes,
+        chunk_size=args.chunk_size,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -4,58 +4,38 @@ gdcdatamodel.migrations.update_case_cache
 
 Functionality to fix stale case caches in _related_cases edge tables.
 
+Both functions refresh whole trees with
+:func:`gdcdatamodel.models.caching.refresh_related_case_trees`: the
+descendants of the given nodes are found once and their shortcut edges
+recomputed with one statement per shortcut table, instead of deleting
+and re-adding every edge to cascade the edge hooks through the ORM.
+
 """
 
+from gdcdatamodel.models import caching
+
 
 def update_related_cases(driver, node_id):
-    """Removes and re-adds the edge between the given node and it's parent
-    to cascade the new relationship to _related_cases through the
-    graph
+    """Recomputes the _related_cases of the given node and everything
+    below it
+
+    :returns: dict of counts of ``nodes`` refreshed, ``inserted`` and
+        ``deleted`` shortcut edges
 
     """
 
     with driver.session_scope() as session:
-
-        node = driver.nodes().ids(node_id).one()
-        edges_out = node.edges_out
-
-        for edge in edges_out:
-            edge_cls = edge.__class__
-            copied_edge = edge_cls(
-                src_id=edge.src_id,
-                dst_id=edge.dst_id,
-                properties=dict(edge.props),
-                system_annotations=dict(edge.sysan),
-            )
-
-            # Delete the edge
-            driver.edges(edge_cls).filter(
-                edge_cls.src_id == copied_edge.src_id,
-                edge_cls.dst_id == copied_edge.dst_id,
-            ).delete()
-
-            session.expunge(edge)
-
-            # Re-add the edge to force a refresh of the stale cache
-            session.add(copied_edge)
-
-            # Assert the edge was re-added or abort the session
-            driver.edges(edge_cls).filter(
-                edge_cls.src_id == copied_edge.src_id,
-                edge_cls.dst_id == copied_edge.dst_id,
-            ).one()
+        return caching.refresh_related_case_trees(session, [node_id])
 
 
 def update_cache_cache_tree(driver, case):
     """Updates the _related_cases case cache for all children in the
     :param:`case` tree
 
+    :returns: dict of counts of ``nodes`` refreshed, ``inserted`` and
+        ``deleted`` shortcut edges
+
     """
 
-    visited = set()
-    with driver.session_scope():
-        for neighbor in case.edges_in:
-            if neighbor.src_id in visited:
-                continue
-            update_related_cases(driver, neighbor.src_id)
-            visited.add(neighbor.src_id)
+    with driver.session_scope() as session:
+        return caching.refresh_related_case_trees(session, [case.node_id])
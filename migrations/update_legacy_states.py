@@ -18,7 +18,11 @@ what is now `file_state`.  This script transforms the old `state` into
 | validated       | submitted     | validated          |
 
 This script runs in parallel -> it has to use separate sessions -> it
-has a session per Node subclass which is automatically committed.
+has a process per Node subclass.  Each class is streamed in chunks
+ordered by node_id, every chunk updated by a single set-based UPDATE and
+committed on its own.  Nodes that already have a `legacy_state` system
+annotation are left alone, and with a checkpoint directory an
+interrupted run picks up after the last committed chunk of each class.
 
 See also https://jira.opensciencedatacloud.org/browse/DAT-276.
 
@@ -26,22 +30,22 @@ Usage:
 
 ```python
 update_legacy_states(
-    host='localhost',
-    user='test',
-    database='automated_test',
-    password='test')
+    dict(host='localhost', user='test', database='automated_test', password='test'),
+    checkpoint_dir='/tmp/legacy_states')
 ```
 
 """
 
 import logging
-from collections import namedtuple
+import os
+import time
 from multiprocessing import Process, Queue, cpu_count
 
 from psqlgraph import Node, PsqlGraphDriver
-from sqlalchemy import and_, not_, or_
+from sqlalchemy import not_, or_, text
 
 from gdcdatamodel import models as md
+from migrations import utils
 
 CLS_WITH_PROJECT_ID = {
     cls for cls in Node.get_subclasses() if "project_id" in cls.__pg_properties__
@@ -67,10 +71,59 @@ STATE_MAP = {
 }
 
 
+#: Number of nodes updated per transaction
+CHUNK_SIZE = 10000
+
+UPDATE_CHUNK_SQL = """
+WITH state_map (state, new_state, new_file_state) AS (
+    VALUES {state_map}
+), chunk AS (
+    SELECT node_id,
+           _props->>'state' AS state,
+           _props->>'file_state' AS file_state
+    FROM {table}
+    WHERE node_id > :last_id
+    AND NOT (_sysan ? 'legacy_state')
+    AND (_props->>'project_id' IS NULL
+         OR _props->>'project_id' = ANY(CAST(:project_ids AS text[])))
+    AND (_props->>'state' IS NULL
+         OR _props->>'state' = ANY(CAST(:states AS text[]))
+         {file_state_option})
+    ORDER BY node_id
+    LIMIT :limit
+), updated AS (
+    UPDATE {table}
+    SET _props = CASE
+            WHEN state_map.new_state IS NULL THEN {table}._props
+            ELSE {table}._props
+                || jsonb_build_object('state', state_map.new_state)
+                || CASE
+                    WHEN {has_file_state} AND chunk.file_state IS NULL
+                    THEN jsonb_build_object('file_state', state_map.new_file_state)
+                    ELSE '{{}}'::jsonb
+                END
+        END,
+        _sysan = {table}._sysan || jsonb_build_object(
+            'legacy_state', chunk.state,
+            'legacy_file_state', chunk.file_state
+        )
+    FROM chunk
+    LEFT JOIN state_map ON state_map.state IS NOT DISTINCT FROM chunk.state
+    WHERE {table}.node_id = chunk.node_id
+    RETURNING 1
+)
+SELECT (SELECT max(node_id) FROM chunk), (SELECT count(*) FROM updated)
+"""
+
+
 logger = logging.getLogger("state_updater")
 logging.basicConfig(level=logging.INFO)
 
 
+class Checkpoint(utils.Checkpoint):
+    initial_state = {"last_id": "", "done": False}
+
+
 def legacy_filter(query, legacy_projects):
     """filter query to those whose project_id is None or points to TARGET
     or TCGA
@@ -95,11 +148,22 @@ def null_prop(cls, key):
     )
 
 
-def print_cls_query_summary(graph):
+def get_legacy_projects(graph):
+    return graph.nodes(md.Project).props(state="legacy").all()
+
+
+def get_project_ids(projects):
+    return [project.programs[0].name + "-" + project.code for project in projects]
+
+
+def print_cls_query_summary(graph, legacy_projects=None):
     """Print breakdown of class counts to stdout"""
 
+    if legacy_projects is None:
+        legacy_projects = get_legacy_projects(graph)
+
     cls_queries = {
-        cls.get_label(): cls_query(graph, cls)
+        cls.get_label(): cls_query(graph, cls, legacy_projects)
         for cls in CLS_WITH_PROJECT_ID & CLS_WITH_STATE
     }
 
@@ -107,7 +171,7 @@ def print_cls_query_summary(graph):
         "%s: %d"
         % (
             "legacy_stateless_nodes".ljust(40),
-            sum(query.count() for query in cls_queries.itervalues()),
+            sum(query.count() for query in cls_queries.values()),
         )
     )
 
@@ -117,10 +181,11 @@ def print_cls_query_summary(graph):
             print("%35s : %d" % (label, count))
 
 
-def cls_query(graph, cls):
+def cls_query(graph, cls, legacy_projects=None):
     """Returns query for legacy nodes with state in {null, 'live'}"""
 
-    legacy_projects = graph.nodes(md.Project).props(state="legacy").all()
+    if legacy_projects is None:
+        legacy_projects = get_legacy_projects(graph)
 
     options = [
         # state
@@ -134,57 +199,96 @@ def cls_query(graph, cls):
     return legacy_filter(graph.nodes(cls), legacy_projects).filter(or_(*options))
 
 
-def update_cls(graph, cls):
-    """Updates as described in update_target_states for a single class"""
+def get_update_chunk_sql(cls):
+    """Returns the statement updating the next chunk of legacy nodes of
+    :param:`cls` as described in the module docstring, along with the
+    parameters of its state map
 
-    with graph.session_scope() as session:
-        query = cls_query(graph, cls)
-        count = query.count()
-        if count == 0:
-            return
+    """
+
+    has_file_state = "file_state" in cls.__pg_properties__
+
+    rows, params = [], {}
+    for i, (state, mapping) in enumerate(STATE_MAP.items()):
+        rows.append(
+            f"(CAST(:state_{i} AS text), CAST(:new_state_{i} AS text), "
+            f"CAST(:new_file_state_{i} AS text))"
+        )
+        params.update(
+            {
+                f"state_{i}": state,
+                f"new_state_{i}": mapping["state"],
+                f"new_file_state_{i}": mapping["file_state"],
+            }
+        )
+    params["states"] = [state for state in STATE_MAP if state is not None]
+
+    sql = UPDATE_CHUNK_SQL.format(
+        table=cls.__tablename__,
+        state_map=",\n           ".join(rows),
+        file_state_option=(
+            "OR _props->>'file_state' IS NULL" if has_file_state else ""
+        ),
+        has_file_state=str(has_file_state).upper(),
+    )
+    return text(sql), params
 
-        logger.info("Loading %d %s nodes", count, cls.label)
-        nodes = query.all()
-        logger.info("Loaded %d %s nodes", len(nodes), cls.label)
 
-        for node in nodes:
-            state = node._props.get("state", None)
-            file_state = node._props.get("file_state", None)
+def update_cls(graph, cls, project_ids, checkpoint_dir=None, chunk_size=CHUNK_SIZE):
+    """Updates as described in update_target_states for a single class,
+    one chunk of nodes per transaction
 
-            if state in STATE_MAP:
-                node.state = STATE_MAP[state]["state"]
+    """
 
-            set_file_state = (
-                "file_state" in node.__pg_properties__
-                and file_state is None
-                and state in STATE_MAP
-            )
+    checkpoint = Checkpoint(checkpoint_dir, cls.get_label())
+    if checkpoint.state["done"]:
+        logger.info("Skipping %s nodes, already done", cls.label)
+        return
 
-            if set_file_state:
-                node.file_state = STATE_MAP[state]["file_state"]
+    statement, params = get_update_chunk_sql(cls)
+    params.update(project_ids=project_ids, limit=chunk_size)
 
-            node.sysan["legacy_state"] = state
-            node.sysan["legacy_file_state"] = file_state
+    last_id = checkpoint.state["last_id"]
+    start, count = time.time(), 0
+    while True:
+        with graph.session_scope() as session:
+            chunk_last_id, updated = session.execute(
+                statement, dict(params, last_id=last_id)
+            ).fetchone()
+
+        if chunk_last_id is None:
+            break
+
+        last_id = chunk_last_id
+        checkpoint.save(last_id=last_id)
+        count += updated
+        logger.info(
+            "%s: updated %d nodes (%.0f nodes/s)",
+            cls.label,
+            count,
+            count / max(time.time() - start, 1e-6),
+        )
 
-        logger.info("Committing %s nodes", cls.label)
-        graph.current_session().commit()
-        logger.info("Done with %s nodes", cls.label)
+    checkpoint.save(done=True)
+    logger.info("Done with %d %s nodes in %.1fs", count, cls.label, time.time() - start)
 
 
-def update_classes(graph_kwargs, input_q):
+def update_classes(graph_kwargs, input_q, project_ids, checkpoint_dir, chunk_size):
     """Creates a db driver and pulls classes from the queue to update"""
 
     graph = PsqlGraphDriver(**graph_kwargs)
 
     while True:
-        cls = input_q.get()
-        if cls is None:  # none means no more work
+        label = input_q.get()
+        if label is None:  # none means no more work
             return
 
-        update_cls(graph, cls)
+        update_cls(
+            graph, Node.get_subclass(label), project_ids, checkpoint_dir, chunk_size
+        )
 
 
-def update_legacy_states(graph_kwargs):
+def update_legacy_states(graph_kwargs, checkpoint_dir=None, chunk_size=CHUNK_SIZE):
     """Updates state, file_state on legacy nodes
 
     - node.state in {None, 'live'}
@@ -196,17 +300,25 @@ def update_legacy_states(graph_kwargs):
 
     graph = PsqlGraphDriver(**graph_kwargs)
     with graph.session_scope():
-        print_cls_query_summary(graph)
+        legacy_projects = get_legacy_projects(graph)
+        project_ids = get_project_ids(legacy_projects)
+        print_cls_query_summary(graph, legacy_projects)
+
+    if checkpoint_dir:
+        os.makedirs(checkpoint_dir, exist_ok=True)
 
     input_q = Queue()
 
     pool = [
-        Process(target=update_classes, args=(graph_kwargs, input_q))
+        Process(
+            target=update_classes,
+            args=(graph_kwargs, input_q, project_ids, checkpoint_dir, chunk_size),
+        )
         for _ in range(cpu_count())
     ]
 
-    for cls in CLS_TO_UPDATE:
-        input_q.put(cls)
+    for cls in sorted(CLS_TO_UPDATE, key=lambda cls: cls.get_label()):
+        input_q.put(cls.get_label())
 
     for process in pool:
         input_q.put(None)  # put a no more work signal for each process
@@ -0,0 +1,42 @@
+"""
+gdcdatamodel.migrations.utils
+--------------------
+
+Helpers shared by the offline migration scripts.
+
+"""
+
+import json
+import os
+import tempfile
+
+
+class Checkpoint:
+    """Progress of a single class, persisted to ``<directory>/<label>.json``
+
+    Subclasses set the :attr:`initial_state` of their migration.  Each
+    save replaces the file atomically, so an interrupted run resumes
+    from the last saved state.
+
+    """
+
+    #: State of a class that has not been started
+    initial_state = {}
+
+    def __init__(self, directory, label):
+        self.path = os.path.join(directory, f"{label}.json") if directory else None
+        self.state = dict(self.initial_state)
+
+        if self.path and os.path.exists(self.path):
+            with open(self.path) as f:
+                self.state.update(json.load(f))
+
+    def save(self, **state):
+        self.state.update(state)
+        if not self.path:
+            return
+
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path))
+        with os.fdopen(fd, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.path)
@@ -49,6 +49,8 @@ def create_ng_tables(engine):
     models.redaction.Base.metadata.create_all(engine)
     models.qcreport.Base.metadata.create_all(engine)
     models.misc.Base.metadata.create_all(engine)
+    models.ancestry.Base.metadata.create_all(engine)
+    models.caching.Base.metadata.create_all(engine)
 
 
 def truncate_ng_tables(conn):
@@ -60,6 +62,8 @@ def truncate_ng_tables(conn):
         models.redaction.Base.metadata,
         models.qcreport.Base.metadata,
         models.misc.Base.metadata,
+        models.ancestry.Base.metadata,
+        models.caching.Base.metadata,
     ]
 
     for meta in ng_models_metadata:
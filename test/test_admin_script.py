@@ -211,3 +211,99 @@ def test_revoke_permissions(
     run_admin_command(["graph-revoke", f"--{permission}={dummy_user}"])
     # verify user no longer has permission
     invalid_permission_fn(g)
+
+
+def test_plan_privileges():
+    tables = [f"node_{i}" for i in range(250)]
+    privileges = [
+        (pgadmin.GRANT_READ_PRIVS_BATCH_SQL, ["reader"]),
+        (pgadmin.GRANT_WRITE_PRIVS_BATCH_SQL, ["writer_1", "writer_2"]),
+    ]
+
+    plan = pgadmin.plan_privileges(privileges, tables, workers=2, batch_size=100)
+
+    # tables are split between transactions, each table granted once per privilege
+    assert len(plan) == 2
+    granted = [
+        table
+        for statements in plan
+        for statement in statements
+        if statement.startswith("GRANT SELECT ON")
+        for table in statement.split(" ON TABLE ")[1].split(" TO ")[0].split(", ")
+    ]
+    assert sorted(granted) == sorted(tables)
+    assert sum(len(statements) for statements in plan) == 8
+    assert plan[0][1].endswith("TO writer_1, writer_2;")
+
+    # users without privileges to apply get no statements
+    assert pgadmin.plan_privileges([(pgadmin.GRANT_READ_PRIVS_BATCH_SQL, [])], tables) == []
+
+
+def test_grant_dry_run(capsys, db_config, add_test_database_user):
+    dummy_user, dummy_pwd = add_test_database_user
+
+    g = psqlgraph.PsqlGraphDriver(
+        host=db_config["host"],
+        user=dummy_user,
+        password=dummy_pwd,
+        database=db_config["database"],
+    )
+
+    run_admin_command(["graph-grant", f"--read={dummy_user}", "--dry-run"])
+
+    assert f"TO {dummy_user};" in capsys.readouterr().out
+    invalid_read_access_fn(g)
+
+
+def test_create_plans_missing_tables_and_indexes(db_config):
+    admin = get_admin_driver(db_config)
+    run_admin_command(["graph-create", "--delay", "1", "--retries", "0"])
+
+    with admin.engine.connect() as connection:
+        assert pgadmin.plan_graph_schema(connection) == []
+
+    admin.engine.execute("DROP TABLE edge_clinicaldescribescase")
+    admin.engine.execute("DROP INDEX index_node_analyte_project_id")
+
+    with admin.engine.connect() as connection:
+        steps = pgadmin.plan_graph_schema(connection)
+
+    assert [step.name for step in steps] == [
+        "create table edge_clinicaldescribescase",
+        "create index index_node_analyte_project_id",
+    ]
+    assert not steps[0].concurrently
+    assert "CREATE INDEX CONCURRENTLY" in steps[1].statements[0]
+
+    run_admin_command(["graph-create", "--delay", "1", "--retries", "0"])
+
+    with admin.engine.connect() as connection:
+        assert pgadmin.plan_graph_schema(connection) == []
+
+
+def test_index_builds_missing_and_invalid_indexes(db_config):
+    admin = get_admin_driver(db_config)
+    run_admin_command(["graph-create", "--delay", "1", "--retries", "0"])
+
+    admin.engine.execute("DROP INDEX index_node_analyte_project_id")
+    admin.engine.execute(
+        "UPDATE pg_index SET indisvalid = false "
+        "WHERE indexrelid = 'index_node_datasubtype_name_lower'::regclass"
+    )
+
+    with admin.engine.connect() as connection:
+        steps = pgadmin.plan_graph_indexes(connection)
+
+    assert {step.name for step in steps} == {
+        "create index index_node_analyte_project_id",
+        "create index index_node_datasubtype_name_lower",
+    }
+    assert all(step.concurrently for step in steps)
+    assert {step.table for step in steps} == {"node_analyte", "node_datasubtype"}
+
+    run_admin_command(["graph-index", "--workers", "2", "--progress-interval", "1"])
+
+    with admin.engine.connect() as connection:
+        assert pgadmin.plan_graph_indexes(connection) == []
+        tables, indexes = pgadmin.get_schema(connection)
+    assert indexes["index_node_datasubtype_name_lower"] is True
@@ -1,8 +1,10 @@
 from test.conftest import BaseTestCase
 
 from psqlgraph import Node
+from sqlalchemy.exc import IntegrityError
 
 from gdcdatamodel import models as md
+from gdcdatamodel.models import caching
 
 
 class TestCacheRelatedCases(BaseTestCase):
@@ -240,3 +242,105 @@ class TestCacheRelatedCases(BaseTestCase):
             case = self.g.nodes(md.Case).one()
             assert case.created_datetime == old_created_datetime
             assert case.updated_datetime == old_updated_datetime
+
+
+class TestCacheRelatedCasesBatched(TestCacheRelatedCases):
+    """Run the cache tests with the flush level, batched cache updates"""
+
+    def setUp(self):
+        super().setUp()
+        self._batched = caching.BATCH_RELATED_CASES
+        caching.BATCH_RELATED_CASES = True
+
+    def tearDown(self):
+        caching.BATCH_RELATED_CASES = self._batched
+        super().tearDown()
+
+    def test_bulk_insert(self):
+        with self.g.session_scope() as s:
+            case = md.Case("case_id_1")
+            sample = md.Sample("sample_id_1")
+            sample.cases = [case]
+            for i in range(10):
+                portion = md.Portion(f"portion_id_{i}")
+                portion.samples = [sample]
+                portion.analytes = [md.Analyte(f"analyte_id_{i}")]
+            s.merge(case)
+
+        with self.g.session_scope():
+            nodes = self.g.nodes(Node).all()
+            nodes = [n for n in nodes if n.label not in ["case"]]
+            self.assertEqual(len(nodes), 21)
+            for node in nodes:
+                assert node._related_cases == [case]
+
+    def test_refresh_in_session(self):
+        """Loaded instances see the refreshed cache after the flush"""
+        with self.g.session_scope() as s:
+            case = s.merge(md.Case("case_id_1"))
+            sample = s.merge(md.Sample("sample_id_1"))
+            sample.cases = [case]
+            s.flush()
+            assert sample._related_cases == [case]
+
+    def test_failed_flush(self):
+        """Sources recorded by a failed flush are dropped on rollback"""
+        with self.g.session_scope() as s:
+            s.add(md.Sample("sample_id_1"))
+            s.add(md.SampleDerivedFromCase("sample_id_1", "missing_case_id"))
+            with self.assertRaises(IntegrityError):
+                s.flush()
+            s.rollback()
+            assert caching.PENDING_RELATED_CASES_KEY not in s.info
+
+
+class TestCacheRelatedCasesMetrics(BaseTestCase):
+    def test_metrics_callback(self):
+        flushes = []
+        with self.g.session_scope() as s:
+            caching.set_related_cases_metrics_callback(
+                lambda session, metrics: flushes.append(metrics), s
+            )
+            case = md.Case("case_id_1")
+            sample = md.Sample("sample_id_1")
+            sample.cases = [case]
+            sample.portions = [md.Portion("portion_id_1")]
+            s.merge(sample)
+            s.flush()
+
+            portion = self.g.nodes(md.Portion).one()
+            portion.samples = []
+
+        self.assertEqual(len(flushes), 2)
+        assert flushes[0]["hooks"] >= 2
+        assert flushes[0]["nodes_visited"] >= 2
+        assert flushes[0]["queries"] > 0
+        assert flushes[0]["seconds"] > 0
+        self.assertEqual(flushes[0]["deferred"], 0)
+
+    def test_defer_threshold(self):
+        with self.g.session_scope() as s:
+            sample = md.Sample("sample_id_1")
+            for i in range(3):
+                portion = md.Portion(f"portion_id_{i}")
+                portion.samples = [sample]
+            s.merge(sample)
+
+        with self.g.session_scope() as s:
+            caching.set_defer_related_cases_threshold(s, 1)
+            sample = self.g.nodes(md.Sample).one()
+            sample.cases = [md.Case("case_id_1")]
+
+        with self.g.session_scope() as s:
+            queued = s.query(caching.RelatedCasesQueue.node_id).all()
+            self.assertEqual(queued, [("sample_id_1",)])
+            assert not any(p._related_cases for p in self.g.nodes(md.Portion).all())
+
+            counts = caching.process_related_cases_queue(s)
+            self.assertEqual(counts["dequeued"], 1)
+            self.assertEqual(counts["inserted"], 3)
+
+        with self.g.session_scope() as s:
+            assert not s.query(caching.RelatedCasesQueue).count()
+            for portion in self.g.nodes(md.Portion).all():
+                assert [c.node_id for c in portion._related_cases] == ["case_id_1"]
@@ -52,3 +52,110 @@ def test_case_cache_related_edge_resolution():
     ns = models.caching.get_related_case_edge_cls(gdc.AlignedReads())
     class_name = f"{ns.__module__}.{ns.__name__}"
     assert "gdcdatamodel.models.gdc.AlignedReadsRelatesToCase" == class_name
+
+
+def test_compiled_spec_matches_loaded_classes():
+    """Tests the compiled spec resolves the same classes the factories built"""
+    from test.models import BasicDictionary
+
+    from gdcdatamodel.models import basic
+
+    spec = models.compile_dictionary(BasicDictionary)
+    for node_spec in spec["nodes"]:
+        cls = getattr(basic, node_spec["name"])
+        assert cls.__tablename__ == node_spec["tablename"]
+        assert set(cls._pg_links) == {link["name"] for link in node_spec["links"]}
+
+        for link in node_spec["links"]:
+            edge_cls = getattr(basic, link["edge_name"])
+            assert edge_cls.__tablename__ == link["edge_tablename"]
+
+
+def test_spec_cache_round_trip(tmpdir):
+    from test.models import BasicDictionary
+
+    cache_dir = str(tmpdir)
+    spec = models.get_dictionary_spec(BasicDictionary, "basic", cache_dir=cache_dir)
+
+    path = models.spec_cache.get_spec_path(cache_dir, "basic")
+    digest = models.spec_cache.dictionary_hash(BasicDictionary)
+    assert spec["hash"] == digest
+    assert models.spec_cache.read_spec(path, digest) == spec
+    assert models.get_dictionary_spec(BasicDictionary, "basic", cache_dir) == spec
+
+
+def test_spec_cache_discarded_on_dictionary_change(tmpdir):
+    from test.models import BasicDictionary
+
+    cache_dir = str(tmpdir)
+    models.get_dictionary_spec(BasicDictionary, "basic", cache_dir=cache_dir)
+    path = models.spec_cache.get_spec_path(cache_dir, "basic")
+
+    assert models.spec_cache.read_spec(path, "not the dictionary hash") is None
+    assert not tmpdir.join("basic.spec.json").exists()
+
+
+def test_lazy_loading():
+    """Tests classes are only built, with their edges and neighbours,
+    once they are accessed
+    """
+    from test.models import BasicDictionary
+
+    models.load_dictionary(BasicDictionary, "basic_lazy", lazy=True)
+    from gdcdatamodel.models import basic_lazy  # noqa
+
+    assert not basic_lazy.Node.__subclasses__()
+
+    sample = basic_lazy.Sample
+    assert sample.__tablename__ == "node_sample"
+    assert set(sample._pg_links) == {"cases"}
+    assert set(sample._pg_backrefs) == {"portions"}
+    assert {cls.get_label() for cls in basic_lazy.Node.__subclasses__()} == {
+        "sample",
+        "case",
+        "portion",
+    }
+
+    # neighbours are completed once accessed themselves
+    assert basic_lazy.Node.get_subclass("case") is basic_lazy.Case
+    assert set(basic_lazy.Case._pg_backrefs) == {"samples"}
+    assert basic_lazy.SampleDerivedFromCase.__dst_class__ == "Case"
+
+    # lookups on other bases are left to psqlgraph
+    assert models.Node.get_subclass("sample") is not sample
+
+    # listing the classes builds all of them
+    labels = {node["id"] for node in models.lazy_loaders["basic_lazy"].nodes}
+    assert {cls.get_label() for cls in basic_lazy.Node.get_subclasses()} == labels
+
+
+def test_startup_profile():
+    """Tests phases and generated classes are recorded when profiling"""
+    from test.models import BasicDictionary
+
+    profile = models.profiling.StartupProfile()
+    original, models.profiling.profile = models.profiling.profile, profile
+    profile.enable()
+    try:
+        models.load_dictionary(BasicDictionary, "basic_profiled")
+    finally:
+        profile.disable()
+        models.profiling.profile = original
+
+    report = profile.report()
+    phases = {phase["name"]: phase for phase in report["phases"]}
+    for name in [
+        "load_nodes",
+        "load_edges",
+        "inject_pg_backrefs",
+        "inject_pg_edges",
+        "configure_mappers",
+    ]:
+        assert phases[name]["calls"] == 1
+        assert phases[name]["parent"] is None
+    assert phases["cls_add_indexes"]["parent"] == "load_nodes"
+
+    classes = {(cls["kind"], cls["name"]) for cls in report["classes"]}
+    assert ("node", "Portion") in classes
+    assert ("edge", "PortionDerivedFromSample") in classes
+    assert "Portion" in models.profiling.format_report(report, limit=100)
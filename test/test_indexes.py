@@ -6,9 +6,26 @@ Test GDC specific index creation.
 
 """
 
+from psqlgraph import Node
+
+from gdcdatamodel import models  # noqa
+from gdcdatamodel.models.indexes import index_name
+
 
 def test_secondary_key_indexes(indexes):
     assert "index_node_datasubtype_name_lower" in indexes
     assert "index_node_analyte_project_id" in indexes
     assert "index_4df72441_famihist_submitte_id_lower" in indexes
     assert "transaction_logs_project_id_idx" in indexes
+
+
+def test_tag_indexes(indexes):
+    tag_indexes = {
+        index.name
+        for cls in Node.get_subclasses()
+        for index in cls.__table__.indexes
+        if index.name == index_name(cls, "tag")
+    }
+
+    assert tag_indexes
+    assert tag_indexes <= set(indexes)
@@ -0,0 +1,131 @@
+"""
+gdcdatamodel.test.test_node_ancestry
+----------------------------------
+
+Test maintaining and rebuilding the node ancestor closure table
+
+"""
+
+from test import helpers
+
+import pytest
+
+from gdcdatamodel import models as md
+from gdcdatamodel.models import ancestry
+from migrations import node_ancestors
+
+
+@pytest.fixture
+def ancestry_tree(g):
+    """Create a tree with the ancestor closure table maintained"""
+
+    case = md.Case("case")
+    case.samples = [md.Sample("sample1"), md.Sample("sample2")]
+    case.samples[0].portions = [md.Portion("portion1")]
+    case.samples[0].portions[0].analytes = [md.Analyte("analyte1")]
+    case.samples[0].portions[0].analytes[0].aliquots = [md.Aliquot("aliquot1")]
+
+    with g.session_scope() as session:
+        ancestry.enable_node_ancestry(session)
+        session.merge(case)
+
+    yield
+
+    helpers.truncate(g.engine)
+
+
+def get_rows(g):
+    with g.session_scope() as session:
+        return {
+            (row.descendant_id, row.ancestor_id, row.ancestor_label, row.depth): (
+                row.paths
+            )
+            for row in session.query(ancestry.NodeAncestor)
+        }
+
+
+def by_depth(query):
+    return sorted(query, key=lambda row: row.depth)
+
+
+def test_node_ancestry_on_insert(g, ancestry_tree):
+    """Verify inserted edges add the paths through them"""
+
+    with g.session_scope() as session:
+        assert by_depth(ancestry.ancestors(session, ["aliquot1"])) == [
+            ("aliquot1", "analyte1", 1),
+            ("aliquot1", "portion1", 2),
+            ("aliquot1", "sample1", 3),
+            ("aliquot1", "case", 4),
+        ]
+        assert ancestry.ancestors(session, ["aliquot1"], label="case").all() == [
+            ("aliquot1", "case", 4)
+        ]
+        assert {
+            row.descendant_id for row in ancestry.descendants(session, ["case"])
+        } == {
+            "sample1",
+            "sample2",
+            "portion1",
+            "analyte1",
+            "aliquot1",
+        }
+
+
+def test_node_ancestry_on_delete(g, ancestry_tree):
+    """Verify deleted edges remove the paths through them, and only those"""
+
+    with g.session_scope() as session:
+        ancestry.enable_node_ancestry(session)
+        portion = g.nodes(md.Portion).get("portion1")
+        portion.samples = []
+
+    with g.session_scope() as session:
+        assert not ancestry.ancestors(session, ["portion1"]).all()
+        assert by_depth(ancestry.ancestors(session, ["aliquot1"])) == [
+            ("aliquot1", "analyte1", 1),
+            ("aliquot1", "portion1", 2),
+        ]
+        assert ancestry.ancestors(session, ["sample1"]).all() == [
+            ("sample1", "case", 1)
+        ]
+
+
+def test_node_ancestry_paths(g, ancestry_tree):
+    """Verify a node reached on two paths keeps the rows of the other
+    when one is removed
+
+    """
+
+    with g.session_scope() as session:
+        ancestry.enable_node_ancestry(session)
+        aliquot = g.nodes(md.Aliquot).get("aliquot1")
+        aliquot.samples = [g.nodes(md.Sample).get("sample2")]
+
+    rows = get_rows(g)
+    assert rows[("aliquot1", "case", "case", 2)] == 1
+    assert rows[("aliquot1", "case", "case", 4)] == 1
+
+    with g.session_scope() as session:
+        ancestry.enable_node_ancestry(session)
+        analyte = g.nodes(md.Analyte).get("analyte1")
+        analyte.portions = []
+
+    with g.session_scope() as session:
+        assert ancestry.ancestors(session, ["aliquot1"], label="case").all() == [
+            ("aliquot1", "case", 2)
+        ]
+
+
+def test_rebuild_node_ancestors(g, ancestry_tree):
+    """Verify rebuilding the table gives the incrementally maintained rows"""
+
+    expected = get_rows(g)
+
+    with g.session_scope() as session:
+        session.query(ancestry.NodeAncestor).delete()
+
+    for label in ["sample", "portion", "analyte", "aliquot"]:
+        node_ancestors.build_cls_ancestors(g, label)
+
+    assert get_rows(g) == expected
@@ -3,6 +3,7 @@ from test import helpers
 
 import pytest
 from psqlgraph import PsqlGraphDriver
+from sqlalchemy.exc import IntegrityError
 
 from gdcdatamodel.models import basic, versioning  # noqa
 
@@ -101,3 +102,67 @@ def test_1(create_samples, bg, node_id, tag, version):
         assert node.tag == tag
         assert node.ver == version
         assert versioning.compute_tag(node) == node.tag
+
+
+def test_batched_tagging(create_samples, bg):
+    """Nodes versioned once per flush get the same versions as when
+    versioned one at a time
+    """
+
+    node_ids = ["batched-program-1", "batched-program-2"]
+    with bg.session_scope() as s:
+        versioning.enable_batched_tagging(s)
+        for node_id in node_ids:
+            s.add(basic.Program(node_id=node_id, name="GDC"))
+
+    try:
+        with bg.session_scope():
+            nodes = bg.nodes(basic.Program).props(name="GDC").all()
+            versions = {node.node_id: (node.ver, node.is_latest) for node in nodes}
+            assert {node.tag for node in nodes} == {
+                "fddc5826-8853-5c1a-847d-5850d58ccb3e"
+            }
+    finally:
+        with bg.session_scope():
+            for node_id in node_ids:
+                bg.node_delete(node_id)
+
+    assert versions == {
+        "ed9aa864-1e40-4657-9378-7e3dc26551cc": (1, False),
+        "batched-program-1": (2, False),
+        "batched-program-2": (3, True),
+    }
+
+
+def test_batched_tagging_after_failed_flush(create_samples, bg):
+    """Nodes left pending by a failed flush are not versioned by the
+    next flush of the session
+    """
+
+    link = basic.Portion._pg_links["centers"]
+    edge_cls = getattr(basic.Portion, link["edge_out"]).property.mapper.class_
+
+    with bg.session_scope() as s:
+        versioning.enable_batched_tagging(s)
+        # shares the tag of center fb69d25b, the edge insert fails after it
+        s.add(basic.Center(node_id="failed-center", code="T1"))
+        s.add(
+            edge_cls(
+                src_id="6974c692-be47-4cb8-b8d6-9bd815983cd9",
+                dst_id="missing-center",
+            )
+        )
+        with pytest.raises(IntegrityError):
+            s.flush()
+        s.rollback()
+
+        s.add(basic.Program(node_id="retried-program", name="retried"))
+
+    try:
+        with bg.session_scope():
+            center = bg.nodes().get("fb69d25b-5c5d-4879-8955-8f2126e57524")
+            assert (center.ver, center.is_latest) == (1, True)
+            assert bg.nodes().get("retried-program").ver == 1
+    finally:
+        with bg.session_scope():
+            bg.node_delete("retried-program")
@@ -0,0 +1,157 @@
+"""
+gdcdatamodel.test.test_query
+----------------------------------
+
+Test the traversal table used by union_subq_path
+
+"""
+
+import os
+import threading
+from test import helpers
+
+import pytest
+from psqlgraph import PsqlGraphDriver
+
+from gdcdatamodel import query
+from gdcdatamodel.models import basic
+
+ADJACENCY = {
+    "case": [("samples", "sample"), ("files", "file"), ("_related_files", "file")],
+    "sample": [("cases", "case"), ("aliquots", "aliquot")],
+    "aliquot": [("samples", "sample"), ("files", "file"), ("_related_cases", "case")],
+    "file": [("cases", "case"), ("aliquots", "aliquot")],
+}
+
+
+def test_construct_traversals():
+    assert query.construct_traversals(ADJACENCY, "aliquot") == {
+        "aliquot": {""},
+        "sample": {"samples"},
+        "case": {"samples.cases", "_related_cases"},
+        "file": {"files", "samples.cases.files", "samples.cases._related_files"},
+    }
+
+    # terminal nodes are only left when they are the root
+    assert query.construct_traversals(ADJACENCY, "file") == {
+        "file": {""},
+        "case": {"cases", "aliquots.samples.cases", "aliquots._related_cases"},
+        "sample": {"cases.samples", "aliquots.samples"},
+        "aliquot": {"aliquots", "cases.samples.aliquots"},
+    }
+
+
+def test_traversal_cache_roundtrip(tmpdir):
+    table = {label: query.construct_traversals(ADJACENCY, label) for label in ADJACENCY}
+    digest = query.adjacency_hash(ADJACENCY)
+    path = query.get_traversal_path(str(tmpdir), "ns")
+
+    query.write_traversals(path, digest, table)
+    assert query.read_traversals(path, digest) == table
+
+    assert query.read_traversals(path, "stale") is None
+    assert not tmpdir.join("ns.traversals.json").exists()
+
+
+def test_get_traversals_builds_once(monkeypatch):
+    calls = []
+
+    def load_traversals(package_namespace=None):
+        calls.append(package_namespace)
+        return {"case": {"case": {""}}}
+
+    monkeypatch.setattr(query, "load_traversals", load_traversals)
+    monkeypatch.setitem(query.namespace_traversals, "test_query", {})
+
+    threads = [
+        threading.Thread(target=query.get_traversals, args=("test_query",))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == ["test_query"]
+    assert query.get_traversals("test_query") == {"case": {"case": {""}}}
+
+
+def test_plan_related_cases_shortcut():
+    plan = query.plan_union_subq_path(basic.Portion, "case", 0, "basic")
+    assert plan.paths == {"_related_cases"}
+    assert plan.cost == 1
+    assert plan.naive_cost == 5
+
+    plan = query.plan_union_subq_path(basic.Portion, "project", 0, "basic")
+    assert plan.paths == {"_related_cases.projects"}
+    assert plan.cost < plan.naive_cost
+
+
+def test_plan_keeps_filtered_lineage():
+    # the third filter applies to the sample the shortcut skips
+    plan = query.plan_union_subq_path(basic.Portion, "project", 3, "basic")
+    assert plan.paths == {"samples.cases.projects"}
+    assert set(plan.tries) == {3}
+
+
+def test_plan_over_budget(bg):
+    with bg.session_scope():
+        with pytest.raises(ValueError):
+            query.union_subq_path(
+                bg.nodes(basic.Portion),
+                "project",
+                package_namespace="basic",
+                max_cost=1,
+                plan=True,
+            )
+
+
+@pytest.fixture(scope="module")
+def bg():
+    """Fixture for database driver"""
+
+    cfg = {
+        "host": os.getenv("PG_HOST", "localhost"),
+        "user": os.getenv("PG_USER", "test"),
+        "password": os.getenv("PG_PASS", "test"),
+        "database": "dev_models",
+        "package_namespace": "basic",
+    }
+
+    g = PsqlGraphDriver(**cfg)
+    helpers.create_tables(g.engine, namespace="basic")
+    yield g
+    helpers.truncate(g.engine, namespace="basic")
+
+
+@pytest.mark.parametrize(
+    "src, dst, post_filters",
+    [
+        (basic.Portion, "case", []),
+        (basic.Portion, "project", []),
+        (basic.Portion, "program", [lambda q: q.props(name="GDC")]),
+        (basic.Sample, "project", [lambda q: q.props(code="MISC")]),
+        (basic.Portion, "project", [lambda q: q.props(code="MISC"), None, None]),
+        (basic.Project, "portion", []),
+        (basic.Case, "case", []),
+    ],
+)
+def test_planned_union_subq_path(bg, sample_data, src, dst, post_filters):
+    with bg.session_scope() as s:
+        for node in sample_data:
+            s.merge(node)
+
+    with bg.session_scope():
+        expected = {
+            node.node_id
+            for node in query.union_subq_path(bg.nodes(src), dst, post_filters, "basic")
+        }
+        planned = {
+            node.node_id
+            for node in query.union_subq_path(
+                bg.nodes(src), dst, post_filters, "basic", plan=True
+            )
+        }
+
+    assert expected
+    assert planned == expected
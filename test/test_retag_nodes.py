@@ -0,0 +1,132 @@
+"""
+gdcdatamodel.test.test_retag_nodes
+----------------------------------
+
+Test offline retagging of node tables
+
+"""
+
+import os
+from test import helpers
+
+import pytest
+from psqlgraph import Node, PsqlGraphDriver
+from sqlalchemy import text
+
+from gdcdatamodel.models import basic, versioning  # noqa
+from migrations import retag_nodes
+
+TAG_KEYS = (
+    versioning.TagKeys.tag,
+    versioning.TagKeys.version,
+    versioning.TagKeys.latest,
+)
+
+
+@pytest.fixture(scope="module")
+def bg():
+    """Fixture for database driver"""
+
+    cfg = {
+        "host": os.getenv("PG_HOST", "localhost"),
+        "user": os.getenv("PG_USER", "test"),
+        "password": os.getenv("PG_PASS", "test"),
+        "database": "dev_models",
+        "package_namespace": "basic",
+    }
+
+    g = PsqlGraphDriver(**cfg)
+    helpers.create_tables(g.engine, namespace="basic")
+    yield g
+    helpers.truncate(g.engine, namespace="basic")
+
+
+@pytest.fixture
+def create_samples(sample_data, bg):
+    with bg.session_scope() as s:
+        version_2s = []
+        for node in sample_data:
+            # delay adding version 2
+            if node.node_id in [
+                "a2b2d27a-6523-4ddd-8b2e-e94437a2aa23",
+                "5ffb4b0e-969e-4643-8187-536ce7130e9c",
+            ]:
+                version_2s.append(node)
+                continue
+            s.add(node)
+        s.commit()
+        for v2 in version_2s:
+            s.add(v2)
+    yield
+
+    with bg.session_scope():
+        for n in sample_data:
+            bg.node_delete(n.node_id)
+
+
+def test_levels_tag_parents_first():
+    classes = [cls for cls in Node.get_subclasses() if retag_nodes.is_taggable_cls(cls)]
+    levels = retag_nodes.get_levels(classes)
+
+    assert {cls for level in levels for cls in level} == set(classes)
+
+    seen = set()
+    for level in levels[:-1]:
+        for cls in level:
+            for _, parent in retag_nodes.get_tag_links(cls):
+                assert parent is cls or parent in seen
+        seen.update(level)
+
+
+def test_checkpoint_resume(tmpdir):
+    checkpoint = retag_nodes.Checkpoint(str(tmpdir), "aliquot")
+    assert checkpoint.state == {"stage": "tags", "last_id": "", "last_tag": ""}
+
+    checkpoint.save(last_id="a")
+    checkpoint.save(stage="versions")
+
+    resumed = retag_nodes.Checkpoint(str(tmpdir), "aliquot")
+    assert resumed.state == {"stage": "versions", "last_id": "a", "last_tag": ""}
+
+
+def test_retag_matches_insert_hooks(create_samples, bg):
+    """Nodes retagged offline get the tag, version and latest flag the
+    insert hooks gave them
+    """
+
+    classes = [
+        cls for cls in basic.Node.get_subclasses() if retag_nodes.is_taggable_cls(cls)
+    ]
+
+    with bg.session_scope():
+        expected = {}
+        for node in bg.nodes().all():
+            expected[node.node_id] = tuple(node._sysan.get(key) for key in TAG_KEYS)
+            if node.tag:
+                assert versioning.compute_tag(node) == node.tag
+
+    assert any(tag for tag, _, _ in expected.values())
+
+    with bg.session_scope() as s:
+        for cls in classes:
+            s.execute(
+                text(
+                    "UPDATE {} SET _sysan = _sysan - :tag - :ver - :latest".format(
+                        cls.__tablename__
+                    )
+                ),
+                dict(zip(["tag", "ver", "latest"], TAG_KEYS)),
+            )
+
+    # a small chunk size so that both stages span several chunks
+    for level in retag_nodes.get_levels(classes):
+        for cls in level:
+            retag_nodes.retag_cls(bg, cls, chunk_size=2)
+
+    with bg.session_scope():
+        retagged = {
+            node.node_id: tuple(node._sysan.get(key) for key in TAG_KEYS)
+            for node in bg.nodes().all()
+        }
+
+    assert retagged == expected
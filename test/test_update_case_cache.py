@@ -9,7 +9,8 @@ Test functionality to update stale case caches
 import pytest
 
 from gdcdatamodel import models as md
-from migrations import update_case_cache
+from gdcdatamodel.models import caching
+from migrations import audit_case_cache, update_case_cache
 
 
 @pytest.fixture
@@ -62,3 +63,196 @@ def test_update_case_cache(g, case_tree_no_cache):
 
         for node in nodes:
             assert node._related_cases
+
+
+def test_refresh_related_case_trees(g, case_tree_no_cache):
+    """Verify refreshing from a root recomputes its whole tree at once"""
+
+    with g.session_scope() as session:
+        session.add(md.Case("stale_case"))
+        session.flush()
+        session.execute(
+            md.SampleRelatesToCase.__table__.insert().values(
+                src_id="sample2", dst_id="stale_case", _props={}, _sysan={}, acl=[]
+            )
+        )
+
+    with g.session_scope() as session:
+        counts = caching.refresh_related_case_trees(session, ["sample2"], dry_run=True)
+        assert counts == {"nodes": 1, "inserted": 1, "deleted": 1}
+
+        counts = caching.refresh_related_case_trees(session, ["case"])
+        assert counts == {"nodes": 9, "inserted": 8, "deleted": 1}
+
+        counts = caching.refresh_related_case_trees(session, ["case", "sample1"])
+        assert counts == {"nodes": 9, "inserted": 0, "deleted": 0}
+
+    with g.session_scope():
+        sample = g.nodes(md.Sample).get("sample2")
+        assert [case.node_id for case in sample._related_cases] == ["case"]
+        aliquot = g.nodes(md.Aliquot).get("aliquot1")
+        assert [case.node_id for case in aliquot._related_cases] == ["case"]
+
+
+def test_reconcile_related_cases_dry_run(g, case_tree_no_cache):
+    """Verify a dry run counts missing cache edges without inserting"""
+
+    with g.session_scope() as session:
+        diff = caching.reconcile_related_cases(session, dry_run=True)
+
+    assert diff == {
+        "sample": {"missing": 2, "stale": 0},
+        "portion": {"missing": 2, "stale": 0},
+        "analyte": {"missing": 2, "stale": 0},
+        "aliquot": {"missing": 2, "stale": 0},
+    }
+
+    with g.session_scope():
+        assert not g.nodes(md.AliquotRelatesToCase).count()
+
+
+def test_reconcile_related_cases(g, case_tree_no_cache):
+    """Verify reconciling inserts missing and deletes stale cache edges"""
+
+    with g.session_scope() as session:
+        session.add(md.Case("stale_case"))
+        session.flush()
+        session.execute(
+            md.SampleRelatesToCase.__table__.insert().values(
+                src_id="sample2", dst_id="stale_case", _props={}, _sysan={}, acl=[]
+            )
+        )
+
+    with g.session_scope() as session:
+        diff = caching.reconcile_related_cases(session, node_ids=["sample2"])
+
+    assert diff == {"sample": {"missing": 1, "stale": 1}}
+
+    with g.session_scope() as session:
+        assert caching.reconcile_related_cases(session, dry_run=True) == {
+            "portion": {"missing": 2, "stale": 0},
+            "analyte": {"missing": 2, "stale": 0},
+            "aliquot": {"missing": 2, "stale": 0},
+            "sample": {"missing": 1, "stale": 0},
+        }
+
+        caching.reconcile_related_cases(session)
+        assert not caching.reconcile_related_cases(session, dry_run=True)
+
+    with g.session_scope():
+        sample = g.nodes(md.Sample).get("sample2")
+        assert [case.node_id for case in sample._related_cases] == ["case"]
+        aliquot = g.nodes(md.Aliquot).get("aliquot1")
+        assert [case.node_id for case in aliquot._related_cases] == ["case"]
+
+
+def test_reconcile_related_cases_in_session(g, case_tree_no_cache):
+    """Verify reconciling flushes pending changes first, and refreshes the
+    loaded shortcut edges without discarding other loaded state
+
+    """
+
+    with g.session_scope() as session:
+        sample = g.nodes(md.Sample).get("sample2")
+        assert not sample._related_cases
+        sample.submitter_id = "reconciled"
+
+        diff = caching.reconcile_related_cases(session, node_ids=["sample2"])
+        assert diff == {"sample": {"missing": 1, "stale": 0}}
+        assert [case.node_id for case in sample._related_cases] == ["case"]
+        assert sample.submitter_id == "reconciled"
+
+    with g.session_scope():
+        sample = g.nodes(md.Sample).get("sample2")
+        assert sample.submitter_id == "reconciled"
+
+
+def test_audit_related_cases(g, case_tree_no_cache, tmpdir):
+    """Verify the audit lists missing and extra cache edges, and that the
+    diff can be repaired in batches from its report
+
+    """
+
+    with g.session_scope() as session:
+        session.add(md.Case("stale_case"))
+        session.flush()
+        session.execute(
+            md.SampleRelatesToCase.__table__.insert().values(
+                src_id="sample2", dst_id="stale_case", _props={}, _sysan={}, acl=[]
+            )
+        )
+
+    with g.session_scope() as session:
+        diff = caching.audit_related_cases(session, labels=["sample", "aliquot"])
+
+    assert diff == {
+        "sample": {
+            "missing": [("sample1", "case"), ("sample2", "case")],
+            "extra": [("sample2", "stale_case")],
+        },
+        "aliquot": {
+            "missing": [("aliquot1", "case"), ("alituoq2", "case")],
+            "extra": [],
+        },
+    }
+
+    path = str(tmpdir.join("report.json"))
+    audit_case_cache.write_report(path, diff)
+    assert audit_case_cache.read_report(path) == diff
+
+    assert audit_case_cache.repair(g, diff, batch_size=1) == (4, 1)
+    assert audit_case_cache.repair(g, diff, batch_size=1) == (0, 0)
+
+    with g.session_scope() as session:
+        assert not caching.audit_related_cases(session, labels=["sample", "aliquot"])
+        sample = g.nodes(md.Sample).get("sample2")
+        assert [case.node_id for case in sample._related_cases] == ["case"]
+
+
+def test_repair_related_cases_stale_report(g, case_tree_no_cache):
+    """Verify repairing from a stale report only applies the edges that
+    are still missing or extra
+
+    """
+
+    with g.session_scope() as session:
+        session.add(md.Case("other_case"))
+        session.flush()
+        session.execute(
+            md.SampleRelatesToCase.__table__.insert().values(
+                src_id="sample2", dst_id="other_case", _props={}, _sysan={}, acl=[]
+            )
+        )
+
+    with g.session_scope() as session:
+        diff = caching.audit_related_cases(session, labels=["sample"])
+    assert ("sample2", "other_case") in diff["sample"]["extra"]
+
+    # sample2 is linked to other_case since the audit, and the report
+    # also lists an edge of a node that does not exist (anymore)
+    with g.session_scope() as session:
+        session.execute(
+            md.SampleDerivedFromCase.__table__.insert().values(
+                src_id="sample2", dst_id="other_case", _props={}, _sysan={}, acl=[]
+            )
+        )
+    diff["sample"]["missing"].append(("deleted_sample", "case"))
+
+    assert audit_case_cache.repair(g, diff) == (2, 0)
+
+    with g.session_scope() as session:
+        sample = g.nodes(md.Sample).get("sample2")
+        assert sorted(case.node_id for case in sample._related_cases) == [
+            "case",
+            "other_case",
+        ]
+        assert not caching.audit_related_cases(session, labels=["sample"])
+
+
+def test_audit_related_cases_sample(g, case_tree_no_cache):
+    """Verify a full sample audits every node and an empty one none"""
+
+    with g.session_scope() as session:
+        diff = caching.audit_related_cases(session, labels=["portion"], sample=100)
+        assert len(diff["portion"]["missing"]) == 2
+        assert not caching.audit_related_cases(session, labels=["portion"], sample=0)
@@ -4,6 +4,11 @@ from test.conftest import BaseTestCase
 
 from gdcdatamodel.models import *
 from gdcdatamodel.validators import GDCGraphValidator, GDCJSONValidator
+from gdcdatamodel.validators.graph_validators import (
+    GDCLinksValidator,
+    GDCUniqueKeysValidator,
+)
+from gdcdatamodel.validators.plans import LinkGroup, LinkRule, compile_plan
 
 
 class MockSubmissionEntity:
@@ -84,6 +89,17 @@ class TestValidators(BaseTestCase):
         self.assertEqual(2, len(self.entities[0].errors))
         self.assertEqual(0, len(entity.errors))
 
+    def test_json_validator_reused_per_type(self):
+        validator = self.json_validator.get_validator("aliquot")
+        self.test_json_validator_with_multiple_entities()
+        self.assertIs(validator, self.json_validator.get_validator("aliquot"))
+
+    def test_json_validator_prewarm(self):
+        json_validator = GDCJSONValidator(prewarm=True)
+        self.assertEqual(
+            set(json_validator.validators), set(json_validator.schemas.schema)
+        )
+
     def test_json_validator_with_array_prop(self):
         entity_doc = {
             "type": "diagnosis",
@@ -398,3 +414,167 @@ class TestValidators(BaseTestCase):
                     for e in self.entities[0].errors
                 )
             )
+
+    def test_unique_keys_validator_batched_matches_serial(self):
+        with self.g.session_scope() as session:
+            for name in ["test", "test", "other"]:
+                node = self.create_node(
+                    {"type": "data_format", "props": {"name": name}, "edges": {}},
+                    session,
+                )
+                entity = MockSubmissionEntity()
+                entity.node = node
+                self.entities.append(entity)
+            self.entities.pop(0)
+            self.update_schema("data_format", "uniqueKeys", [["name"]])
+
+            GDCUniqueKeysValidator(batched=True).validate(self.entities, self.g)
+            batched = [entity.errors for entity in self.entities]
+            for entity in self.entities:
+                entity.errors = []
+            GDCUniqueKeysValidator(batched=False).validate(self.entities, self.g)
+            serial = [entity.errors for entity in self.entities]
+
+            self.assertEqual(batched, serial)
+            self.assertEqual([1, 1, 0], [len(errors) for errors in batched])
+
+    def test_links_validator_prefetch_matches_lazy_loading(self):
+        with self.g.session_scope() as session:
+            analytes = [
+                self.create_node(
+                    {
+                        "type": "analyte",
+                        "props": {
+                            "submitter_id": submitter_id,
+                            "analyte_type_id": "D",
+                            "analyte_type": "DNA",
+                        },
+                        "edges": {},
+                    },
+                    session,
+                )
+                for submitter_id in ["test", "testb"]
+            ]
+            self.entities = []
+            for edges in [[analytes[0].node_id], [a.node_id for a in analytes], []]:
+                entity = MockSubmissionEntity()
+                entity.node = self.create_node(
+                    {
+                        "type": "aliquot",
+                        "props": {"submitter_id": "test"},
+                        "edges": {"analytes": edges},
+                    },
+                    session,
+                )
+                self.entities.append(entity)
+            self.update_schema(
+                "aliquot",
+                "links",
+                [
+                    {
+                        "name": "analytes",
+                        "backref": "aliquots",
+                        "label": "derived_from",
+                        "multiplicity": "one_to_one",
+                        "target_type": "analyte",
+                        "required": True,
+                    }
+                ],
+            )
+
+            GDCLinksValidator(prefetch=True).validate(self.entities, self.g)
+            prefetched = [entity.errors for entity in self.entities]
+            for entity in self.entities:
+                entity.errors = []
+            GDCLinksValidator(prefetch=False).validate(self.entities, self.g)
+            lazy = [entity.errors for entity in self.entities]
+
+            self.assertEqual(prefetched, lazy)
+            self.assertEqual([1, 2, 1], [len(errors) for errors in prefetched])
+
+    def test_graph_validator_batched_matches_unbatched(self):
+        with self.g.session_scope() as session:
+            analyte = self.create_node(
+                {
+                    "type": "analyte",
+                    "props": {
+                        "submitter_id": "test",
+                        "analyte_type_id": "D",
+                        "analyte_type": "DNA",
+                    },
+                    "edges": {},
+                },
+                session,
+            )
+            self.entities = []
+            for doc in [
+                {"type": "aliquot", "props": {"submitter_id": "a"}, "edges": {}},
+                {"type": "data_format", "props": {"name": "test"}, "edges": {}},
+                {
+                    "type": "aliquot",
+                    "props": {"submitter_id": "b"},
+                    "edges": {"analytes": [analyte.node_id]},
+                },
+                {"type": "data_format", "props": {"name": "test"}, "edges": {}},
+            ]:
+                entity = MockSubmissionEntity()
+                entity.node = self.create_node(doc, session)
+                self.entities.append(entity)
+            self.update_schema("data_format", "uniqueKeys", [["name"]])
+
+            GDCGraphValidator().record_errors(self.g, self.entities)
+            batched = [entity.errors for entity in self.entities]
+            for entity in self.entities:
+                entity.errors = []
+            validator = GDCGraphValidator()
+            validator.required_validators = {
+                "links_validator": GDCLinksValidator(prefetch=False),
+                "uniqueKeys_validator": GDCUniqueKeysValidator(batched=False),
+            }
+            validator.record_errors(self.g, self.entities)
+            unbatched = [entity.errors for entity in self.entities]
+
+            self.assertEqual(batched, unbatched)
+            self.assertTrue(all(batched))
+
+
+def test_compile_validation_plan():
+    plan = compile_plan(
+        {
+            "links": [
+                {
+                    "name": "cases",
+                    "backref": "samples",
+                    "multiplicity": "many_to_one",
+                    "required": True,
+                },
+                {
+                    "exclusive": True,
+                    "required": True,
+                    "subgroup": [
+                        {"name": "analytes", "multiplicity": "many_to_one"},
+                        {"subgroup": [{"name": "samples", "backref": "aliquots"}]},
+                    ],
+                },
+            ],
+            "properties": {
+                "id": {"systemAlias": "node_id"},
+                "submitter_id": {"type": "string"},
+                "project_id": {"type": "string"},
+            },
+            "uniqueKeys": [["id"], ["project_id", "submitter_id"]],
+        }
+    )
+
+    assert plan.links == (
+        LinkRule("cases", "many_to_one", "samples", True),
+        LinkGroup(
+            links=(
+                LinkRule("analytes", "many_to_one", None, False),
+                LinkRule("samples", None, "aliquots", False),
+            ),
+            required=True,
+            exclusive=True,
+        ),
+    )
+    assert plan.unique_keys == (("project_id", "submitter_id"),)
@@ -1,6 +1,9 @@
 from test.conftest import BaseTestCase
 
+from psqlgraph import Node
+
 from gdcdatamodel import models as md
+from gdcdatamodel.models import versioned_nodes
 
 
 class TestValidators(BaseTestCase):
@@ -79,3 +82,60 @@ class TestValidators(BaseTestCase):
 
         with self.g.session_scope() as s:
             portion.get_versions(s).one()
+
+    def test_snapshot_nodes(self):
+        """Verify the bulk snapshot creates the rows clone would"""
+
+        columns = [
+            "label",
+            "node_id",
+            "project_id",
+            "created",
+            "acl",
+            "system_annotations",
+            "properties",
+            "gdc_versions",
+        ]
+
+        def get_rows():
+            with self.g.session_scope() as session:
+                rows = session.query(md.VersionedNode).all()
+                session.query(md.VersionedNode).delete()
+                return sorted(
+                    tuple(getattr(row, c) for c in columns) + (sorted(row.neighbors),)
+                    for row in rows
+                )
+
+        with self.g.session_scope() as session:
+            portion = self.new_portion()
+            portion.analytes = [self.new_analyte()]
+            session.add(portion)
+
+        with self.g.session_scope() as session:
+            for node in self.g.nodes(md.Portion).all() + self.g.nodes(md.Analyte).all():
+                v_node = md.VersionedNode.clone(node)
+                v_node.gdc_versions = ["1.0"]
+                session.add(v_node)
+
+        expected = get_rows()
+
+        with self.g.session_scope() as session:
+            query = self.g.nodes(md.Portion).props(submitter_id="PORTION-1")
+            self.assertEqual(
+                versioned_nodes.snapshot_nodes(
+                    session, md.Portion, query=query, gdc_versions=["1.0"]
+                ),
+                1,
+            )
+            self.assertEqual(
+                versioned_nodes.snapshot_nodes(
+                    session, md.Analyte, project_id="CGCI-BLGSP", gdc_versions=["1.0"]
+                ),
+                1,
+            )
+
+        self.assertEqual(get_rows(), expected)
+
+        with self.g.session_scope() as session:
+            counts = versioned_nodes.snapshot_project(session, Node, "CGCI-BLGSP")
+        self.assertEqual(counts, {"portion": 1, "analyte": 1})
@@ -48,7 +48,6 @@ def test_multi_parent(sample_data):
     portion.samples.append(sample)
     portion.centers.append(center)
 
-    v.compute_tag.cache_clear()
     v_tag = v.compute_tag(portion)
     assert v_tag == "a9a67fae-d916-5843-bdf3-b7db0b7a82a2"
 
@@ -56,18 +55,27 @@ def test_multi_parent(sample_data):
     portion.samples = []
     portion.centers = []
 
-    v.compute_tag.cache_clear()
     v_tag = v.compute_tag(portion)
     assert v_tag == "5776f97a-a58b-5900-83da-43cbc7105796"
 
     portion.centers.append(center)
     portion.samples.append(sample)
 
-    v.compute_tag.cache_clear()
     v_tag = v.compute_tag(portion)
     assert v_tag == "a9a67fae-d916-5843-bdf3-b7db0b7a82a2"
 
 
+def test_transient_tags_not_cached(sample_data):
+    """Test a transient node is retagged after its parents change"""
+
+    portion = basic.Portion(node_id="A103", submitter_id="portion_2")
+    tag = v.compute_tag(portion)
+
+    sample = next(node for node in sample_data if node.label == "sample")
+    portion.samples.append(sample)
+    assert v.compute_tag(portion) != tag
+
+
 @pytest.mark.parametrize(
     "node, is_taggable",
     [
@@ -77,3 +85,38 @@ def test_multi_parent(sample_data):
 )
 def test_node_is_taggable(node, is_taggable):
     assert node.is_taggable() is is_taggable
+
+
+def test_tag_cache_keyed_on_property_values():
+    """Test an edited property is not answered with the cached tag"""
+
+    cache = v.TagCache()
+    portion = basic.Portion(node_id="A102", submitter_id="portion_3")
+
+    tag = v.compute_tag(portion, cache)
+    assert v.compute_tag(portion, cache) == tag
+    assert cache.info() == v.TagCacheInfo(
+        hits=1, misses=1, maxsize=cache.maxsize, currsize=1
+    )
+
+    portion.submitter_id = "portion_4"
+    assert v.compute_tag(portion, cache) != tag
+    assert cache.info().misses == 2
+
+
+def test_tag_cache_bounded():
+    """Test the least recently used tags are dropped and can be evicted"""
+
+    cache = v.TagCache(maxsize=2)
+    portions = [
+        basic.Portion(node_id=f"A2{i}", submitter_id=f"portion_{i}") for i in range(3)
+    ]
+    for portion in portions:
+        v.compute_tag(portion, cache)
+
+    assert cache.info().currsize == 2
+    assert cache.get(cache.key(portions[0])) is None
+
+    cache.evict([portions[1].node_id])
+    assert cache.get(cache.key(portions[1])) is None
+    assert cache.get(cache.key(portions[2])) is not None